@@ -0,0 +1,108 @@
+"""
+@file bench_multicast.py
+@brief Benchmark: Sendezeit einer Broadcast-Nachricht in Abhängigkeit der Raumgröße.
+
+Vergleicht den TCP-Pfad (send_broadcast_message, eine Verbindung pro
+Teilnehmer) mit dem Multicast-Pfad (ein Datagramm für alle). Die Teilnehmer
+sind lokale TCP-Listener, die eingehende Verbindungen annehmen und leeren.
+
+Aufruf: python bench_multicast.py [gruppe] [port]
+"""
+
+import selectors
+import socket
+import sys
+import threading
+import time
+
+from netzwerk import send_broadcast_message
+from multicast import MulticastKanal
+
+RAUMGROESSEN = (1, 5, 10, 25, 50, 100, 200)
+WIEDERHOLUNGEN = 5
+
+
+def starte_listener(anzahl: int) -> list:
+    """
+    Startet anzahl lokale TCP-Listener in einem Selector-Thread.
+
+    Returns:
+        Liste von (ip, port)
+    """
+    sel = selectors.DefaultSelector()
+    adressen = []
+    for _ in range(anzahl):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.bind(("127.0.0.1", 0))
+        s.listen(128)
+        s.setblocking(False)
+        sel.register(s, selectors.EVENT_READ, "listen")
+        adressen.append(s.getsockname())
+
+    def loop():
+        while True:
+            for key, _ in sel.select():
+                if key.data == "listen":
+                    conn, _ = key.fileobj.accept()
+                    conn.setblocking(False)
+                    sel.register(conn, selectors.EVENT_READ, "conn")
+                else:
+                    try:
+                        daten = key.fileobj.recv(65536)
+                    except OSError:
+                        daten = b""
+                    if not daten:
+                        sel.unregister(key.fileobj)
+                        key.fileobj.close()
+
+    threading.Thread(target=loop, daemon=True).start()
+    return adressen
+
+
+def messe_tcp(adressen: list) -> float:
+    """
+    Mittlere Sendezeit (ms) von send_broadcast_message an alle Adressen.
+    """
+    zeiten = []
+    for _ in range(WIEDERHOLUNGEN):
+        start = time.perf_counter()
+        send_broadcast_message("Bench", "Hallo zusammen", adressen)
+        zeiten.append(time.perf_counter() - start)
+    return sum(zeiten) / len(zeiten) * 1000
+
+
+def messe_multicast(kanal: MulticastKanal) -> float:
+    """
+    Mittlere Sendezeit (ms) eines Multicast-Datagramms, oder -1 falls nicht möglich.
+    """
+    zeiten = []
+    for _ in range(WIEDERHOLUNGEN):
+        start = time.perf_counter()
+        if kanal.senden("Hallo zusammen") is None:
+            return -1.0
+        zeiten.append(time.perf_counter() - start)
+    return sum(zeiten) / len(zeiten) * 1000
+
+
+def main():
+    gruppe = sys.argv[1] if len(sys.argv) > 1 else "239.255.42.99"
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 4001
+
+    try:
+        kanal = MulticastKanal("Bench", 0, gruppe, port, net_to_ui=None)
+    except OSError as e:
+        print(f"Multicast nicht verfügbar ({e}), messe nur TCP")
+        kanal = None
+
+    print(f"{'Teilnehmer':>10} {'TCP [ms]':>10} {'Multicast [ms]':>15} {'Faktor':>8}")
+    for anzahl in RAUMGROESSEN:
+        adressen = starte_listener(anzahl)
+        tcp_ms = messe_tcp(adressen)
+        mc_ms = messe_multicast(kanal) if kanal else -1.0
+        faktor = f"{tcp_ms / mc_ms:.0f}x" if mc_ms > 0 else "-"
+        mc_text = f"{mc_ms:.3f}" if mc_ms >= 0 else "n/a"
+        print(f"{anzahl:>10} {tcp_ms:>10.2f} {mc_text:>15} {faktor:>8}")
+
+
+if __name__ == "__main__":
+    main()
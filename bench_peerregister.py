@@ -0,0 +1,113 @@
+"""
+@file bench_peerregister.py
+@brief Benchmark: Tuple-Dictionary vs. PeerRegister (Speicher und Zugriffe).
+
+Verglichen wird die bisherige Darstellung (handle -> (ip, port, zuletzt))
+mit peerregister.PeerRegister bei gleicher Teilnehmerzahl:
+
+- Speicher:     tracemalloc-Differenz nach dem Befüllen
+- Handle:       Lookup nach Handle
+- Adresse:      Rückwärtssuche (ip, port) -> Handle (Scan vs. Index)
+- Iteration:    Alle Einträge durchlaufen (list(items()) vs. Schnappschuss)
+- Heartbeat:    Zeitstempel eines bekannten Teilnehmers auffrischen
+
+Aufruf: python bench_peerregister.py [anzahl]
+"""
+
+import random
+import sys
+import time
+import timeit
+import tracemalloc
+
+from peerregister import PeerRegister
+
+
+def teilnehmer_erzeugen(anzahl: int) -> list:
+    return [(f"user{i}", f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", 5000 + i % 1000)
+            for i in range(anzahl)]
+
+
+def speicher(fabrik) -> tuple:
+    tracemalloc.start()
+    vorher = tracemalloc.get_traced_memory()[0]
+    objekt = fabrik()
+    belegt = tracemalloc.get_traced_memory()[0] - vorher
+    tracemalloc.stop()
+    return objekt, belegt
+
+
+def messen(f, wiederholungen: int) -> float:
+    """
+    Returns:
+        Mikrosekunden pro Aufruf (bester von drei Durchläufen)
+    """
+    return min(timeit.repeat(f, number=wiederholungen, repeat=3)) / wiederholungen * 1e6
+
+
+def main():
+    anzahl = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    daten = teilnehmer_erzeugen(anzahl)
+    jetzt = time.time()
+
+    tupel, tupel_bytes = speicher(lambda: {h: (ip, p, jetzt) for h, ip, p in daten})
+    register, register_bytes = speicher(lambda: PeerRegister(daten))
+
+    zufall = random.Random(1)
+    stichprobe = [zufall.choice(daten) for _ in range(1000)]
+    handles = [h for h, _, _ in stichprobe]
+    adressen = [(ip, p) for _, ip, p in stichprobe]
+    n = len(stichprobe)
+
+    def tupel_handle():
+        for h in handles:
+            tupel.get(h)
+
+    def register_handle():
+        for h in handles:
+            register.get(h)
+
+    def tupel_adresse():
+        for ip, p in adressen[:20]:
+            for h, (t_ip, t_p, _) in tupel.items():
+                if t_ip == ip and t_p == p:
+                    break
+
+    def register_adresse():
+        for ip, p in adressen:
+            register.nach_adresse(ip, p)
+
+    def tupel_iteration():
+        for h, (ip, p, zuletzt) in list(tupel.items()):
+            pass
+
+    def register_iteration():
+        for e in register:
+            pass
+
+    def tupel_heartbeat():
+        for h, ip, p in stichprobe:
+            tupel[h] = (ip, p, jetzt)
+
+    def register_heartbeat():
+        for h, ip, p in stichprobe:
+            register.eintragen(h, ip, p, jetzt)
+
+    schnappschuss = register.schnappschuss()
+    print(f"{anzahl} Teilnehmer")
+    print(f"{'Messung':<22} {'Tupel-Dict':>12} {'PeerRegister':>13}")
+    print(f"{'Speicher [KB]':<22} {tupel_bytes / 1024:>12.0f} {register_bytes / 1024:>13.0f}")
+    print(f"{'Handle [us]':<22} {messen(tupel_handle, 200) / n:>12.3f} "
+          f"{messen(register_handle, 200) / n:>13.3f}")
+    print(f"{'Adresse [us]':<22} {messen(tupel_adresse, 5) / 20:>12.1f} "
+          f"{messen(register_adresse, 200) / n:>13.3f}")
+    print(f"{'Iteration [us]':<22} {messen(tupel_iteration, 50):>12.0f} "
+          f"{messen(register_iteration, 50):>13.0f}")
+    print(f"{'Heartbeat [us]':<22} {messen(tupel_heartbeat, 200) / n:>12.3f} "
+          f"{messen(register_heartbeat, 200) / n:>13.3f}")
+    gueltig = register.schnappschuss() is schnappschuss
+    print(f"Schnappschuss nach Heartbeats wiederverwendet: {'ja' if gueltig else 'nein'}")
+
+
+if __name__ == "__main__":
+    main()
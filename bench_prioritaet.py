@@ -0,0 +1,108 @@
+"""
+@file bench_prioritaet.py
+@brief Benchmark: Latenz von Textnachrichten während großer Bildübertragungen.
+
+Modell: Alle Sendungen teilen sich einen Uplink (ein Token-Bucket mit
+uplink_mbit). Vier Bilder werden gleichzeitig gesendet, währenddessen
+kommen im Abstand von 20 ms Textnachrichten dazu. Verglichen werden:
+
+- gemeinsam:  ein Auftrags-Pool für alles (bisheriges Verhalten, 256 KB-Chunks)
+- Spuren:     prioritaet.Planer, Bulk gibt Text Vorrang (64 KB-Blöcke)
+- gedrosselt: zusätzlich Bulk-Rate auf 80 % des Uplinks begrenzt
+
+Ausgegeben werden Latenz-Perzentile der Textnachrichten (Einreihen bis
+gesendet) und die Gesamtdauer der Bildübertragungen.
+
+Aufruf: python bench_prioritaet.py [uplink_mbit] [bild_mb]
+"""
+
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from prioritaet import Drossel, Planer, TEXT, BULK
+
+BILDER = 4
+TEXTE = 50
+TEXT_ABSTAND = 0.02
+TEXT_BYTES = 200
+
+
+def bild_senden(uplink: Drossel, groesse: int, block: int, planer: Planer = None) -> None:
+    gesendet = 0
+    while gesendet < groesse:
+        anzahl = min(block, groesse - gesendet)
+        if planer is not None:
+            planer.bulk_freigabe(anzahl)
+        uplink.verbrauchen(anzahl)
+        gesendet += anzahl
+
+
+def text_senden(uplink: Drossel, eingereiht: float, latenzen: list) -> None:
+    uplink.verbrauchen(TEXT_BYTES)
+    latenzen.append(time.monotonic() - eingereiht)
+
+
+def durchlauf(name: str, uplink_rate: float, bild_bytes: int, bulk_rate: float = None) -> None:
+    uplink = Drossel(uplink_rate, burst=64 * 1024)
+    latenzen = []
+    fertig = threading.Event()
+    offen = [BILDER]
+    lock = threading.Lock()
+
+    def bild_fertig():
+        with lock:
+            offen[0] -= 1
+            if not offen[0]:
+                fertig.set()
+
+    def bild_auftrag(planer=None, block=256 * 1024):
+        try:
+            bild_senden(uplink, bild_bytes, block, planer)
+        finally:
+            bild_fertig()
+
+    start = time.monotonic()
+    if bulk_rate is None:
+        pool = ThreadPoolExecutor(max_workers=4)
+        for _ in range(BILDER):
+            pool.submit(bild_auftrag)
+        time.sleep(0.05)
+        for _ in range(TEXTE):
+            pool.submit(text_senden, uplink, time.monotonic(), latenzen)
+            time.sleep(TEXT_ABSTAND)
+    else:
+        planer = Planer({TEXT: 4, BULK: BILDER}, bulk_rate=bulk_rate, text_ziel_ms=50)
+        for _ in range(BILDER):
+            planer.einreihen(BULK, bild_auftrag, planer, 64 * 1024)
+        time.sleep(0.05)
+        for _ in range(TEXTE):
+            planer.einreihen(TEXT, text_senden, uplink, time.monotonic(), latenzen)
+            time.sleep(TEXT_ABSTAND)
+    fertig.wait()
+    dauer = time.monotonic() - start
+    while len(latenzen) < TEXTE:
+        time.sleep(0.01)
+
+    latenzen.sort()
+    p = lambda q: latenzen[min(len(latenzen) - 1, int(len(latenzen) * q))] * 1000
+    print(f"{name:<12} {p(0.5):>9.1f} {p(0.95):>9.1f} {latenzen[-1] * 1000:>9.1f} {dauer:>11.2f}")
+
+
+def main():
+    uplink_mbit = float(sys.argv[1]) if len(sys.argv) > 1 else 100.0
+    bild_mb = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    uplink = uplink_mbit * 1e6 / 8
+    bild_bytes = int(bild_mb * 1024 * 1024)
+
+    print(f"Uplink {uplink_mbit:.0f} Mbit/s, {BILDER} Bilder à {bild_mb:.0f} MB, "
+          f"{TEXTE} Texte alle {TEXT_ABSTAND * 1000:.0f} ms")
+    print(f"{'Variante':<12} {'p50 [ms]':>9} {'p95 [ms]':>9} {'max [ms]':>9} {'Bilder [s]':>11}")
+    durchlauf("gemeinsam", uplink, bild_bytes)
+    durchlauf("Spuren", uplink, bild_bytes, bulk_rate=0)
+    durchlauf("gedrosselt", uplink, bild_bytes, bulk_rate=uplink * 0.8)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+@file bench_relay.py
+@brief Simulation: Zustellzeit und Upload pro Knoten beim Broadcast, direkt vs. Relay-Baum.
+
+Modell (pro Knoten ein Uplink, Sendungen laufen nacheinander):
+- Jede Verbindung kostet eine RTT für den Aufbau plus (Nutzlast + Kopf) / Uplink
+- Ein Empfänger beginnt mit dem Weiterleiten, sobald er die Nachricht hat
+- Der Baum wird mit relay.aufteilen() aus der sortierten Zielliste gebildet,
+  also genau wie im Netzwerk-Prozess; der Kopf enthält den Teilbaum (ip:port)
+
+Ausgegeben werden die Zeit bis zur Zustellung an den letzten Empfänger sowie
+der Upload des Senders und das Maximum über alle Weiterleiter. Bilder werden
+nie per Relay verteilt; die größte Nutzlast ist daher ein Batch an der
+Relay-Grenze (relay.MAX_NUTZLAST), der Fanout wird wie im Netzwerk-Prozess
+auf relay.MAX_FANOUT begrenzt.
+
+Aufruf: python bench_relay.py [fanout] [uplink_mbit] [rtt_ms]
+"""
+
+import sys
+
+import relay
+
+GROESSEN = (10, 50, 100, 250, 500, 1000)
+NUTZLASTEN = (("Text", 200), ("Batch an der Relay-Grenze", relay.MAX_NUTZLAST))
+ZIEL_BYTES = 22  # "192.168.100.200:50000 "
+KOPF_BYTES = 64
+
+
+def direkt(anzahl: int, nutzlast: int, uplink: float, rtt: float) -> tuple:
+    """
+    Returns:
+        (zeit_letzter_empfaenger_s, upload_sender_bytes)
+    """
+    pro_verbindung = rtt + (nutzlast + KOPF_BYTES) / uplink
+    return anzahl * pro_verbindung + rtt / 2, anzahl * (nutzlast + KOPF_BYTES)
+
+
+def baum(anzahl: int, nutzlast: int, fanout: int, uplink: float, rtt: float) -> tuple:
+    """
+    Returns:
+        (zeit_letzter_empfaenger_s, upload_sender_bytes, max_upload_weiterleiter_bytes, tiefe)
+    """
+    upload = {}
+    letzte = 0.0
+    tiefe = 0
+    # (knoten, teilbaum, zeitpunkt an dem knoten die Nachricht hat, ebene)
+    offen = [("sender", list(range(anzahl)), 0.0, 0)]
+    while offen:
+        knoten, ziele, start, ebene = offen.pop()
+        zeit = start
+        for kind, teilbaum in relay.aufteilen(ziele, fanout):
+            groesse = nutzlast + KOPF_BYTES + ZIEL_BYTES * len(teilbaum)
+            zeit += rtt + groesse / uplink
+            upload[knoten] = upload.get(knoten, 0) + groesse
+            ankunft = zeit + rtt / 2
+            letzte = max(letzte, ankunft)
+            tiefe = max(tiefe, ebene + 1)
+            if teilbaum:
+                offen.append((kind, teilbaum, ankunft, ebene + 1))
+    weiterleiter = [b for k, b in upload.items() if k != "sender"]
+    return letzte, upload["sender"], max(weiterleiter, default=0), tiefe
+
+
+def format_bytes(anzahl: float) -> str:
+    for einheit in ("B", "KB", "MB", "GB"):
+        if anzahl < 1024:
+            return f"{anzahl:.0f} {einheit}"
+        anzahl /= 1024
+    return f"{anzahl:.1f} TB"
+
+
+def main():
+    fanout = min(int(sys.argv[1]) if len(sys.argv) > 1 else 4, relay.MAX_FANOUT)
+    uplink_mbit = float(sys.argv[2]) if len(sys.argv) > 2 else 100.0
+    rtt_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 0.5
+    uplink = uplink_mbit * 1e6 / 8
+    rtt = rtt_ms / 1000
+
+    print(f"Fanout {fanout}, Uplink {uplink_mbit:.0f} Mbit/s, RTT {rtt_ms} ms")
+    for name, nutzlast in NUTZLASTEN:
+        print(f"\n{name} ({format_bytes(nutzlast)})")
+        print(f"{'N':>6} {'direkt [ms]':>12} {'Relay [ms]':>11} {'Tiefe':>6} "
+              f"{'Upload Sender direkt':>21} {'Relay':>10} {'max. Weiterleiter':>18}")
+        for anzahl in GROESSEN:
+            d_zeit, d_upload = direkt(anzahl, nutzlast, uplink, rtt)
+            r_zeit, r_upload, r_max, tiefe = baum(anzahl, nutzlast, fanout, uplink, rtt)
+            print(f"{anzahl:>6} {d_zeit * 1000:>12.1f} {r_zeit * 1000:>11.1f} {tiefe:>6} "
+                  f"{format_bytes(d_upload):>21} {format_bytes(r_upload):>10} {format_bytes(r_max):>18}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+@file bench_replay.py
+@brief Spielt einen Mitschnitt (mitschnitt.py) zeitgetreu gegen lokale Instanzen ab.
+
+Abgespielt werden die eingehenden Nachrichten des Traces, also das, was die
+mitschneidende Instanz empfangen hat:
+- UDP (Discovery) an 127.0.0.1:<whoisport>, jede Nachricht von einem eigenen
+  Socket. Hat die Instanz im Mitschnitt darauf geantwortet (ausgehende
+  Nachricht an denselben Absender vor dessen nächster Nachricht), wird auf
+  eine Antwort gewartet: Latenz bzw. Verlust nach Timeout.
+- TCP (Chat) an 127.0.0.1:<chat_port>, eine Verbindung pro Nachricht. Latenz
+  ist Verbindungsaufbau + Senden; Verlust = abgewiesene Verbindung.
+  Bilddaten sind im Trace nur angeschnitten und werden für IMG bis zur Größe
+  aus dem Header mit Füllbytes aufgefüllt, damit die Last erhalten bleibt.
+
+Die Zeitabstände werden durch das Tempo geteilt (1 = Echtzeit, 10 = zehnfach
+beschleunigt). Ausgegeben werden pro Nachrichtentyp Anzahl, Verluste und
+Latenz-Perzentile sowie die Verspätung gegenüber dem Zeitplan.
+
+Aufruf:
+    python bench_replay.py <trace> [tempo] [whoisport] [chat_port]
+    python bench_replay.py --sturm <anzahl> [tempo] [whoisport]
+
+--sturm erzeugt einen synthetischen Trace (JOIN-Sturm über eine Sekunde,
+danach eine WHO-Flut) und startet dafür selbst einen lokalen Discovery-Dienst.
+"""
+
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Process
+
+import mitschnitt
+import slcp
+
+ANTWORT_TIMEOUT = 2.0
+MAX_PARALLEL = 64
+
+
+def planen(pfad: str) -> list:
+    """
+    Liest die eingehenden Nachrichten eines Traces.
+
+    Returns:
+        Liste von (versatz_s, datensatz, antwort_erwartet), nach Zeit sortiert
+    """
+    datensaetze = list(mitschnitt.lesen(pfad))
+    plan = []
+    offen = {}  # Absender -> Index seiner letzten UDP-Nachricht im Plan
+    for d in datensaetze:
+        addr = (d.ip, d.port)
+        if d.richtung == mitschnitt.EIN:
+            if d.kanal == mitschnitt.UDP:
+                offen[addr] = len(plan)
+            plan.append([d.zeit, d, False])
+        elif d.kanal == mitschnitt.UDP and addr in offen:
+            plan[offen.pop(addr)][2] = True
+    if not plan:
+        return []
+    start = plan[0][0]
+    return sorted(((zeit - start, d, erwartet) for zeit, d, erwartet in plan), key=lambda e: e[0])
+
+
+def _typ(daten: bytes) -> str:
+    return daten.split(b" ", 1)[0].split(b"\n", 1)[0][:12].decode('ascii', errors='replace') or "?"
+
+
+def _udp_abspielen(d, erwartet: bool, ziel: tuple) -> float:
+    """
+    Returns:
+        Latenz in Sekunden, None bei Verlust
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.settimeout(ANTWORT_TIMEOUT)
+        start = time.perf_counter()
+        sock.sendto(d.daten, ziel)
+        if not erwartet:
+            return time.perf_counter() - start
+        try:
+            sock.recvfrom(65535)
+        except socket.timeout:
+            return None
+        return time.perf_counter() - start
+    finally:
+        sock.close()
+
+
+def _tcp_abspielen(d, ziel: tuple) -> float:
+    daten = d.daten
+    if d.laenge > len(daten) and daten.startswith(b"IMG "):
+        # Angeschnittenes Bild: Header behalten, Rest bis zur angegebenen Größe auffüllen
+        kopf, _, rest = daten.partition(b"\n")
+        try:
+            groesse = int(kopf.split()[2])
+        except (IndexError, ValueError):
+            groesse = 0
+        daten = kopf + b"\n" + rest + bytes(max(groesse - len(rest), 0))
+    start = time.perf_counter()
+    try:
+        with socket.create_connection(ziel, timeout=ANTWORT_TIMEOUT) as sock:
+            sock.sendall(daten)
+    except OSError:
+        return None
+    return time.perf_counter() - start
+
+
+def abspielen(plan: list, tempo: float, whoisport: int, chat_port: int) -> tuple:
+    """
+    Returns:
+        (ergebnisse, verspaetungen, dauer_s) - ergebnisse: Liste von (kanal, typ, latenz|None)
+    """
+    ergebnisse = []
+    verspaetungen = []
+    lock = threading.Lock()
+
+    def ausfuehren(d, erwartet, geplant):
+        verspaetung = time.perf_counter() - geplant
+        if d.kanal == mitschnitt.UDP:
+            latenz = _udp_abspielen(d, erwartet, ("127.0.0.1", whoisport))
+        else:
+            latenz = _tcp_abspielen(d, ("127.0.0.1", chat_port))
+        with lock:
+            verspaetungen.append(verspaetung)
+            ergebnisse.append((d.kanal, _typ(d.daten), latenz))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL) as pool:
+        for versatz, d, erwartet in plan:
+            geplant = start + versatz / tempo
+            warten = geplant - time.perf_counter()
+            if warten > 0:
+                time.sleep(warten)
+            pool.submit(ausfuehren, d, erwartet, geplant)
+    return ergebnisse, verspaetungen, time.perf_counter() - start
+
+
+def perzentil(werte: list, p: float) -> float:
+    if not werte:
+        return 0.0
+    werte = sorted(werte)
+    return werte[min(len(werte) - 1, int(len(werte) * p))]
+
+
+def bericht(ergebnisse: list, verspaetungen: list, dauer: float, soll: float) -> None:
+    gruppen = {}
+    for kanal, typ, latenz in ergebnisse:
+        gruppen.setdefault(("UDP" if kanal == mitschnitt.UDP else "TCP", typ), []).append(latenz)
+
+    print(f"\n{'Kanal':<6} {'Typ':<10} {'Anzahl':>7} {'Verlust':>8} "
+          f"{'p50 [ms]':>9} {'p95 [ms]':>9} {'p99 [ms]':>9} {'max [ms]':>9}")
+    verloren_gesamt = 0
+    for (kanal, typ), latenzen in sorted(gruppen.items()):
+        ok = [l for l in latenzen if l is not None]
+        verloren = len(latenzen) - len(ok)
+        verloren_gesamt += verloren
+        print(f"{kanal:<6} {typ:<10} {len(latenzen):>7} {verloren:>8} "
+              f"{perzentil(ok, 0.5) * 1000:>9.2f} {perzentil(ok, 0.95) * 1000:>9.2f} "
+              f"{perzentil(ok, 0.99) * 1000:>9.2f} {max(ok, default=0) * 1000:>9.2f}")
+
+    anteil = verloren_gesamt / len(ergebnisse) * 100 if ergebnisse else 0.0
+    print(f"\nGesamt: {len(ergebnisse)} Nachrichten, {verloren_gesamt} verloren ({anteil:.1f} %)")
+    print(f"Dauer: {dauer:.2f} s (Soll {soll:.2f} s), Verspätung ggü. Zeitplan: "
+          f"p99 {perzentil(verspaetungen, 0.99) * 1000:.1f} ms, max {max(verspaetungen, default=0) * 1000:.1f} ms")
+
+
+def sturm_erzeugen(pfad: str, anzahl: int) -> None:
+    """
+    Schreibt einen synthetischen Trace: anzahl JOINs innerhalb einer Sekunde
+    (Arbeitsbeginn), danach anzahl WHO-Anfragen innerhalb einer weiteren Sekunde.
+    Antworten sind als ausgehende Nachrichten enthalten, damit sie erwartet werden.
+    """
+    trace = mitschnitt.Mitschnitt(pfad)
+    t0 = time.time()
+    for i in range(anzahl):
+        addr = ("10.0.0.%d" % (i % 250 + 1), 40000 + i)
+        zeit = t0 + i / anzahl
+        trace.aufzeichnen(mitschnitt.EIN, mitschnitt.UDP, addr, slcp.encode_join(f"nutzer{i}", 5000 + i), zeit=zeit)
+        trace.aufzeichnen(mitschnitt.AUS, mitschnitt.UDP, addr, f"JOIN_ACK nutzer{i}".encode('utf-8'), zeit=zeit)
+    for i in range(anzahl):
+        addr = ("10.0.1.%d" % (i % 250 + 1), 40000 + i)
+        zeit = t0 + 1 + i / anzahl
+        trace.aufzeichnen(mitschnitt.EIN, mitschnitt.UDP, addr, slcp.encode_who(), zeit=zeit)
+        trace.aufzeichnen(mitschnitt.AUS, mitschnitt.UDP, addr, b"KNOWUSERS ...", zeit=zeit)
+    trace.schliessen()
+
+
+def _discovery_starten(whoisport: int) -> Process:
+    from discovery import discovery_loop
+    config = {"discovery_snapshot": "", "logging": {"level": "WARNING"}}
+    prozess = Process(target=discovery_loop, args=(whoisport, None, config), daemon=True)
+    prozess.start()
+    time.sleep(0.5)
+    return prozess
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    prozess = None
+    if sys.argv[1] == "--sturm":
+        anzahl = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+        tempo = float(sys.argv[3]) if len(sys.argv) > 3 else 1.0
+        whoisport = int(sys.argv[4]) if len(sys.argv) > 4 else 14000
+        chat_port = 0
+        pfad = os.path.join(tempfile.mkdtemp(), "sturm.trc")
+        sturm_erzeugen(pfad, anzahl)
+        prozess = _discovery_starten(whoisport)
+    else:
+        pfad = sys.argv[1]
+        tempo = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+        whoisport = int(sys.argv[3]) if len(sys.argv) > 3 else 4000
+        chat_port = int(sys.argv[4]) if len(sys.argv) > 4 else 5000
+
+    plan = planen(pfad)
+    if not plan:
+        print(f"{pfad}: keine eingehenden Nachrichten")
+        return
+    soll = plan[-1][0] / tempo
+    print(f"{pfad}: {len(plan)} Nachrichten über {plan[-1][0]:.2f} s, Tempo {tempo}x, "
+          f"Discovery 127.0.0.1:{whoisport}, Chat 127.0.0.1:{chat_port}")
+    try:
+        ergebnisse, verspaetungen, dauer = abspielen(plan, tempo, whoisport, chat_port)
+    finally:
+        if prozess is not None:
+            prozess.terminate()
+    bericht(ergebnisse, verspaetungen, dauer, soll)
+
+
+if __name__ == "__main__":
+    main()
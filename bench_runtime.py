@@ -0,0 +1,113 @@
+"""
+@file bench_runtime.py
+@brief Benchmark: Mehrprozess- vs. Einzelprozess-Modus (Start, Speicher, Latenz).
+
+Jeder Modus läuft in einem frischen Interpreter (Unterprozess dieses Skripts)
+und startet Discovery und Netzwerk wie main.py, nur ohne UI. Gemessen werden:
+
+- Start: bis der Netzwerk-Loop die erste STATS-Anfrage beantwortet
+  (einschließlich der Wartezeiten in main.hintergrund_starten)
+- RSS: Summe über alle beteiligten Prozesse (Linux, /proc)
+- Latenz: UI -> Netzwerk -> UI für STATS (Queue-Übergabe in beide Richtungen)
+
+Aufruf: python bench_runtime.py [anzahl_anfragen]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+MODI = (("Prozesse", False), ("Einzelprozess", True))
+
+
+def rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for zeile in f:
+                if zeile.startswith("VmRSS:"):
+                    return int(zeile.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def stats_runde(ui_to_net, net_to_ui, timeout: float = 10.0) -> None:
+    """
+    Sendet STATS und wartet auf die letzte Antwortzeile.
+    """
+    ui_to_net.put(("STATS",))
+    ende = time.monotonic() + timeout
+    while True:
+        msg = net_to_ui.get(timeout=max(ende - time.monotonic(), 0.01))
+        if msg.startswith("[STATS] Spuren"):
+            return
+
+
+def lauf(einzelprozess: bool, anzahl: int, port: int, whoisport: int) -> dict:
+    import multiprocessing
+    import main
+
+    config = {
+        "einzelprozess": einzelprozess,
+        "heartbeat": 0,
+        "discovery_snapshot": "",
+        "postausgang_pfad": "",
+        "logging": {"level": "WARNING", "datei": ""},
+    }
+    start = time.perf_counter()
+    ui_to_net, net_to_ui, arbeiter = main.hintergrund_anlegen(config, "Bench", port, whoisport, einzelprozess)
+    main.hintergrund_starten(arbeiter, einzelprozess)
+    stats_runde(ui_to_net, net_to_ui)
+    startzeit = time.perf_counter() - start
+
+    latenzen = []
+    for _ in range(anzahl):
+        t0 = time.perf_counter()
+        stats_runde(ui_to_net, net_to_ui)
+        latenzen.append(time.perf_counter() - t0)
+    latenzen.sort()
+
+    pids = [os.getpid()] + [p.pid for p in multiprocessing.active_children()]
+    ergebnis = {
+        "start_ms": startzeit * 1000,
+        "rss_mb": sum(rss_kb(pid) for pid in pids) / 1024,
+        "prozesse": len(pids),
+        "p50_ms": latenzen[len(latenzen) // 2] * 1000,
+        "p99_ms": latenzen[min(len(latenzen) - 1, int(len(latenzen) * 0.99))] * 1000,
+    }
+    for p in multiprocessing.active_children():
+        p.terminate()
+    return ergebnis
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--lauf":
+        # Unterprozess: ein Modus, Ergebnis als JSON auf stdout
+        einzelprozess = sys.argv[2] == "1"
+        ergebnis = lauf(einzelprozess, int(sys.argv[3]), int(sys.argv[4]), int(sys.argv[5]))
+        print("ERGEBNIS " + json.dumps(ergebnis))
+        sys.stdout.flush()
+        os._exit(0)  # Daemon-Threads der Dienste nicht abwarten
+
+    anzahl = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(f"{anzahl} STATS-Anfragen pro Modus")
+    print(f"{'Modus':<14} {'Prozesse':>8} {'Start [ms]':>11} {'RSS [MB]':>9} {'p50 [ms]':>9} {'p99 [ms]':>9}")
+    for i, (name, einzelprozess) in enumerate(MODI):
+        ausgabe = subprocess.run(
+            [sys.executable, __file__, "--lauf", "1" if einzelprozess else "0", str(anzahl),
+             str(15400 + i), str(14400 + i)],
+            capture_output=True, text=True, timeout=120,
+        ).stdout
+        zeilen = [z for z in ausgabe.splitlines() if z.startswith("ERGEBNIS ")]
+        if not zeilen:
+            print(f"{name:<14} fehlgeschlagen")
+            continue
+        e = json.loads(zeilen[-1][len("ERGEBNIS "):])
+        print(f"{name:<14} {e['prozesse']:>8} {e['start_ms']:>11.0f} {e['rss_mb']:>9.1f} "
+              f"{e['p50_ms']:>9.3f} {e['p99_ms']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
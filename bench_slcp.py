@@ -0,0 +1,212 @@
+"""
+@file bench_slcp.py
+@brief Fuzz-Test und Microbenchmarks für den SLCP-Codec (slcp.py).
+
+1. Fuzzing: Ausgehend von einem Korpus gültiger und ungültiger Nachrichten
+   werden zufällig mutierte Eingaben erzeugt. Der Codec darf dabei nur
+   gültige Datensätze liefern oder SlcpFehler auslösen - jede andere
+   Ausnahme ist ein Fehler. Gültige Datensätze müssen nach encode/parse
+   unverändert bleiben (Round-Trip).
+2. Microbenchmarks: Parse- und Encode-Operationen pro Sekunde.
+
+Aufruf: python bench_slcp.py [fuzz_iterationen] [seed]
+"""
+
+import random
+import sys
+import timeit
+
+import slcp
+
+# Korpus: gültige Nachrichten und bekannte Grenzfälle
+KORPUS = [
+    b"JOIN Alice 5000",
+    b"JOIN B 1",
+    b"JOIN " + b"x" * 64 + b" 65535",
+    b"LEAVE Alice",
+    b"WHO",
+    b"WHO\n",
+    b"KNOWUSERS",
+    b"KNOWUSERS Alice 192.168.1.5 5000",
+    b"KNOWUSERS Alice 192.168.1.5 5000,Bob 192.168.1.6 5001",
+    b"KNOWUSERS Alice 192.168.1.5 5000, Bob 192.168.1.6 5001",
+    "JOIN Jürgen 5000".encode('utf-8'),
+    b"WHO #lan",
+    b"SUB Alice #lan",
+    b"UNSUB Alice #lan",
+    "SUB Jürgen #café".encode('utf-8'),
+    # Ungültig
+    b"",
+    b" ",
+    b"JOIN",
+    b"JOIN Alice",
+    b"JOIN Alice 0",
+    b"JOIN Alice 65536",
+    b"JOIN Alice 5000 extra",
+    b"JOIN Al,ice 5000",
+    b"LEAVE",
+    b"WHO Alice",
+    b"WHO #",
+    b"SUB Alice",
+    b"SUB Alice lan",
+    b"SUB Alice #lan extra",
+    b"UNSUB #lan",
+    b"KNOWUSERS Alice 192.168.1 5000",
+    b"KNOWUSERS Alice 256.1.1.1 5000",
+    b"KNOWUSERS Alice 1.1.1.1 5000,,",
+    b"KNOWUSERS ,",
+    b"join Alice 5000",
+    b"\xff\xfe JOIN",
+    b"JOIN \xff 5000",
+]
+
+MSG_KORPUS = [
+    b"MSG Alice Hallo",
+    b"MSG Alice Hallo Welt mit Leerzeichen",
+    "MSG Bob Grüße 📷".encode('utf-8'),
+    b"MSG Alice",
+    b"MSG",
+    b"MSG  Hallo",
+    b"MSG Alice \xff",
+    b"RMSG Alice #lan Hallo Raum",
+    b"RMSG Alice #lan",
+    b"RMSG Alice lan Hallo",
+    b"QMSG Alice 0000018f2a3b4c5d - Hallo",
+    b"QMSG Alice 0000018f2a3b4c5d #lan Hallo Raum",
+    b"MCAST Alice 5000 1760000000000 42 Hallo Gruppe",
+    b"MCAST Alice 5000 1760000000000 x Hallo",
+    b"QMSG Alice 18f2a3b4c5d - Hallo",
+    b"QMSG Alice 0000018f2a3b4c5d lan Hallo",
+]
+
+PEERLISTE_KORPUS = [
+    "Alice 192.168.1.5 5000",
+    "Alice 192.168.1.5 5000;Bob 192.168.1.6 5001",
+    "Alice 192.168.1.5 5000 OK:12ms;Bob 192.168.1.6 5001 TOT",
+    "",
+    "Alice 192.168.1.5",
+    "Alice 192.168.1.5 5000;",
+]
+
+ZEICHEN = b" ,;.0123456789ABCDEFJOINLEAVEWHOKNOWUSERSMSG\n\t\xff\x00"
+
+
+def mutieren(rng: random.Random, daten: bytes) -> bytes:
+    """
+    Wendet 1-4 zufällige Mutationen an (ersetzen, einfügen, löschen, duplizieren).
+    """
+    daten = bytearray(daten)
+    for _ in range(rng.randint(1, 4)):
+        art = rng.randrange(4)
+        pos = rng.randint(0, len(daten))
+        if art == 0 and daten:
+            daten[min(pos, len(daten) - 1)] = rng.choice(ZEICHEN)
+        elif art == 1:
+            daten[pos:pos] = bytes([rng.choice(ZEICHEN)]) * rng.randint(1, 3)
+        elif art == 2 and daten:
+            del daten[pos:pos + rng.randint(1, 4)]
+        else:
+            daten[pos:pos] = daten[:rng.randint(0, 16)]
+    return bytes(daten)
+
+
+def pruefe_discovery(daten: bytes) -> bool:
+    """
+    Returns:
+        True wenn gültig geparst, False bei SlcpFehler. Andere Ausnahmen werden durchgereicht.
+    """
+    try:
+        nachricht = slcp.parse_discovery(daten)
+    except slcp.SlcpFehler:
+        return False
+
+    # Round-Trip: encode(parse(x)) muss wieder dasselbe ergeben
+    if isinstance(nachricht, slcp.Join):
+        kodiert = slcp.encode_join(nachricht.handle, nachricht.port)
+    elif isinstance(nachricht, slcp.Leave):
+        kodiert = slcp.encode_leave(nachricht.handle)
+    elif isinstance(nachricht, slcp.Who):
+        kodiert = slcp.encode_who(nachricht.raum)
+    elif isinstance(nachricht, slcp.Sub):
+        kodiert = slcp.encode_sub(nachricht.handle, nachricht.raum)
+    elif isinstance(nachricht, slcp.Unsub):
+        kodiert = slcp.encode_unsub(nachricht.handle, nachricht.raum)
+    else:
+        kodiert = slcp.encode_knowusers(nachricht.teilnehmer)
+    assert slcp.parse_discovery(kodiert) == nachricht, (daten, nachricht)
+    return True
+
+
+def pruefe_msg(daten: bytes) -> bool:
+    try:
+        msg = slcp.parse_chat(daten)
+    except slcp.SlcpFehler:
+        return False
+    if isinstance(msg, slcp.Gespeichert):
+        kodiert = slcp.encode_qmsg(msg.handle, msg.id, msg.raum, msg.text)
+    elif isinstance(msg, slcp.RaumMsg):
+        kodiert = slcp.encode_rmsg(msg.handle, msg.raum, msg.text)
+    elif isinstance(msg, slcp.GruppenMsg):
+        kodiert = slcp.encode_mcast(msg.handle, msg.port, msg.epoche, msg.seq, msg.text)
+    else:
+        kodiert = slcp.encode_msg(msg.handle, msg.text)
+    assert slcp.parse_chat(kodiert) == msg, (daten, msg)
+    return True
+
+
+def fuzz(iterationen: int, seed: int) -> None:
+    rng = random.Random(seed)
+    gueltig = ungueltig = 0
+
+    for text in PEERLISTE_KORPUS:
+        try:
+            liste = slcp.parse_peerliste(text)
+            assert slcp.parse_peerliste(slcp.encode_peerliste(liste)) == liste
+        except slcp.SlcpFehler:
+            pass
+
+    for i in range(iterationen):
+        if i % 4 == 0:
+            daten = mutieren(rng, rng.choice(MSG_KORPUS))
+            ok = pruefe_msg(daten)
+        else:
+            daten = mutieren(rng, rng.choice(KORPUS))
+            ok = pruefe_discovery(daten)
+        if ok:
+            gueltig += 1
+        else:
+            ungueltig += 1
+
+    print(f"Fuzzing: {iterationen} Eingaben (seed {seed}), {gueltig} gültig, "
+          f"{ungueltig} abgelehnt, 0 unerwartete Ausnahmen")
+
+
+def benchmark() -> None:
+    knowusers_10 = slcp.encode_knowusers(
+        (f"User{i}", f"192.168.1.{i + 1}", 5000 + i) for i in range(10))
+    knowusers_100 = slcp.encode_knowusers(
+        (f"User{i}", f"10.0.{i // 250}.{i % 250 + 1}", 5000 + i) for i in range(100))
+    teilnehmer_100 = slcp.parse_discovery(knowusers_100).teilnehmer
+
+    faelle = [
+        ("parse JOIN", lambda: slcp.parse_discovery(b"JOIN Alice 5000")),
+        ("parse WHO", lambda: slcp.parse_discovery(b"WHO")),
+        ("parse KNOWUSERS (10)", lambda: slcp.parse_discovery(knowusers_10)),
+        ("parse KNOWUSERS (100)", lambda: slcp.parse_discovery(knowusers_100)),
+        ("parse MSG", lambda: slcp.parse_msg(b"MSG Alice Hallo Welt, wie geht's?")),
+        ("encode JOIN", lambda: slcp.encode_join("Alice", 5000)),
+        ("encode KNOWUSERS (100)", lambda: slcp.encode_knowusers(teilnehmer_100)),
+        ("encode MSG", lambda: slcp.encode_msg("Alice", "Hallo Welt, wie geht's?")),
+    ]
+
+    print(f"{'Operation':<26} {'ops/s':>12}")
+    for name, funktion in faelle:
+        anzahl, dauer = timeit.Timer(funktion).autorange()
+        print(f"{name:<26} {anzahl / dauer:>12,.0f}")
+
+
+if __name__ == "__main__":
+    iterationen = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    fuzz(iterationen, seed)
+    benchmark()
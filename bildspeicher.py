@@ -0,0 +1,382 @@
+"""
+@file bildspeicher.py
+@brief Inhaltsadressierter Bildspeicher mit LRU-Verdrängung.
+
+Empfangene Bilder werden unter ihrem SHA-256-Hash abgelegt. Dadurch wird
+dasselbe Bild nur einmal gespeichert, egal von wie vielen Absendern es kommt,
+und ein Sender kann per 'HAVE <hash>' vorab prüfen, ob der Empfänger das Bild
+bereits besitzt. Die Gesamtgröße des Speichers ist begrenzt; bei Überschreitung
+werden die am längsten nicht benutzten Bilder gelöscht.
+
+Große Bilder werden in Chunks übertragen. Bereits bestätigte Teile liegen
+im Staging-Bereich, damit eine abgebrochene Übertragung am letzten
+bestätigten Offset fortgesetzt werden kann.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import protokollierung
+
+log = protokollierung.logger("img")
+
+HASH_MUSTER = re.compile(r"^[0-9a-f]{64}$")
+TRANSFER_ID_MUSTER = re.compile(r"^[0-9a-f]{16,64}$")
+DATEI_ENDUNG = ".jpg"  # Standardmäßig .jpg, wie bisher
+STAGING_ORDNER = ".staging"
+
+# Cache für Hashes lokaler Dateien: pfad -> (mtime, size, hash)
+_datei_hash_cache = {}
+_datei_hash_lock = threading.Lock()
+
+
+def bild_hash(daten: bytes) -> str:
+    """
+    Berechnet den Inhalts-Hash (SHA-256, hex) von Bilddaten.
+    """
+    return hashlib.sha256(daten).hexdigest()
+
+
+def datei_hash(pfad: str) -> str:
+    """
+    Berechnet den Inhalts-Hash einer Datei blockweise.
+    Ergebnisse werden anhand von mtime und Größe gecacht, damit
+    wiederholtes Senden derselben Datei sie nicht erneut einliest.
+    """
+    stat = os.stat(pfad)
+    schluessel = os.path.abspath(pfad)
+    with _datei_hash_lock:
+        eintrag = _datei_hash_cache.get(schluessel)
+        if eintrag and eintrag[0] == stat.st_mtime_ns and eintrag[1] == stat.st_size:
+            return eintrag[2]
+
+    h = hashlib.sha256()
+    with open(pfad, 'rb') as f:
+        while True:
+            block = f.read(1024 * 1024)
+            if not block:
+                break
+            h.update(block)
+    digest = h.hexdigest()
+
+    with _datei_hash_lock:
+        _datei_hash_cache[schluessel] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+
+def ist_gueltiger_hash(digest: str) -> bool:
+    """
+    Prüft, ob ein String ein gültiger SHA-256-Hex-Hash ist.
+    """
+    return bool(HASH_MUSTER.match(digest))
+
+
+def transfer_id(handle: str, digest: str) -> str:
+    """
+    Leitet die Transfer-ID eines Bildes ab. Sie ist deterministisch, damit
+    auch ein neu gestarteter Sender eine abgebrochene Übertragung fortsetzt.
+    """
+    return hashlib.sha256(f"{handle} {digest}".encode('utf-8')).hexdigest()[:32]
+
+
+class BildSpeicher:
+    """
+    Thread-sicherer, inhaltsadressierter Bildspeicher.
+
+    Jedes Bild liegt als '<hash>.jpg' im Bildverzeichnis. Die LRU-Reihenfolge
+    wird im Speicher gehalten und beim Start aus den Änderungszeiten der
+    Dateien rekonstruiert; Zugriffe aktualisieren die Änderungszeit.
+    """
+
+    def __init__(self, verzeichnis: str, max_bytes: int):
+        """
+        Args:
+            verzeichnis: Bildverzeichnis (imagepath aus config.toml)
+            max_bytes: Maximale Gesamtgröße aller gespeicherten Bilder
+        """
+        self.verzeichnis = verzeichnis
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._eintraege = OrderedDict()  # hash -> Größe, älteste zuerst
+        self._gesamt = 0
+
+        os.makedirs(verzeichnis, exist_ok=True)
+        self._einlesen()
+
+    def _einlesen(self):
+        """
+        Baut den LRU-Index aus den vorhandenen Dateien auf.
+        """
+        gefunden = []
+        for name in os.listdir(self.verzeichnis):
+            digest, endung = os.path.splitext(name)
+            if endung != DATEI_ENDUNG or not ist_gueltiger_hash(digest):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.verzeichnis, name))
+            except OSError:
+                continue
+            gefunden.append((stat.st_mtime, digest, stat.st_size))
+
+        for _, digest, size in sorted(gefunden):
+            self._eintraege[digest] = size
+            self._gesamt += size
+
+    def pfad(self, digest: str) -> str:
+        """
+        Liefert den Dateipfad für einen Hash.
+        """
+        return os.path.join(self.verzeichnis, digest + DATEI_ENDUNG)
+
+    def hat(self, digest: str) -> bool:
+        """
+        Prüft, ob ein Bild vorhanden ist, und markiert es als zuletzt benutzt.
+        """
+        if not ist_gueltiger_hash(digest):
+            return False
+        with self._lock:
+            if digest not in self._eintraege:
+                return False
+            pfad = self.pfad(digest)
+            if not os.path.exists(pfad):
+                # Datei wurde von außen gelöscht
+                self._gesamt -= self._eintraege.pop(digest)
+                return False
+            self._eintraege.move_to_end(digest)
+        try:
+            os.utime(pfad)
+        except OSError:
+            pass
+        return True
+
+    def speichern(self, digest: str, daten: bytes) -> str:
+        """
+        Speichert Bilddaten unter ihrem Hash und verdrängt bei Bedarf alte Bilder.
+
+        Args:
+            digest: Erwarteter Hash der Daten
+            daten: Bilddaten
+
+        Returns:
+            Pfad der gespeicherten Datei
+
+        Raises:
+            ValueError: Wenn der Hash nicht zu den Daten passt
+        """
+        if bild_hash(daten) != digest:
+            raise ValueError("Hash passt nicht zu den Bilddaten")
+
+        pfad = self.pfad(digest)
+        if self.hat(digest):
+            return pfad
+
+        # Atomar schreiben, damit nie eine halbe Datei unter dem Hash liegt
+        tmp_pfad = f"{pfad}.{threading.get_ident()}.tmp"
+        with open(tmp_pfad, 'wb') as f:
+            f.write(daten)
+        os.replace(tmp_pfad, pfad)
+
+        self.aufnehmen(digest, len(daten))
+        return pfad
+
+    def aufnehmen(self, digest: str, size: int) -> None:
+        """
+        Nimmt eine bereits unter self.pfad(digest) liegende Datei in den Index auf.
+        """
+        with self._lock:
+            if digest in self._eintraege:
+                self._gesamt -= self._eintraege.pop(digest)
+            self._eintraege[digest] = size
+            self._gesamt += size
+            self._verdraengen(behalten=digest)
+
+    def uebernehmen(self, digest: str, quelle: str) -> str:
+        """
+        Verschiebt eine fertig empfangene Datei (z.B. aus dem Staging-Bereich)
+        unter ihrem Hash in den Speicher.
+
+        Raises:
+            ValueError: Wenn der Hash nicht zum Dateiinhalt passt
+        """
+        if datei_hash(quelle) != digest:
+            raise ValueError("Hash passt nicht zum Dateiinhalt")
+
+        pfad = self.pfad(digest)
+        size = os.path.getsize(quelle)
+        os.replace(quelle, pfad)
+        self.aufnehmen(digest, size)
+        return pfad
+
+    def _verdraengen(self, behalten: str) -> None:
+        """
+        Löscht die ältesten Bilder, bis das Größenlimit eingehalten ist.
+        Muss mit gehaltenem Lock aufgerufen werden.
+        """
+        while self._gesamt > self.max_bytes and len(self._eintraege) > 1:
+            digest, size = next(iter(self._eintraege.items()))
+            if digest == behalten:
+                break
+            del self._eintraege[digest]
+            self._gesamt -= size
+            try:
+                os.remove(self.pfad(digest))
+            except OSError:
+                pass
+            log.info("Bild aus Cache verdrängt: %s… (%s Bytes)", digest[:12], size)
+
+    def belegt(self) -> int:
+        """
+        Liefert die aktuell belegten Bytes.
+        """
+        with self._lock:
+            return self._gesamt
+
+
+class StagingBereich:
+    """
+    Ablage für teilweise empfangene Chunk-Übertragungen.
+
+    Pro Transfer-ID gibt es '<id>.part' (bestätigte Daten) und '<id>.meta'
+    (Sender, Größe, Hash). Der bestätigte Offset ist die Größe der .part-Datei,
+    da nur geprüfte Chunks angehängt werden. Dateien, die länger als timeout
+    Sekunden nicht verändert wurden, werden gelöscht.
+    """
+
+    def __init__(self, verzeichnis: str, timeout: float = 3600.0):
+        """
+        Args:
+            verzeichnis: Staging-Verzeichnis
+            timeout: Sekunden ohne Fortschritt, nach denen Teildateien gelöscht werden
+        """
+        self.verzeichnis = verzeichnis
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._frei = threading.Condition(self._lock)
+        self._aktiv = {}  # Transfer-ID -> (ip, abbrechen) der empfangenden Verbindung
+
+        os.makedirs(verzeichnis, exist_ok=True)
+        self.aufraeumen()
+
+    def _pfade(self, tid: str) -> tuple:
+        basis = os.path.join(self.verzeichnis, tid)
+        return basis + ".part", basis + ".meta"
+
+    def oeffnen(self, tid: str, sender: str, size: int, digest: str, ip: str = None,
+                abbrechen=None, warten: float = 5.0) -> int:
+        """
+        Beginnt oder setzt eine Übertragung fort.
+
+        Wird die Übertragung noch von einer alten Verbindung derselben IP
+        empfangen (z.B. halboffen nach einem Verbindungsabbruch), übernimmt
+        die neue: Die alte wird über ihr abbrechen() beendet und bis zu
+        warten Sekunden auf ihr schliessen() gewartet.
+
+        Args:
+            ip: IP-Adresse des Senders
+            abbrechen: Callback, der die empfangende Verbindung beendet
+
+        Returns:
+            Bestätigter Offset, ab dem der Sender weitersenden soll,
+            oder -1, wenn die Übertragung weiter von einer anderen
+            Verbindung empfangen wird.
+        """
+        with self._lock:
+            alt = self._aktiv.get(tid)
+            if alt is not None:
+                alt_ip, alt_abbrechen = alt
+                if alt_ip != ip or alt_abbrechen is None:
+                    return -1
+                log.info("Übertragung %s: neue Verbindung übernimmt", tid[:8])
+                alt_abbrechen()
+                if not self._frei.wait_for(lambda: tid not in self._aktiv, warten):
+                    return -1
+            self._aktiv[tid] = (ip, abbrechen)
+
+        self.aufraeumen()
+        part_pfad, meta_pfad = self._pfade(tid)
+        meta = {"sender": sender, "size": size, "hash": digest}
+
+        try:
+            with open(meta_pfad, 'r') as f:
+                alt = json.load(f)
+        except (OSError, ValueError):
+            alt = None
+
+        if alt == meta and os.path.exists(part_pfad):
+            offset = os.path.getsize(part_pfad)
+            if offset <= size:
+                return offset
+
+        # Neue Übertragung (oder Metadaten passen nicht mehr): von vorn
+        with open(meta_pfad, 'w') as f:
+            json.dump(meta, f)
+        open(part_pfad, 'wb').close()
+        return 0
+
+    def anhaengen(self, tid: str, offset: int, daten: bytes) -> int:
+        """
+        Hängt einen geprüften Chunk an und liefert den neuen bestätigten Offset.
+
+        Raises:
+            ValueError: Wenn offset nicht an die bereits gespeicherten Daten anschließt
+        """
+        part_pfad, _ = self._pfade(tid)
+        with open(part_pfad, 'ab') as f:
+            if f.tell() != offset:
+                raise ValueError(f"Offset {offset} passt nicht zu {f.tell()} gespeicherten Bytes")
+            f.write(daten)
+            f.flush()
+            return f.tell()
+
+    def temp_datei(self) -> str:
+        """
+        Liefert einen neuen, eindeutigen Pfad für eine nicht fortsetzbare
+        Übertragung (klassisches IMG). Reste werden wie Teildateien von
+        aufraeumen() entfernt.
+        """
+        name = f"img-{os.getpid()}-{threading.get_ident()}-{time.time_ns()}.tmp"
+        return os.path.join(self.verzeichnis, name)
+
+    def teildatei(self, tid: str) -> str:
+        """
+        Liefert den Pfad der Teildatei einer Übertragung.
+        """
+        return self._pfade(tid)[0]
+
+    def schliessen(self, tid: str, verwerfen: bool = False) -> None:
+        """
+        Beendet den Empfang einer Übertragung. Bei verwerfen=True (oder nach
+        erfolgreicher Übernahme in den Bildspeicher) werden die Dateien gelöscht.
+        """
+        if verwerfen:
+            for pfad in self._pfade(tid):
+                try:
+                    os.remove(pfad)
+                except OSError:
+                    pass
+        with self._lock:
+            self._aktiv.pop(tid, None)
+            self._frei.notify_all()
+
+    def aufraeumen(self) -> None:
+        """
+        Löscht Teildateien, die länger als timeout nicht verändert wurden.
+        """
+        grenze = time.time() - self.timeout
+        for name in os.listdir(self.verzeichnis):
+            tid = os.path.splitext(name)[0]
+            with self._lock:
+                if tid in self._aktiv:
+                    continue
+            pfad = os.path.join(self.verzeichnis, name)
+            try:
+                if os.path.getmtime(pfad) < grenze:
+                    os.remove(pfad)
+                    log.info("Veraltete Teilübertragung gelöscht: %s", name)
+            except OSError:
+                pass
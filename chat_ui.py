@@ -10,8 +10,14 @@ import toml
 import os
 import sys
 import queue
+import itertools
+import threading
+import time
 from multiprocessing import Queue
-from netzwerk import send_msg, send_img
+
+from peerregister import PeerRegister
+import schnappschuss
+import slcp
 
 ## \class ChatClientUI
 #  \brief Diese Klasse stellt die textbasierte Benutzeroberfläche und Netzwerklogik bereit.
@@ -27,7 +33,9 @@ class ChatClientUI:
             "port": 5000,
             "whoisport": 4000,
             "autoreply": "Ich bin gerade nicht da.",
-            "imagepath": "./images"
+            "imagepath": "./images",
+            "imagecache_mb": 512,
+            "staging_timeout": 3600
         }
         # Config laden oder erzeugen
         if not os.path.exists(self.CONFIG_FILE):
@@ -53,7 +61,11 @@ class ChatClientUI:
         self.config["handle"] = new_handle
         self.save_config(self.config)
 
-        self.peers = {}  # Peer-Liste: handle -> (ip, port)
+        self.peers = PeerRegister()  # Peer-Liste: handle -> PeerEintrag(ip, port)
+        self.lade_peers()
+        self.raeume = []  # Betretene Räume in Beitrittsreihenfolge
+        self.aktiver_raum = None  # Ziel für Nachrichten ohne '/', None = alle
+        self.auftrag_ids = itertools.count(1)  # IDs für MSG/IMG-Aufträge an den Netzwerk-Prozess
 
     def load_config(self):
         if not os.path.exists(self.CONFIG_FILE):
@@ -65,6 +77,52 @@ class ChatClientUI:
         with open(self.CONFIG_FILE, "w") as f:
             toml.dump(config, f)
 
+    ## \brief Lädt die Peer-Liste der letzten Sitzung als vorläufige Einträge.
+    #  Nicht erreichbare Peers werden im Hintergrund wieder entfernt.
+    def lade_peers(self):
+        pfad = self.config.get("peer_snapshot", ".peers.json")
+        if not pfad:
+            return
+        teilnehmer, _, _ = schnappschuss.laden(pfad)
+        for t in teilnehmer:
+            self.peers.eintragen(t.handle, t.ip, t.port)
+        if teilnehmer:
+            print(f"{len(teilnehmer)} Teilnehmer aus der letzten Sitzung übernommen (vorläufig).")
+            threading.Thread(target=self.pruefe_peers, args=(self.peers.schnappschuss(),), daemon=True).start()
+
+    ## \brief Entfernt vorläufige Peers, deren Chat-Port nicht erreichbar ist.
+    #  \param vorlaeufig Einträge (PeerEintrag) der geladenen Peers.
+    def pruefe_peers(self, vorlaeufig):
+        for eintrag in vorlaeufig:
+            # Inzwischen per WHO neu gemeldete Peers (neuer Eintrag) bleiben erhalten
+            if not schnappschuss.erreichbar(eintrag.ip, eintrag.port) and self.peers.get(eintrag.handle) is eintrag:
+                self.peers.entfernen(eintrag.handle)
+
+    ## \brief Speichert die aktuelle Peer-Liste für den nächsten Start.
+    def speichere_peers(self):
+        pfad = self.config.get("peer_snapshot", ".peers.json")
+        if not pfad:
+            return
+        try:
+            schnappschuss.speichern(pfad, ((e.handle, e.ip, e.port) for e in self.peers))
+        except OSError as e:
+            print(f"[WARNUNG] Peer-Liste nicht gespeichert: {e}")
+
+    ## \brief Speichert die Peer-Liste alle snapshot_intervall Sekunden (Hintergrund-Thread).
+    def peers_sichern_loop(self):
+        intervall = self.config.get("snapshot_intervall", 30)
+        while True:
+            time.sleep(intervall)
+            self.speichere_peers()
+
+    ## \brief Adresse eines Peers für MSG/IMG-Aufträge.
+    #  \param handle Handle des Empfängers.
+    #  \return (ip, port) aus der Peer-Liste, sonst (None, None): Der Netzwerk-Prozess
+    #          löst den Handle dann über die Tabelle des lokalen Discovery-Prozesses auf.
+    def adresse(self, handle):
+        eintrag = self.peers.get(handle)
+        return eintrag.adresse if eintrag is not None else (None, None)
+
     ## \brief Ändert die Konfiguration über Benutzereingabe (außer whoisport).
     def change_config(self):
         print("\n--- Konfiguration ändern ---")
@@ -83,8 +141,10 @@ class ChatClientUI:
         """
         Startet die Chat-Schleife:
          - Anzeige eingehender Nachrichten und Discovery-Events aus net_to_ui
-         - Befehle: /help, /who, /msg <Handle> <Text>, /img <Handle> <Bildpfad>, /config, /quit
-         - Nachrichten ohne '/' werden als Broadcast via ui_to_net gesendet
+         - Befehle: /help, /who [#raum], /msg <Handle> <Text>, /img <Handle> <Bildpfad>,
+           /join #raum, /part #raum, /stats, /config, /quit
+         - Nachrichten ohne '/' werden als Broadcast via ui_to_net gesendet,
+           nach /join nur an die Mitglieder des aktiven Raums
         """
         handle = self.config["handle"]
         port = self.config["port"]
@@ -93,119 +153,170 @@ class ChatClientUI:
         print(f"Willkommen, {handle}! (Chat-Port: {port})")
         print("Gib '/help' für Befehle ein. Nachrichten ohne '/' werden broadcastet.")
 
-        while True:
-            # Anzeigen aller eingehenden Nachrichten und Events
-            try:
-                while True:
-                    msg = net_to_ui.get_nowait()
+        # Peer-Liste regelmäßig sichern (wie der Discovery-Schnappschuss), nicht nur bei WHO-Antworten
+        if self.config.get("peer_snapshot", ".peers.json"):
+            threading.Thread(target=self.peers_sichern_loop, daemon=True).start()
+
+        try:
+            while True:
+                # Anzeigen aller eingehenden Nachrichten und Events
+                try:
+                    while True:
+                        msg = net_to_ui.get_nowait()
                     
-                    # Discovery-Event: Fülle Peer-Liste bei WHO-Reply
-                    if msg.startswith("[WHO-REPLY]"):
-                        reply_content = msg[11:].strip()  # "[WHO-REPLY] " entfernen
+                        # Discovery-Event: Fülle Peer-Liste bei WHO-Reply
+                        if msg.startswith("[WHO-REPLY]"):
+                            reply_content = msg[11:].strip()  # "[WHO-REPLY] " entfernen
                         
-                        if reply_content and not reply_content.startswith("Keine") and not reply_content.startswith("Fehler"):
-                            # Format: "Alice 192.168.1.5 5000;Bob 192.168.1.6 5001"
-                            self.peers.clear()
+                            if reply_content and not reply_content.startswith("Keine") and not reply_content.startswith("Fehler"):
+                                # Format: "Alice 192.168.1.5 5000;Bob 192.168.1.6 5001"
+                                try:
+                                    teilnehmer = slcp.parse_peerliste(reply_content)
+                                except slcp.SlcpFehler as e:
+                                    print(f"[WARNUNG] Ungültige Teilnehmerliste: {e}")
+                                    teilnehmer = ()
                             
-                            for entry in reply_content.split(';'):
-                                entry = entry.strip()
-                                if entry:
-                                    parts = entry.split()
-                                    if len(parts) >= 3:
-                                        h, ip, p = parts[0], parts[1], parts[2]
-                                        try:
-                                            self.peers[h] = (ip, int(p))
-                                        except ValueError:
-                                            print(f"[WARNUNG] Ungültiger Port für {h}: {p}")
+                                self.peers.leeren()
+                                for t in teilnehmer:
+                                    self.peers.eintragen(t.handle, t.ip, t.port)
+                                self.speichere_peers()
                             
-                            if self.peers:
-                                peer_names = list(self.peers.keys())
-                                print(f"Teilnehmer im Netzwerk ({len(peer_names)}): {', '.join(peer_names)}")
+                                if self.peers:
+                                    # Peer-Zustand aus dem Netzwerk-Prozess mit anzeigen (OK:12ms, TOT, ...)
+                                    peer_names = [f"{t.handle} [{t.status}]" if t.status else t.handle for t in teilnehmer]
+                                    print(f"Teilnehmer im Netzwerk ({len(peer_names)}): {', '.join(peer_names)}")
+                                else:
+                                    print("Keine anderen Teilnehmer im Netzwerk gefunden.")
                             else:
                                 print("Keine anderen Teilnehmer im Netzwerk gefunden.")
+                        elif msg.startswith("[RAUM-REPLY "):
+                            # Mitglieder eines Raums: "[RAUM-REPLY #raum] <Peer-Liste>"
+                            raum, _, reply_content = msg[12:].partition("] ")
+                            try:
+                                teilnehmer = slcp.parse_peerliste(reply_content)
+                            except slcp.SlcpFehler:
+                                teilnehmer = ()
+                            if teilnehmer:
+                                # Mitglieder sind auch per /msg und /img erreichbar
+                                for t in teilnehmer:
+                                    self.peers.eintragen(t.handle, t.ip, t.port)
+                                self.speichere_peers()
+                                namen = [f"{t.handle} [{t.status}]" if t.status else t.handle for t in teilnehmer]
+                                print(f"Mitglieder von {raum} ({len(namen)}): {', '.join(namen)}")
+                            else:
+                                print(f"Keine anderen Mitglieder in {raum} gefunden.")
                         else:
-                            print("Keine anderen Teilnehmer im Netzwerk gefunden.")
-                    else:
-                        # Normale Nachricht anzeigen
-                        print(msg)
+                            # Normale Nachricht anzeigen
+                            print(msg)
                         
-            except queue.Empty:
-                pass
-
-            # Eingabe
-            text = input("> ").strip()
-            if not text:
-                continue
-
-            if text.startswith("/"):
-                parts = text.split(maxsplit=2)
-                cmd = parts[0]
-
-                if cmd == "/help":
-                    print("Befehle:")
-                    print(" /who     - Teilnehmerliste abfragen")
-                    print(" /msg <Handle> <Nachricht> - Direktnachricht senden")
-                    print(" /img <Handle> <Bildpfad>  - Bild an Benutzer senden")
-                    print(" /config  - Konfiguration ändern")
-                    print(" /quit    - Chat beenden")
-
-                elif cmd == "/who":
-                    # Discovery Anfrage über Queue
-                    print("Suche nach anderen Teilnehmern...")
-                    ui_to_net.put("WHO")
-
-                elif cmd == "/msg":
-                    if len(parts) < 3:
-                        print("Nutzung: /msg <Handle> <Nachricht>")
-                    else:
-                        _, target, message = parts
-                        if target not in self.peers:
-                            print(f"Unbekannter Peer: {target}. Verwende '/who' um verfügbare Teilnehmer zu finden.")
-                        else:
-                            ip, p = self.peers[target]
+                except queue.Empty:
+                    pass
+
+                # Eingabe
+                text = input("> ").strip()
+                if not text:
+                    continue
+
+                if text.startswith("/"):
+                    parts = text.split(maxsplit=2)
+                    cmd = parts[0]
+
+                    if cmd == "/help":
+                        print("Befehle:")
+                        print(" /who     - Teilnehmerliste abfragen")
+                        print(" /who #raum   - Mitglieder eines Raums abfragen")
+                        print(" /join #raum  - Raum betreten (Nachrichten gehen dann nur dorthin)")
+                        print(" /part #raum  - Raum verlassen")
+                        print(" /msg <Handle> <Nachricht> - Direktnachricht senden")
+                        print(" /img <Handle> <Bildpfad>  - Bild an Benutzer senden")
+                        print(" /stats   - Netzwerk-Statistik anzeigen")
+                        print(" /config  - Konfiguration ändern")
+                        print(" /quit    - Chat beenden")
+
+                    elif cmd == "/who":
+                        # Discovery Anfrage über Queue
+                        if len(parts) > 1:
                             try:
-                                send_msg(handle, message, ip, p)
-                                print(f"[Du -> {target}] {message}")
-                            except Exception as e:
-                                print(f"Fehler beim Senden an {target}: {e}")
-
-                elif cmd == "/img":
-                    if len(parts) < 3:
-                        print("Nutzung: /img <Handle> <Bildpfad>")
-                        print("Beispiel: /img Alice ./bild.jpg")
-                    else:
-                        _, target, image_path = parts
-                        if target not in self.peers:
-                            print(f"Unbekannter Peer: {target}. Verwende '/who' um verfügbare Teilnehmer zu finden.")
+                                slcp.pruefe_raum(parts[1])
+                            except slcp.SlcpFehler:
+                                print("Nutzung: /who [#raum]")
+                                continue
+                            print(f"Suche nach Mitgliedern von {parts[1]}...")
+                            ui_to_net.put(("WHO", parts[1]))
+                        else:
+                            print("Suche nach anderen Teilnehmern...")
+                            ui_to_net.put(("WHO", ""))
+
+                    elif cmd in ("/join", "/part"):
+                        raum = parts[1] if len(parts) > 1 else ""
+                        try:
+                            slcp.pruefe_raum(raum)
+                        except slcp.SlcpFehler:
+                            print(f"Nutzung: {cmd} #raum")
+                            continue
+                        if cmd == "/join":
+                            if raum not in self.raeume:
+                                self.raeume.append(raum)
+                                ui_to_net.put(("SUB", raum))
+                            self.aktiver_raum = raum
+                            print(f"Aktiver Raum: {raum}. Nachrichten ohne '/' gehen nur an dessen Mitglieder.")
+                        elif raum not in self.raeume:
+                            print(f"Du bist nicht in {raum}.")
+                        else:
+                            self.raeume.remove(raum)
+                            ui_to_net.put(("UNSUB", raum))
+                            if self.aktiver_raum == raum:
+                                self.aktiver_raum = self.raeume[-1] if self.raeume else None
+                            ziel = self.aktiver_raum or "alle Teilnehmer"
+                            print(f"{raum} verlassen. Nachrichten ohne '/' gehen an {ziel}.")
+
+                    elif cmd == "/msg":
+                        if len(parts) < 3:
+                            print("Nutzung: /msg <Handle> <Nachricht>")
+                        else:
+                            _, target, message = parts
+                            # Versand als Auftrag im Netzwerk-Prozess, Ergebnis kommt über net_to_ui
+                            ip, p = self.adresse(target)
+                            ui_to_net.put(("MSG", next(self.auftrag_ids), target, ip, p, message))
+
+                    elif cmd == "/img":
+                        if len(parts) < 3:
+                            print("Nutzung: /img <Handle> <Bildpfad>")
+                            print("Beispiel: /img Alice ./bild.jpg")
                         else:
+                            _, target, image_path = parts
                             # Bildpfad validieren
                             if not os.path.exists(image_path):
                                 print(f"Bilddatei nicht gefunden: {image_path}")
                             else:
-                                ip, p = self.peers[target]
-                                try:
-                                    success = send_img(handle, image_path, ip, p)
-                                    if success:
-                                        print(f"[📷 Du -> {target}] Bild gesendet: {os.path.basename(image_path)}")
-                                    else:
-                                        print(f"Fehler beim Senden des Bildes an {target}")
-                                except Exception as e:
-                                    print(f"Fehler beim Senden des Bildes an {target}: {e}")
-
-                elif cmd == "/config":
-                    self.change_config()
-
-                elif cmd == "/quit":
-                    print("Beende Chat-Client…")
-                    # Sende LEAVE-Nachricht
-                    ui_to_net.put("QUIT")
-                    sys.exit(0)
+                                ip, p = self.adresse(target)
+                                auftrag_id = next(self.auftrag_ids)
+                                ui_to_net.put(("IMG", auftrag_id, target, ip, p, os.path.abspath(image_path)))
+                                print(f"[AUFTRAG {auftrag_id}] Sende Bild {os.path.basename(image_path)} an {target}...")
+
+                    elif cmd == "/stats":
+                        ui_to_net.put(("STATS",))
+
+                    elif cmd == "/config":
+                        self.change_config()
 
+                    elif cmd == "/quit":
+                        print("Beende Chat-Client…")
+                        # Sende LEAVE-Nachricht
+                        ui_to_net.put(("QUIT",))
+                        sys.exit(0)
+
+                    else:
+                        print(f"Unbekannter Befehl: {cmd}. '/help' für Übersicht.")
                 else:
-                    print(f"Unbekannter Befehl: {cmd}. '/help' für Übersicht.")
-            else:
-                # Broadcast-Nachricht an alle über Queue
-                ui_to_net.put(text)
+                    # Broadcast-Nachricht an den aktiven Raum bzw. an alle über Queue
+                    if self.aktiver_raum:
+                        ui_to_net.put(("RAUM", self.aktiver_raum, text))
+                    else:
+                        ui_to_net.put(text)
+        finally:
+            # Auch beim Beenden (/quit, Strg+C) sichern
+            self.speichere_peers()
 
 ## \brief Startpunkt bei direktem Ausführen des Skripts
 if __name__ == "__main__":
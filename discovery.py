@@ -1,9 +1,20 @@
 import socket 
 import time
 import threading
+import itertools
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from multiprocessing import Queue
 
-def discovery_loop(whoisport: int, ui_to_net: Queue):
+import mitschnitt
+import protokollierung
+from peerregister import PeerRegister
+import schnappschuss
+import slcp
+
+log = protokollierung.logger("discovery")
+
+def discovery_loop(whoisport: int, ui_to_net: Queue, config: dict = None, lokale_abfrage=None):
     """
     Discovery-Dienst für SLCP Protokoll.
     
@@ -11,134 +22,370 @@ def discovery_loop(whoisport: int, ui_to_net: Queue):
     - JOIN <handle> <port> - Registriert neuen Teilnehmer
     - LEAVE <handle> - Entfernt Teilnehmer  
     - WHO - Sendet Liste aller bekannten Teilnehmer zurück
+    - SUB/UNSUB <handle> <#raum> - Trägt Teilnehmer in einen Raum ein bzw. aus
+    - WHO <#raum> - Sendet nur die Mitglieder des Raums zurück
     
     Args:
         whoisport: Port für Discovery-Kommunikation (normalerweise 4000)
-        ui_to_net: Queue für Kommunikation mit UI (wird hier nicht verwendet)
+        ui_to_net: Eingangs-Queue des Netzwerk-Prozesses; neue bzw. zurückkehrende
+                   Teilnehmer werden dort als ("BEITRITT", handle, ip, port)
+                   gemeldet (Postausgang nachliefern)
+        config: Konfiguration aus config.toml ([logging], discovery_snapshot,
+                snapshot_intervall, mitschnitt_discovery, heartbeat)
+        lokale_abfrage: Optionaler LokaleAbfrage-Kanal, über den der Netzwerk-Prozess
+                        die Tabelle direkt liest (ohne WHO-Broadcast ins LAN)
     """
+    config = config or {}
+    protokollierung.einrichten(config)
     
-    teilnehmer = {}  # Dictionary für Teilnehmer: handle -> (IP, Port, letzter_heartbeat)
+    teilnehmer = PeerRegister()  # handle -> PeerEintrag(ip, port, zuletzt), Index auch nach (ip, port)
+    kanaele = RaumIndex()  # raum -> Handles, von mehreren Threads gelesen
+    vorlaeufig = set()  # Aus dem Schnappschuss geladen, noch nicht bestätigt
+    
+    # Warmstart: letzte Tabelle als vorläufige Einträge übernehmen
+    snapshot_pfad = config.get("discovery_snapshot", ".discovery.json")
+    if snapshot_pfad:
+        geladen, raeume, zeit = schnappschuss.laden(snapshot_pfad)
+        kanaele = RaumIndex(raeume)
+        for t in geladen:
+            teilnehmer.eintragen(t.handle, t.ip, t.port, zeit)
+            vorlaeufig.add(t.handle)
+        if geladen:
+            log.info("%s Teilnehmer aus Schnappschuss geladen (vorläufig)", len(geladen))
+    heartbeat_s = config.get("heartbeat", 60)  # JOIN-Intervall der Clients
     PORT = whoisport  # Port für den Discovery-Dienst laut SLCP-Spezifikation
     MaxBytes = 1024   # Maximale Größe für empfangene Nachrichten
     
-    print(f"[DISCOVERY] Starte Discovery-Dienst auf Port {PORT}")
+    log.info("Starte Discovery-Dienst auf Port %s", PORT)
     
     # UDP-Socket erstellen und konfigurieren
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
     
+    # Optionaler Mitschnitt aller empfangenen und gesendeten Nachrichten (für bench_replay.py)
+    trace = None
+    if config.get("mitschnitt_discovery"):
+        trace = mitschnitt.starten(config["mitschnitt_discovery"])
+        log.info("Mitschnitt nach %s", trace.pfad)
+    
+    def antworten(antwort: bytes, addresse: tuple) -> None:
+        sock.sendto(antwort, addresse)
+        if trace is not None:
+            trace.aufzeichnen(mitschnitt.AUS, mitschnitt.UDP, addresse, antwort)
+    
     try:
         # Socket binden - auf allen Interfaces lauschen
         sock.bind(('', PORT))
         
         # Cleanup-Thread für veraltete Einträge starten
-        cleanup_thread = threading.Thread(target=cleanup_old_participants, args=(teilnehmer,), daemon=True)
+        cleanup_thread = threading.Thread(target=cleanup_old_participants, args=(teilnehmer, kanaele), daemon=True)
         cleanup_thread.start()
         
+        # Lokale Abfragen des Netzwerk-Prozesses direkt aus der Tabelle beantworten
+        if lokale_abfrage is not None:
+            threading.Thread(target=lokale_abfrage.bedienen, args=(teilnehmer, kanaele), daemon=True).start()
+        
+        # Vorläufige Einträge im Hintergrund prüfen, Tabelle regelmäßig sichern
+        if snapshot_pfad:
+            threading.Thread(
+                target=schnappschuss_loop,
+                args=(snapshot_pfad, teilnehmer, kanaele, vorlaeufig, config.get("snapshot_intervall", 30)),
+                daemon=True,
+            ).start()
+        
         # Hauptschleife für eingehende Nachrichten
         while True:
             try:
                 # Empfang der Daten vom Netzwerk
                 daten, addresse = sock.recvfrom(MaxBytes)
-                nachricht = daten.decode("utf-8").strip()
                 sender_ip = addresse[0]
+                if trace is not None:
+                    trace.aufzeichnen(mitschnitt.EIN, mitschnitt.UDP, addresse, daten)
                 
-                
-                # Nachricht parsen und verarbeiten
-                teile = nachricht.split()
-                if not teile:
+                # Nachricht einmalig in einen typisierten Datensatz parsen
+                try:
+                    nachricht = slcp.parse_discovery(daten)
+                except slcp.SlcpFehler as e:
+                    # Auf Fehler- und ACK-Antworten nicht antworten (sonst Ping-Pong zwischen Diensten)
+                    if daten.strip() and not daten.startswith((b"ERROR", b"JOIN_ACK", b"LEAVE_ACK")):
+                        log.warning("Ungültige Nachricht: %s", e)
+                        antwort = "ERROR: Unbekannter Befehl"
+                        antworten(antwort.encode("utf-8"), addresse)
                     continue
-                    
-                befehl = teile[0].upper()
                 
-                if befehl == "JOIN" and len(teile) >= 3:
+                if isinstance(nachricht, slcp.Join):
                     # JOIN <handle> <port>
-                    handle = teile[1]
-                    try:
-                        client_port = int(teile[2])
-                        # Teilnehmer registrieren mit aktuellem Zeitstempel
-                        teilnehmer[handle] = (sender_ip, client_port, time.time())
-                        print(f"[DISCOVERY] Teilnehmer registriert: {handle} @ {sender_ip}:{client_port}")
-                        
-                        # Bestätigung senden (optional, nicht im Protokoll spezifiziert)
-                        antwort = f"JOIN_ACK {handle}"
-                        sock.sendto(antwort.encode("utf-8"), addresse)
-                        
-                    except ValueError:
-                        print(f"[DISCOVERY] Ungültiger Port in JOIN: {nachricht}")
+                    # Teilnehmer registrieren mit aktuellem Zeitstempel
+                    vorher = teilnehmer.get(nachricht.handle)
+                    zuletzt = vorher.zuletzt if vorher is not None else 0.0
+                    eintrag = teilnehmer.eintragen(nachricht.handle, sender_ip, nachricht.port)
+                    # Nur neue, zurückkehrende (verstummt, neue Adresse, aus dem Schnappschuss)
+                    # Teilnehmer melden, nicht jeden Heartbeat
+                    zurueck = (eintrag is not vorher or nachricht.handle in vorlaeufig
+                               or not heartbeat_s or eintrag.zuletzt - zuletzt > 1.5 * heartbeat_s)
+                    vorlaeufig.discard(nachricht.handle)
+                    if zurueck and ui_to_net is not None:
+                        ui_to_net.put(("BEITRITT", nachricht.handle, sender_ip, nachricht.port))
+                    log.info("Teilnehmer registriert", extra=protokollierung.felder(
+                        handle=nachricht.handle, ip=sender_ip, port=nachricht.port))
+                    
+                    # Bestätigung senden (optional, nicht im Protokoll spezifiziert)
+                    antwort = f"JOIN_ACK {nachricht.handle}"
+                    antworten(antwort.encode("utf-8"), addresse)
                 
-                elif befehl == "LEAVE" and len(teile) >= 2:
+                elif isinstance(nachricht, slcp.Leave):
                     # LEAVE <handle>
-                    handle = teile[1]
-                    if handle in teilnehmer:
-                        del teilnehmer[handle]
-                        print(f"[DISCOVERY] Teilnehmer abgemeldet: {handle}")
+                    handle = nachricht.handle
+                    if teilnehmer.entfernen(handle) is not None:
+                        kanaele.alle_verlassen(handle)
+                        log.info("Teilnehmer abgemeldet: %s", handle)
                         
                         # Bestätigung senden
                         antwort = f"LEAVE_ACK {handle}"
-                        sock.sendto(antwort.encode("utf-8"), addresse)
+                        antworten(antwort.encode("utf-8"), addresse)
                     else:
-                        print(f"[DISCOVERY] Unbekannter Teilnehmer bei LEAVE: {handle}")
+                        log.warning("Unbekannter Teilnehmer bei LEAVE: %s", handle)
                 
-                elif befehl == "WHO":
+                elif isinstance(nachricht, slcp.Who):
                     # WHO - Teilnehmerliste zurücksenden
-                    print(f"[DISCOVERY] WHO-Anfrage von {sender_ip}, bekannte Teilnehmer: {len(teilnehmer)}")
+                    log.debug("WHO-Anfrage von %s, bekannte Teilnehmer: %s", sender_ip, len(teilnehmer))
                     
-                    if teilnehmer:
-                        # Format: KNOWUSERS <Handle1> <IP1> <Port1>, <Handle2> <IP2> <Port2>, ...
-                        teilnehmer_liste = []
-                        for handle, (ip, port, _) in teilnehmer.items():
-                            teilnehmer_liste.append(f"{handle} {ip} {port}")
-                        
-                        antwort = "KNOWUSERS " + ",".join(teilnehmer_liste)
+                    # Format: KNOWUSERS <Handle1> <IP1> <Port1>,<Handle2> <IP2> <Port2>, ...
+                    if nachricht.raum:
+                        # WHO <#raum>: nur Mitglieder des Raums (über den Index, ohne Scan);
+                        # ohne bekannte Mitglieder wird nicht geantwortet
+                        mitglieder = [teilnehmer.get(h) for h in kanaele.mitglieder(nachricht.raum)]
+                        mitglieder = [e for e in mitglieder if e is not None]
+                        if not mitglieder:
+                            continue
+                        antwort = slcp.encode_knowusers((e.handle, e.ip, e.port) for e in mitglieder)
                     else:
-                        antwort = "KNOWUSERS"
+                        antwort = slcp.encode_knowusers((e.handle, e.ip, e.port) for e in teilnehmer)
                     
-                    print(f"[DISCOVERY] Sende Antwort: {antwort}")
-                    sock.sendto(antwort.encode("utf-8"), addresse)
+                    log.debug("Sende Antwort: %s", protokollierung.roh(antwort))
+                    antworten(antwort, addresse)
                 
-                else:
-                    print(f"[DISCOVERY] Unbekannter Befehl: {nachricht}")
-                    antwort = "ERROR: Unbekannter Befehl"
-                    sock.sendto(antwort.encode("utf-8"), addresse)
+                elif isinstance(nachricht, slcp.Sub):
+                    # SUB <handle> <#raum>
+                    kanaele.betreten(nachricht.raum, nachricht.handle)
+                    log.info("%s betritt %s", nachricht.handle, nachricht.raum)
+                
+                elif isinstance(nachricht, slcp.Unsub):
+                    # UNSUB <handle> <#raum>
+                    kanaele.verlassen(nachricht.raum, nachricht.handle)
+                    log.info("%s verlässt %s", nachricht.handle, nachricht.raum)
+                
+                # KNOWUSERS-Antworten anderer Discovery-Dienste werden hier ignoriert
                     
-            except UnicodeDecodeError:
-                print("[DISCOVERY] Fehler beim Dekodieren der Nachricht")
             except Exception as e:
-                print(f"[DISCOVERY] Fehler beim Verarbeiten der Nachricht: {e}")
+                log.warning("Fehler beim Verarbeiten der Nachricht: %s", e)
                 
     except Exception as e:
-        print(f"[DISCOVERY] Kritischer Fehler: {e}")
+        log.error("Kritischer Fehler: %s", e)
     finally:
         sock.close()
-        print("[DISCOVERY] Discovery-Dienst beendet")
+        if trace is not None:
+            trace.schliessen()
+        if snapshot_pfad:
+            _schnappschuss_speichern(snapshot_pfad, teilnehmer, kanaele)
+        log.info("Discovery-Dienst beendet")
+        protokollierung.beenden()
 
 
-def cleanup_old_participants(teilnehmer: dict, max_age: int = 300):
+class LokaleAbfrage:
+    """
+    Anfrage/Antwort-Kanal zwischen Netzwerk- und Discovery-Prozess desselben
+    Clients. Der Discovery-Prozess kennt durch die JOIN-Broadcasts bereits alle
+    Teilnehmer; der Netzwerk-Prozess liest die Tabelle darüber lokal, statt
+    jedes Mal WHO ins LAN zu senden und auf Antworten zu warten.
+
+    Anfrage:  (anfrage_id, raum)         - raum "" = alle Teilnehmer
+    Antwort:  (anfrage_id, [(handle, ip, port), ...])
+
+    Die Antwort für alle Teilnehmer wird pro Registerversion nur einmal gebildet.
+    """
+
+    def __init__(self, queue_klasse=Queue):
+        """
+        Args:
+            queue_klasse: multiprocessing.Queue (Standard) oder queue.Queue, wenn
+                          beide Seiten als Threads in einem Prozess laufen
+        """
+        self.anfragen = queue_klasse()
+        self.antworten = queue_klasse()
+        self._init_lokal()
+
+    def _init_lokal(self):
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Nur die Queues gehen an den Kindprozess, Lock und IDs sind prozesslokal
+        return {"anfragen": self.anfragen, "antworten": self.antworten}
+
+    def __setstate__(self, zustand):
+        self.__dict__.update(zustand)
+        self._init_lokal()
+
+    def abfragen(self, raum: str = "", timeout: float = 0.2):
+        """
+        Fragt die Tabelle des lokalen Discovery-Prozesses ab (Netzwerk-Prozess).
+
+        Returns:
+            PeerRegister oder None, wenn keine Antwort kam
+        """
+        with self._lock:
+            anfrage_id = next(self._ids)
+            self.anfragen.put((anfrage_id, raum))
+            ende = time.monotonic() + timeout
+            while True:
+                rest = ende - time.monotonic()
+                try:
+                    if rest <= 0:
+                        raise queue.Empty
+                    antwort_id, eintraege = self.antworten.get(timeout=rest)
+                except queue.Empty:
+                    return None
+                if antwort_id == anfrage_id:  # Verspätete Antworten älterer Anfragen verwerfen
+                    return PeerRegister(eintraege)
+
+    def bedienen(self, teilnehmer: PeerRegister, kanaele: "RaumIndex") -> None:
+        """
+        Beantwortet Anfragen aus der Teilnehmertabelle (Thread im Discovery-Prozess).
+        """
+        alle, alle_version = [], -1
+        while True:
+            try:
+                anfrage_id, raum = self.anfragen.get()
+                if raum:
+                    eintraege = [teilnehmer.get(h) for h in kanaele.mitglieder(raum)]
+                    eintraege = [(e.handle, e.ip, e.port) for e in eintraege if e is not None]
+                else:
+                    if alle_version != teilnehmer.version:
+                        alle_version = teilnehmer.version
+                        alle = [(e.handle, e.ip, e.port) for e in teilnehmer]
+                    eintraege = alle
+                self.antworten.put((anfrage_id, eintraege))
+            except Exception as e:
+                log.warning("Fehler bei lokaler Abfrage: %s", e)
+
+
+class RaumIndex:
+    """
+    Thread-sicherer Raum-Index raum -> set(handle). Hauptschleife, Cleanup,
+    lokale Abfragen und Schnappschuss greifen gleichzeitig darauf zu; Leser
+    erhalten deshalb immer Kopien.
+    """
+
+    def __init__(self, raeume: dict = None):
+        """
+        Args:
+            raeume: Optionaler Anfangsbestand raum -> Iterable von Handles
+        """
+        self._lock = threading.Lock()
+        self._raeume = {raum: set(mitglieder) for raum, mitglieder in (raeume or {}).items() if mitglieder}
+
+    def betreten(self, raum: str, handle: str) -> None:
+        with self._lock:
+            self._raeume.setdefault(raum, set()).add(handle)
+
+    def verlassen(self, raum: str, handle: str) -> None:
+        with self._lock:
+            mitglieder = self._raeume.get(raum)
+            if mitglieder is not None:
+                mitglieder.discard(handle)
+                if not mitglieder:
+                    del self._raeume[raum]
+
+    def alle_verlassen(self, handle: str) -> None:
+        """
+        Entfernt handle aus allen Räumen; leere Räume werden gelöscht.
+        """
+        with self._lock:
+            for raum in [r for r, mitglieder in self._raeume.items() if handle in mitglieder]:
+                self._raeume[raum].discard(handle)
+                if not self._raeume[raum]:
+                    del self._raeume[raum]
+
+    def mitglieder(self, raum: str) -> list:
+        with self._lock:
+            return list(self._raeume.get(raum, ()))
+
+    def als_dict(self) -> dict:
+        """
+        Returns:
+            Kopie raum -> Liste der Handles (z.B. für den Schnappschuss)
+        """
+        with self._lock:
+            return {raum: list(mitglieder) for raum, mitglieder in self._raeume.items()}
+
+
+def schnappschuss_loop(pfad: str, teilnehmer: PeerRegister, kanaele: RaumIndex, vorlaeufig: set, intervall: float = 30):
+    """
+    Hintergrund-Thread für den Warmstart:
+    - prüft kurz nach dem Start alle vorläufigen Einträge per Verbindungsaufbau
+      (Teilnehmer, die sich inzwischen per JOIN gemeldet haben, werden übersprungen)
+    - schreibt danach alle intervall Sekunden einen Schnappschuss der Tabelle
+    """
+    # JOINs der ersten Sekunden abwarten, sie bestätigen Einträge ohne Prüfung
+    time.sleep(min(intervall, 2.0))
+    if vorlaeufig:
+        with ThreadPoolExecutor(max_workers=16) as pruefer:
+            for handle in list(vorlaeufig):
+                pruefer.submit(_vorlaeufig_pruefen, handle, teilnehmer, kanaele, vorlaeufig)
+    
+    while True:
+        _schnappschuss_speichern(pfad, teilnehmer, kanaele)
+        time.sleep(intervall)
+
+
+def _vorlaeufig_pruefen(handle: str, teilnehmer: PeerRegister, kanaele: RaumIndex, vorlaeufig: set) -> None:
+    eintrag = teilnehmer.get(handle)
+    if eintrag is None or handle not in vorlaeufig:
+        return
+    ok = schnappschuss.erreichbar(eintrag.ip, eintrag.port)
+    if handle not in vorlaeufig:
+        return  # Inzwischen per JOIN bestätigt
+    vorlaeufig.discard(handle)
+    if ok:
+        teilnehmer.eintragen(handle, eintrag.ip, eintrag.port)
+        log.debug("Vorläufiger Teilnehmer bestätigt: %s", handle)
+    else:
+        teilnehmer.entfernen(handle)
+        kanaele.alle_verlassen(handle)
+        log.info("Vorläufiger Teilnehmer nicht erreichbar, entfernt: %s", handle)
+
+
+def _schnappschuss_speichern(pfad: str, teilnehmer: PeerRegister, kanaele: RaumIndex) -> None:
+    try:
+        schnappschuss.speichern(pfad, ((e.handle, e.ip, e.port) for e in teilnehmer), kanaele.als_dict())
+    except OSError as e:
+        log.warning("Schnappschuss %s nicht gespeichert: %s", pfad, e)
+
+
+def cleanup_old_participants(teilnehmer: PeerRegister, kanaele: RaumIndex = None, max_age: int = 300):
     """
     Cleanup-Thread: Entfernt Teilnehmer, die länger als max_age Sekunden inaktiv sind.
     
     Args:
-        teilnehmer: Dictionary der aktiven Teilnehmer
+        teilnehmer: Register der aktiven Teilnehmer
+        kanaele: Raum-Index, abgelaufene Teilnehmer werden ausgetragen
         max_age: Maximales Alter in Sekunden (Standard: 5 Minuten)
     """
     while True:
         try:
-            current_time = time.time()
-            expired_handles = []
-            
-            for handle, (ip, port, last_seen) in teilnehmer.items():
-                if current_time - last_seen > max_age:
-                    expired_handles.append(handle)
+            expired_handles = teilnehmer.abgelaufen(max_age)
             
             for handle in expired_handles:
-                del teilnehmer[handle]
-                print(f"[DISCOVERY] Teilnehmer wegen Timeout entfernt: {handle}")
+                teilnehmer.entfernen(handle)
+                if kanaele is not None:
+                    kanaele.alle_verlassen(handle)
+                log.info("Teilnehmer wegen Timeout entfernt: %s", handle)
             
             # Alle 5 minuten Sekunden aufräumen
             time.sleep(300)
             
         except Exception as e:
-            print(f"[DISCOVERY] Cleanup-Fehler: {e}")
+            log.warning("Cleanup-Fehler: %s", e)
             time.sleep(300)
\ No newline at end of file
@@ -0,0 +1,197 @@
+"""
+@file ereignispuffer.py
+@brief Begrenzter Ereignispuffer vor der net_to_ui-Queue.
+
+Die Terminal-UI leert net_to_ui nur, wenn der Benutzer Enter drückt. Damit
+eine Nachrichtenflut oder ein abwesender Benutzer den Speicher nicht
+volllaufen lässt, schreibt der Netzwerk-Prozess in diesen Puffer. Ein
+Weiterleitungs-Thread reicht die Ereignisse an die (ebenfalls begrenzte)
+net_to_ui-Queue weiter und blockiert dabei nur sich selbst.
+
+Im Puffer gilt:
+- Zustandsereignisse (WHO-/RAUM-Antworten, STATS-Zeilen, Bildfortschritt)
+  ersetzen ein noch wartendes Ereignis derselben Art
+- Läuft der Puffer über, wird das älteste Ereignis entfernt (Zustandsereignisse
+  nur, wenn sonst nichts mehr wartet). Bei Politik
+  "zusammenfassen" werden Chatnachrichten pro Absender gezählt und als
+  "[PUFFER] N weitere Nachrichten von X ausgelassen" gemeldet; bei
+  "aelteste_verwerfen" (und für alle anderen Ereignisse) nur insgesamt.
+"""
+
+import re
+import threading
+from collections import deque
+
+ZUSAMMENFASSEN = "zusammenfassen"
+AELTESTE_VERWERFEN = "aelteste_verwerfen"
+POLITIKEN = (ZUSAMMENFASSEN, AELTESTE_VERWERFEN)
+
+MAX_ABSENDER = 64  # Getrennt gezählte Absender; weitere zählen nur insgesamt
+
+_FORTSCHRITT = re.compile(r"\[AUFTRAG (\S+)\] Bild an .*: \d+% ")
+
+
+def _schluessel(zeile: str):
+    """
+    Returns:
+        Schlüssel für ersetzbare Zustandsereignisse, sonst None
+    """
+    if zeile.startswith(("[WHO-REPLY]", "[RAUM-REPLY ")):
+        return zeile.partition("]")[0]
+    if zeile.startswith("[STATS] "):
+        return zeile.partition(":")[0]
+    treffer = _FORTSCHRITT.match(zeile)
+    if treffer:
+        return f"FORTSCHRITT {treffer.group(1)}"
+    return None
+
+
+class EreignisPuffer:
+    """
+    Thread-sicherer, begrenzter Puffer mit Queue-kompatiblem put().
+    """
+
+    def __init__(self, ziel, kapazitaet: int = 1000, politik: str = ZUSAMMENFASSEN):
+        """
+        Args:
+            ziel: Nachgelagerte Queue (net_to_ui), sollte selbst begrenzt sein
+            kapazitaet: Maximale Anzahl wartender Ereignisse im Puffer
+            politik: ZUSAMMENFASSEN oder AELTESTE_VERWERFEN
+        """
+        if politik not in POLITIKEN:
+            raise ValueError(f"Unbekannte Überlaufpolitik: {politik}")
+        self.ziel = ziel
+        self.kapazitaet = kapazitaet
+        self.politik = politik
+
+        self._eintraege = deque()   # [schluessel, zeile, absender]; zeile None = ersetzt
+        self._anzahl = 0            # Nicht ersetzte Einträge
+        self._ersetzbar = {}        # schluessel -> Eintrag
+        self._ausgelassen = {}      # absender -> Anzahl entfernter Nachrichten
+        self._verworfen = 0         # Entfernte Ereignisse ohne eigenen Absenderzähler
+        self._lock = threading.Lock()
+        self._bereit = threading.Condition(self._lock)
+
+        # Metriken
+        self.max_tiefe = 0
+        self.ersetzt = 0
+        self.ausgelassen = 0
+        self.verworfen = 0
+        self.weitergereicht = 0
+
+        threading.Thread(target=self._weiterleiten, name="UI-Puffer", daemon=True).start()
+
+    def put(self, zeile: str, block: bool = True, timeout: float = None, absender: str = None) -> None:
+        """
+        Reiht ein Ereignis ein; blockiert nie (block/timeout nur für Queue-Kompatibilität).
+
+        Args:
+            absender: Handle bei Chatnachrichten (für die Zusammenfassung pro Absender)
+        """
+        with self._lock:
+            schluessel = _schluessel(zeile)
+            if schluessel is not None:
+                alt = self._ersetzbar.get(schluessel)
+                if alt is not None:
+                    alt[1] = None
+                    self._anzahl -= 1
+                    self.ersetzt += 1
+            eintrag = [schluessel, zeile, absender]
+            self._eintraege.append(eintrag)
+            self._anzahl += 1
+            if schluessel is not None:
+                self._ersetzbar[schluessel] = eintrag
+
+            while self._anzahl > self.kapazitaet:
+                self._aeltestes_entfernen()
+            if len(self._eintraege) > 2 * self.kapazitaet:
+                # Ersetzte Einträge nicht unbegrenzt mitschleppen
+                self._eintraege = deque(e for e in self._eintraege if e[1] is not None)
+            self.max_tiefe = max(self.max_tiefe, self._anzahl)
+            self._bereit.notify()
+
+    def _aeltestes_entfernen(self) -> None:
+        """
+        Entfernt das älteste wartende Ereignis. Muss mit gehaltenem Lock aufgerufen werden.
+        """
+        schluessel, zeile, absender = self._opfer()
+        if self.politik == ZUSAMMENFASSEN and absender is not None and (
+                absender in self._ausgelassen or len(self._ausgelassen) < MAX_ABSENDER):
+            self._ausgelassen[absender] = self._ausgelassen.get(absender, 0) + 1
+            self.ausgelassen += 1
+        else:
+            self._verworfen += 1
+            self.verworfen += 1
+
+    def _opfer(self) -> list:
+        """
+        Nimmt das älteste Ereignis heraus, das kein Zustandsereignis ist (davon
+        gibt es je Art nur eines). Lock muss gehalten werden.
+        """
+        for i, eintrag in enumerate(self._eintraege):
+            if eintrag[1] is not None and eintrag[0] is None:
+                del self._eintraege[i]
+                self._anzahl -= 1
+                return eintrag
+        return self._naechster()
+
+    def _naechster(self) -> list:
+        """
+        Nimmt den ältesten nicht ersetzten Eintrag heraus. Lock muss gehalten werden.
+        """
+        while True:
+            eintrag = self._eintraege.popleft()
+            if eintrag[1] is None:
+                continue
+            self._anzahl -= 1
+            if eintrag[0] is not None and self._ersetzbar.get(eintrag[0]) is eintrag:
+                del self._ersetzbar[eintrag[0]]
+            return eintrag
+
+    def _weiterleiten(self) -> None:
+        """
+        Reicht Ereignisse an das Ziel weiter; Hinweise auf ausgelassene bzw.
+        verworfene Ereignisse stehen an der Stelle, an der sie fehlen.
+        """
+        while True:
+            with self._lock:
+                self._bereit.wait_for(lambda: self._anzahl or self._ausgelassen or self._verworfen)
+                zeilen = [f"[PUFFER] {n} weitere Nachricht(en) von {absender} ausgelassen"
+                          for absender, n in self._ausgelassen.items()]
+                if self._verworfen:
+                    zeilen.append(f"[PUFFER] {self._verworfen} ältere Ereignisse verworfen")
+                self._ausgelassen.clear()
+                self._verworfen = 0
+                if not zeilen:
+                    zeilen.append(self._naechster()[1])
+            for zeile in zeilen:
+                self.ziel.put(zeile)  # Blockiert, solange die UI nicht nachkommt
+                with self._lock:
+                    self.weitergereicht += 1
+
+    def statistik(self) -> dict:
+        with self._lock:
+            werte = {
+                "tiefe": self._anzahl,
+                "max_tiefe": self.max_tiefe,
+                "kapazitaet": self.kapazitaet,
+                "ersetzt": self.ersetzt,
+                "ausgelassen": self.ausgelassen,
+                "verworfen": self.verworfen,
+                "weitergereicht": self.weitergereicht,
+            }
+        try:
+            werte["ui_queue"] = self.ziel.qsize()
+        except NotImplementedError:  # multiprocessing.Queue unter macOS
+            pass
+        return werte
+
+
+def chat_melden(ziel, zeile: str, absender: str) -> None:
+    """
+    Meldet eine Chatnachricht an ziel; ein EreignisPuffer erfährt dabei den Absender.
+    """
+    if isinstance(ziel, EreignisPuffer):
+        ziel.put(zeile, absender=absender)
+    else:
+        ziel.put(zeile)
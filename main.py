@@ -3,11 +3,62 @@ import sys
 import signal
 import time
 import threading
+import queue
 from multiprocessing import Process, Queue
 
 from chat_ui import ChatClientUI
 from netzwerk import send_join_broadcast, send_leave_broadcast, network_loop
-from discovery import discovery_loop
+from discovery import discovery_loop, LokaleAbfrage
+
+
+#/**
+# * @brief Hintergrunddienste (Netzwerk und Discovery) anlegen
+# * @details Standard sind zwei eigene Prozesse mit multiprocessing.Queue. Mit
+# *          einzelprozess=True laufen beide als Daemon-Threads im Hauptprozess
+# *          neben der UI; die Queues sind dann queue.Queue (Übergabe im
+# *          Speicher, ohne Pickling) und es entfällt der Start zweier Interpreter.
+# * @return (ui_to_net, net_to_ui, arbeiter) - arbeiter in Startreihenfolge
+# *         (Discovery zuerst), noch nicht gestartet
+# */
+def hintergrund_anlegen(config: dict, handle: str, port: int, whoisport: int, einzelprozess: bool = False) -> tuple:
+    if einzelprozess:
+        ui_to_net, net_to_ui = queue.Queue(), queue.Queue(maxsize=config.get("ui_queue", 256))
+        lokale_abfrage = LokaleAbfrage(queue.Queue)
+        arbeiter_klasse = lambda **kw: threading.Thread(daemon=True, **kw)
+    else:
+        ui_to_net, net_to_ui = Queue(), Queue(maxsize=config.get("ui_queue", 256))
+        lokale_abfrage = LokaleAbfrage()
+        arbeiter_klasse = Process
+
+    arbeiter = [
+        arbeiter_klasse(
+            target=discovery_loop,
+            args=(whoisport, ui_to_net, config, lokale_abfrage),
+            name="Discovery-Prozess"
+        ),
+        arbeiter_klasse(
+            target=network_loop,
+            args=(ui_to_net, net_to_ui, handle, port, whoisport, config, lokale_abfrage),
+            name="Netzwerk-Prozess"
+        ),
+    ]
+    return ui_to_net, net_to_ui, arbeiter
+
+
+#/**
+# * @brief Hintergrunddienste starten
+# * @details Discovery zuerst (muss vor dem JOIN lauschen). Ein Prozess braucht
+# *          bis zu einer Sekunde für den Start, ein Thread nur Millisekunden.
+# */
+def hintergrund_starten(arbeiter: list, einzelprozess: bool = False) -> None:
+    discovery, netzwerk = arbeiter
+    print(f"[MAIN] Starte {discovery.name} (zuerst)...")
+    discovery.start()
+    time.sleep(0.1 if einzelprozess else 1.0)  # Warten bis Discovery bereit ist
+    print(f"[MAIN] Discovery bereit, starte {netzwerk.name}...")
+    netzwerk.start()
+    if not einzelprozess:
+        time.sleep(0.2)
 
 
 #/**
@@ -24,6 +75,7 @@ def main():
     handle    = config.get("handle",    "User")
     port      = config.get("port",      5000)
     whoisport = config.get("whoisport", 4000)
+    einzelprozess = config.get("einzelprozess", False)
 
     #/**
     # * @brief Startmeldung ausgeben
@@ -38,30 +90,12 @@ def main():
     ui = ChatClientUI(config_path="config.toml")
 
     #/**
-    # * @brief IPC-Queues anlegen
-    # * @details Erstellt zwei multiprocessing.Queue-Objekte für die Kommunikation
-    # *          zwischen UI und Netzwerk-Prozess.
+    # * @brief Queues und Netzwerk-/Discovery-Dienste erstellen
+    # * @details Zwei separate Prozesse (Standard) oder zwei Threads im
+    # *          Hauptprozess (config: einzelprozess = true), verbunden über
+    # *          ui_to_net/net_to_ui und den lokalen Abfragekanal.
     # */
-    ui_to_net = Queue()
-    net_to_ui = Queue()
-
-    #/**
-    # * @brief Netzwerk- und Discovery-Prozesse erstellen
-    # * @details Definiert zwei separate Prozesse: einen für den Netzwerk-Loop
-    # *          und einen für die Discovery-Funktionalität.
-    # */
-    processes = [
-        Process(
-            target=network_loop,
-            args=(ui_to_net, net_to_ui, handle, port, whoisport),
-            name="Netzwerk-Prozess"
-        ),
-        Process(
-            target=discovery_loop,
-            args=(whoisport, ui_to_net),
-            name="Discovery-Prozess"
-        )
-    ]
+    ui_to_net, net_to_ui, processes = hintergrund_anlegen(config, handle, port, whoisport, einzelprozess)
 
     #/**
     # * @brief Signal-Handler für sauberes Beenden
@@ -92,13 +126,15 @@ def main():
         # * @details Versucht, alle gestarteten Prozesse zuerst ordentlich zu beenden,
         # *          anschließend ggf. zwangsweise zu killen.
         # */
-        for proc in processes:
+        # Threads (Einzelprozess-Modus) enden als Daemons mit dem Hauptprozess
+        prozesse = [proc for proc in processes if isinstance(proc, Process)]
+        for proc in prozesse:
             if proc.is_alive():
                 print(f"[MAIN] Beende {proc.name}...")
                 proc.terminate()
         
         # Warten bis alle beendet sind
-        for proc in processes:
+        for proc in prozesse:
             proc.join(timeout=2)
             if proc.is_alive():
                 print(f"[MAIN] Forciere Beendigung von {proc.name}")
@@ -120,18 +156,10 @@ def main():
     # *          und anschließend den Netzwerk-Prozess.
     # */
     try:
-        # Discovery-Prozess ZUERST starten (vor JOIN!)
-        discovery_proc = processes[1]  # Discovery ist der zweite Prozess
-        network_proc = processes[0]    # Netzwerk ist der erste Prozess
-        
-        print(f"[MAIN] Starte {discovery_proc.name} (zuerst)...")
-        discovery_proc.start()
-        time.sleep(1.0)  # Warten bis Discovery bereit ist
-        print(f"[MAIN] Discovery bereit, starte {network_proc.name}...")
-        network_proc.start()
-        time.sleep(0.2)
+        hintergrund_starten(processes, einzelprozess)
 
-        print("[MAIN] Hintergrund-Prozesse gestartet.")
+        print("[MAIN] Hintergrund-Prozesse gestartet." if not einzelprozess
+              else "[MAIN] Hintergrund-Threads gestartet (Einzelprozess-Modus).")
         print(f"[MAIN] Starte UI im Hauptprozess...")
         
         #/**
@@ -0,0 +1,131 @@
+"""
+@file mitschnitt.py
+@brief Kompakter binärer Mitschnitt ein- und ausgehender SLCP-Nachrichten.
+
+Discovery- und Netzwerk-Prozess können jede empfangene und gesendete
+Nachricht mit Zeitstempel in eine Trace-Datei schreiben (config.toml:
+mitschnitt_discovery / mitschnitt_netzwerk). bench_replay.py spielt einen
+Trace gegen lokale Instanzen ab.
+
+Dateiformat: 8 Byte Kennung "SLCPTRC1", danach Datensätze
+
+    <d  zeit        (time.time())
+    B   richtung    (EIN / AUS)
+    B   kanal       (UDP = Discovery, TCP = Chat)
+    4s  ip          (IPv4, gepackt)
+    H   port
+    I   laenge      (ursprüngliche Länge der Nachricht)
+    I   gespeichert (Anzahl folgender Bytes, höchstens max_nutzlast)
+
+gefolgt von den ersten gespeichert Bytes der Nachricht. Bilddaten werden so
+nur angeschnitten; Kopfzeilen (IMG, HAVE, BATCH ...) bleiben vollständig.
+"""
+
+import socket
+import struct
+import threading
+import time
+from typing import NamedTuple
+
+KENNUNG = b"SLCPTRC1"
+KOPF = struct.Struct("<dBB4sHII")
+
+EIN = 0
+AUS = 1
+UDP = 0
+TCP = 1
+
+
+class Datensatz(NamedTuple):
+    zeit: float
+    richtung: int
+    kanal: int
+    ip: str
+    port: int
+    laenge: int
+    daten: bytes
+
+
+class Mitschnitt:
+    """
+    Thread-sicherer Trace-Schreiber (gepuffert, Anhängen an bestehende Datei).
+    """
+
+    def __init__(self, pfad: str, max_nutzlast: int = 512):
+        self.pfad = pfad
+        self.max_nutzlast = max_nutzlast
+        self._lock = threading.Lock()
+        self._datei = open(pfad, 'ab', buffering=64 * 1024)
+        if self._datei.tell() == 0:
+            self._datei.write(KENNUNG)
+
+    def aufzeichnen(self, richtung: int, kanal: int, addr: tuple, daten: bytes, laenge: int = None,
+                    zeit: float = None) -> None:
+        """
+        Args:
+            addr: (ip, port) der Gegenstelle
+            daten: Nachricht (bzw. deren Anfang)
+            laenge: Gesamtlänge, falls daten nur der Anfang ist
+            zeit: Zeitstempel (Standard: jetzt; für erzeugte Traces)
+        """
+        try:
+            ip = socket.inet_aton(addr[0])
+        except OSError:
+            ip = b"\0\0\0\0"
+        nutzlast = bytes(daten[:self.max_nutzlast])
+        kopf = KOPF.pack(time.time() if zeit is None else zeit, richtung, kanal, ip, addr[1] & 0xFFFF,
+                         len(daten) if laenge is None else laenge, len(nutzlast))
+        with self._lock:
+            if self._datei is not None:
+                self._datei.write(kopf + nutzlast)
+
+    def leeren(self) -> None:
+        with self._lock:
+            if self._datei is not None:
+                self._datei.flush()
+
+    def schliessen(self) -> None:
+        with self._lock:
+            if self._datei is not None:
+                self._datei.close()
+                self._datei = None
+
+
+def starten(pfad: str, intervall: float = 1.0) -> Mitschnitt:
+    """
+    Öffnet einen Mitschnitt und leert seinen Puffer im Hintergrund alle
+    intervall Sekunden, damit ein abgebrochener Prozess kaum Daten verliert.
+    """
+    mitschnitt = Mitschnitt(pfad)
+
+    def leeren_loop():
+        while mitschnitt._datei is not None:
+            time.sleep(intervall)
+            mitschnitt.leeren()
+
+    threading.Thread(target=leeren_loop, daemon=True).start()
+    return mitschnitt
+
+
+def lesen(pfad: str):
+    """
+    Liest einen Trace.
+
+    Yields:
+        Datensatz in Aufzeichnungsreihenfolge (ein abgeschnittenes Dateiende wird ignoriert)
+
+    Raises:
+        ValueError: Wenn die Datei kein Mitschnitt ist
+    """
+    with open(pfad, 'rb') as f:
+        if f.read(len(KENNUNG)) != KENNUNG:
+            raise ValueError(f"{pfad} ist kein SLCP-Mitschnitt")
+        while True:
+            kopf = f.read(KOPF.size)
+            if len(kopf) < KOPF.size:
+                return
+            zeit, richtung, kanal, ip, port, laenge, gespeichert = KOPF.unpack(kopf)
+            daten = f.read(gespeichert)
+            if len(daten) < gespeichert:
+                return
+            yield Datensatz(zeit, richtung, kanal, socket.inet_ntoa(ip), port, laenge, daten)
@@ -0,0 +1,277 @@
+"""
+@file multicast.py
+@brief Optionaler UDP-Multicast-Transport für Broadcast-Chatnachrichten.
+
+Kurze Textnachrichten an alle werden einmal als Multicast-Datagramm
+gesendet statt über eine TCP-Verbindung pro Teilnehmer:
+
+    MCAST  <handle> <chat_port> <epoche> <seq> <text>
+    MHELLO <handle> <chat_port> <epoche> <seq>
+
+Jeder Sender nummeriert seine Nachrichten fortlaufend (seq) innerhalb einer
+Epoche (Startzeitpunkt des Clients). Empfänger erkennen Lücken und fordern
+fehlende Nachrichten per TCP beim Sender an ('REPAIR <handle> <von> <bis>').
+MHELLO wird periodisch gesendet; darüber lernen alle Teilnehmer, wer in der
+Gruppe ist, und erkennen auch verlorene letzte Nachrichten.
+
+Teilnehmer, deren MHELLO der Sender (noch) nicht kennt, erhalten zusätzlich
+eine TCP-Kopie derselben MCAST-Zeile (kodieren). Empfängt ein solcher
+Teilnehmer auch das Datagramm, verwirft verarbeiten() das zweite Exemplar
+über (epoche, seq) - jede Nachricht erscheint genau einmal.
+"""
+
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from ereignispuffer import chat_melden
+import protokollierung
+import slcp
+
+log = protokollierung.logger("multicast")
+
+MAX_DATAGRAMM = 1200       # Größere Nachrichten gehen über TCP
+MAX_LUECKE = 256           # Maximal nachgeforderte Nachrichten pro Lücke
+PUFFER_GROESSE = 1024      # Gesendete Nachrichten, die für REPAIR vorgehalten werden
+MAX_REPARATUREN = 2        # Gleichzeitige REPAIR-Verbindungen
+MAX_REPARATUR_SENDER = 32  # Sender mit offener REPAIR-Anfrage; weitere Lücken werden aufgegeben
+MAX_REPARATUR_BYTES = MAX_LUECKE * (MAX_DATAGRAMM + 64)  # Größte gelesene REPAIR-Antwort
+
+
+class MulticastKanal:
+    """
+    Sende- und Empfangsseite des Multicast-Transports eines Clients.
+    """
+
+    def __init__(self, handle: str, chat_port: int, gruppe: str, port: int, net_to_ui,
+                 ttl: int = 1, hallo_intervall: float = 5.0):
+        """
+        Args:
+            handle: Eigener Handle
+            chat_port: Eigener TCP-Port (für REPAIR-Anfragen anderer Clients)
+            gruppe: Multicast-Gruppenadresse (z.B. 239.255.42.99)
+            port: UDP-Port der Gruppe
+            net_to_ui: Queue für empfangene Nachrichten
+            ttl: Multicast-TTL (1 = nur lokales Netz)
+            hallo_intervall: Sekunden zwischen zwei MHELLO
+        """
+        self.handle = handle
+        self.chat_port = chat_port
+        self.gruppe = gruppe
+        self.port = port
+        self.net_to_ui = net_to_ui
+        self.hallo_intervall = hallo_intervall
+        self.epoche = int(time.time() * 1000)
+
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._gesendet = deque(maxlen=PUFFER_GROESSE)  # (seq, text)
+        self._mitglieder = {}  # handle -> letzter Empfang
+        self._sender = {}      # handle -> [epoche, hoechste_seq, fehlende_seqs, ip, port]
+        # Nachforderungen: höchstens eine pro Sender, über einen kleinen Pool
+        self._reparaturen = ThreadPoolExecutor(max_workers=MAX_REPARATUREN, thread_name_prefix="Repair")
+        self._reparatur_offen = set()  # Sender mit laufender oder wartender Nachforderung
+
+        self._send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self._send_sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+        self._send_sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+
+        self._recv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self._recv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._recv_sock.bind(('', port))
+        mreq = struct.pack("4sl", socket.inet_aton(gruppe), socket.INADDR_ANY)
+        self._recv_sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+
+    def starten(self) -> None:
+        """
+        Startet Empfangs- und Hallo-Thread.
+        """
+        threading.Thread(target=self._empfangs_loop, daemon=True).start()
+        threading.Thread(target=self._hallo_loop, daemon=True).start()
+
+    # --- Senden ---
+
+    def senden(self, text: str):
+        """
+        Sendet eine Textnachricht an die Gruppe.
+
+        Returns:
+            Sequenznummer, oder None wenn die Nachricht zu groß ist oder das
+            Senden fehlschlägt (der Aufrufer sendet dann per TCP)
+        """
+        with self._lock:
+            seq = self._seq + 1
+            datagramm = self.kodieren(seq, text)
+            if len(datagramm) > MAX_DATAGRAMM:
+                return None
+            try:
+                self._send_sock.sendto(datagramm, (self.gruppe, self.port))
+            except OSError as e:
+                log.warning("Fehler beim Senden: %s", e)
+                return None
+            self._seq = seq
+            self._gesendet.append((seq, text))
+            return seq
+
+    def kodieren(self, seq: int, text: str) -> bytes:
+        """
+        MCAST-Zeile der Nachricht seq (Datagramm, REPAIR-Antwort und TCP-Kopie).
+        """
+        return slcp.encode_mcast(self.handle, self.chat_port, self.epoche, seq, text)
+
+    def _hallo_loop(self):
+        while True:
+            try:
+                with self._lock:
+                    hallo = f"MHELLO {self.handle} {self.chat_port} {self.epoche} {self._seq}"
+                self._send_sock.sendto(hallo.encode('utf-8'), (self.gruppe, self.port))
+            except OSError as e:
+                log.warning("Fehler beim Senden von MHELLO: %s", e)
+            time.sleep(self.hallo_intervall)
+
+    def mitglieder(self) -> set:
+        """
+        Liefert die Handles, von denen kürzlich Multicast-Verkehr empfangen wurde.
+        Nur an diese wird per Multicast statt TCP gesendet.
+        """
+        grenze = time.time() - 3 * self.hallo_intervall
+        with self._lock:
+            return {h for h, zeit in self._mitglieder.items() if zeit >= grenze}
+
+    # --- Empfangen ---
+
+    def _empfangs_loop(self):
+        while True:
+            try:
+                daten, addr = self._recv_sock.recvfrom(MAX_DATAGRAMM + 64)
+                self.verarbeiten(daten.decode('utf-8', errors='ignore'), addr[0])
+            except Exception as e:
+                log.warning("Fehler beim Empfangen: %s", e)
+
+    def verarbeiten(self, nachricht: str, sender_ip: str) -> None:
+        """
+        Verarbeitet ein MCAST- oder MHELLO-Datagramm (auch aus REPAIR-Antworten
+        und TCP-Kopien). sender_ip None = unbekannt (über einen Relay-Knoten
+        erhalten); nachgefordert wird erst, wenn die Adresse bekannt ist.
+        """
+        teile = nachricht.split(' ', 5)
+        if len(teile) < 5 or teile[0] not in ("MCAST", "MHELLO"):
+            return
+        try:
+            sender, port, epoche, seq = teile[1], int(teile[2]), int(teile[3]), int(teile[4])
+        except ValueError:
+            return
+        if sender == self.handle:
+            return
+
+        zustellen = False
+        with self._lock:
+            self._mitglieder[sender] = time.time()
+            zustand = self._sender.get(sender)
+            if zustand is None or zustand[0] != epoche:
+                # Neuer Sender oder Neustart: Verlauf davor wird nicht nachgefordert
+                basis = seq - 1 if teile[0] == "MCAST" else seq
+                zustand = [epoche, basis, set(), sender_ip, port]
+                self._sender[sender] = zustand
+            elif sender_ip:
+                zustand[3] = sender_ip
+
+            if seq > zustand[1]:
+                fehlend = range(max(zustand[1] + 1, seq - MAX_LUECKE), seq if teile[0] == "MCAST" else seq + 1)
+                if len(fehlend):
+                    zustand[2].update(fehlend)
+                    if len(zustand[2]) > MAX_LUECKE:
+                        # Nur die jüngsten MAX_LUECKE Nachrichten nachfordern
+                        zustand[2].difference_update(sorted(zustand[2])[:-MAX_LUECKE])
+                    self._reparatur_planen(sender, zustand)
+                zustand[1] = seq
+                zustellen = teile[0] == "MCAST"
+            elif teile[0] == "MCAST" and seq in zustand[2]:
+                zustand[2].discard(seq)
+                zustellen = True
+
+        if zustellen and len(teile) == 6:
+            chat_melden(self.net_to_ui, f"[{sender}] {teile[5]}", sender)
+
+    def _reparatur_planen(self, sender: str, zustand: list) -> None:
+        """
+        Reiht eine Nachforderung der fehlenden Nachrichten von sender ein, sofern
+        für ihn keine offen ist (Lücken, die währenddessen entstehen, fordert
+        die laufende im Anschluss nach). Lock muss gehalten werden.
+        """
+        if sender in self._reparatur_offen:
+            return
+        if len(self._reparatur_offen) >= MAX_REPARATUR_SENDER:
+            log.info("Zu viele offene Nachforderungen, Lücke bei %s aufgegeben", sender)
+            zustand[2].clear()
+            return
+        self._reparatur_offen.add(sender)
+        von = min(zustand[2])
+        self._reparaturen.submit(self._reparatur_anfragen, sender, von,
+                                 min(max(zustand[2]), von + MAX_LUECKE - 1))
+
+    def _reparatur_anfragen(self, sender: str, von: int, bis: int) -> None:
+        """
+        Fordert fehlende Nachrichten per TCP beim Sender an.
+        """
+        try:
+            self._reparatur_ausfuehren(sender, von, bis)
+        finally:
+            with self._lock:
+                self._reparatur_offen.discard(sender)
+                zustand = self._sender.get(sender)
+                if zustand is not None:
+                    # Nicht mehr lieferbare Nachrichten nicht erneut anfordern
+                    zustand[2].difference_update(range(von, bis + 1))
+                    if zustand[2]:
+                        self._reparatur_planen(sender, zustand)
+
+    def _reparatur_ausfuehren(self, sender: str, von: int, bis: int) -> None:
+        with self._lock:
+            zustand = self._sender.get(sender)
+            if zustand is None or zustand[3] is None:
+                return
+            ip, port = zustand[3], zustand[4]
+
+        log.info("Lücke bei %s: fordere %s-%s nach", sender, von, bis)
+        tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            tcp_socket.settimeout(2.0)
+            tcp_socket.connect((ip, port))
+            tcp_socket.sendall(f"REPAIR {self.handle} {von} {bis}\n".encode('utf-8'))
+            puffer = b""
+            while len(puffer) < MAX_REPARATUR_BYTES:
+                chunk = tcp_socket.recv(min(65536, MAX_REPARATUR_BYTES - len(puffer)))
+                if not chunk:
+                    break
+                puffer += chunk
+            if len(puffer) >= MAX_REPARATUR_BYTES:
+                # Unvollständige letzte Zeile verwerfen
+                puffer = puffer[:puffer.rfind(b'\n') + 1]
+            for zeile in puffer.decode('utf-8', errors='ignore').split('\n'):
+                if zeile:
+                    self.verarbeiten(zeile, ip)
+        except Exception as e:
+            log.warning("REPAIR bei %s fehlgeschlagen: %s", sender, e)
+        finally:
+            tcp_socket.close()
+
+    def reparatur_beantworten(self, client_sock: socket.socket, header: str) -> None:
+        """
+        Beantwortet 'REPAIR <handle> <von> <bis>' mit den noch vorgehaltenen
+        MCAST-Nachrichten, je eine pro Zeile.
+        """
+        teile = header.split()
+        if len(teile) < 4:
+            return
+        try:
+            von, bis = int(teile[2]), int(teile[3])
+        except ValueError:
+            return
+        with self._lock:
+            zeilen = [self.kodieren(seq, text) + b"\n" for seq, text in self._gesendet if von <= seq <= bis]
+        if zeilen:
+            client_sock.sendall(b"".join(zeilen))
@@ -5,6 +5,67 @@ import sys
 import time
 import threading
 import os
+import hashlib
+import zlib
+from collections import deque
+
+from ereignispuffer import EreignisPuffer, chat_melden
+from bildspeicher import (BildSpeicher, StagingBereich, STAGING_ORDNER, TRANSFER_ID_MUSTER,
+                          datei_hash, ist_gueltiger_hash, transfer_id)
+from verbindungspool import VerbindungsPool
+from multicast import MulticastKanal
+from peer_status import PeerGesundheit, PeerGesperrt
+from peerregister import PeerRegister
+from postausgang import Postausgang, Empfangsstand, EMPFANGSSTAND, neue_id
+from prioritaet import Planer, STEUERUNG, TEXT, BULK
+import mitschnitt
+import relay
+import protokollierung
+import slcp
+
+log = protokollierung.logger("netzwerk")
+img_log = protokollierung.logger("img")
+
+# Multicast-Transport dieses Prozesses (None = deaktiviert), siehe network_loop
+_multicast = None
+
+# Gesundheitszustand aller Peers dieses Prozesses (Circuit Breaker, RTT)
+_gesundheit = PeerGesundheit()
+
+# Kanal zur Tabelle des lokalen Discovery-Prozesses (None = nur WHO ins LAN)
+_lokale_abfrage = None
+_abfrage_statistik = {"lokal": 0, "lan": 0}
+
+# Store-and-Forward für nicht erreichbare Peers (None = deaktiviert), siehe network_loop
+_postausgang = None
+_zustellung_laeuft = set()  # Empfänger, deren Postausgang gerade zugestellt wird
+_zustellung_lock = threading.Lock()
+
+# Relay-Modus (siehe relay.py): Broadcasts ab relay_schwelle Empfängern über
+# einen Verteilbaum mit diesem Fanout senden; 0 = immer direkt
+_relay_fanout = 0
+_relay_schwelle = 32
+_relay_filter = relay.Duplikatfilter()
+
+# Empfangsseite: höchste angenommene QMSG-ID pro Sender (Reihenfolge, Duplikate);
+# mit Postausgang persistent in dessen Ordner, siehe network_loop
+_empfangsstand = Empfangsstand()
+
+# Mitschnitt ein- und ausgehender SLCP-Nachrichten (None = aus), siehe mitschnitt.py
+_mitschnitt = None
+
+# Direktnachrichten pro Empfänger in Reihenfolge: ziel -> wartende MSG-Aufträge
+_msg_warteschlangen = {}
+_msg_lock = threading.Lock()
+
+# Prioritätsspuren (siehe prioritaet.py); None = Bulk ungedrosselt (z.B. in Benchmarks)
+_planer = None
+BULK_BLOCK = 64 * 1024  # Größter Bulk-Block pro Freigabe
+
+
+def _bulk_freigabe(anzahl: int, empfang: bool = False) -> None:
+    if _planer is not None:
+        _planer.bulk_freigabe(anzahl, empfang)
 
 # Broadcast-Funktionen
 
@@ -15,11 +76,13 @@ def send_join_broadcast(handle: str, chat_port: int, whoisport: int) -> None:
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     try:
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        message = f"JOIN {handle} {chat_port}"
-        sock.sendto(message.encode('utf-8'), ('255.255.255.255', whoisport))
-        print(f"[JOIN] gesendet: '{message}' an Port {whoisport}")
+        message = slcp.encode_join(handle, chat_port)
+        sock.sendto(message, ('255.255.255.255', whoisport))
+        if _mitschnitt is not None:
+            _mitschnitt.aufzeichnen(mitschnitt.AUS, mitschnitt.UDP, ('255.255.255.255', whoisport), message)
+        log.info("JOIN gesendet an Port %s", whoisport, extra=protokollierung.felder(handle=handle, port=chat_port))
     except Exception as e:
-        print(f"Error sending JOIN broadcast: {e}")
+        log.warning("Error sending JOIN broadcast: %s", e)
     finally:
         sock.close()
 
@@ -31,88 +94,135 @@ def send_leave_broadcast(handle: str, whoisport: int) -> None:
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     try:
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        message = f"LEAVE {handle}"
-        sock.sendto(message.encode('utf-8'), ('255.255.255.255', whoisport))
-        print(f"[LEAVE] gesendet: '{message}' an Port {whoisport}")
+        message = slcp.encode_leave(handle)
+        sock.sendto(message, ('255.255.255.255', whoisport))
+        if _mitschnitt is not None:
+            _mitschnitt.aufzeichnen(mitschnitt.AUS, mitschnitt.UDP, ('255.255.255.255', whoisport), message)
+        log.info("LEAVE gesendet an Port %s", whoisport, extra=protokollierung.felder(handle=handle))
     except Exception as e:
-        print(f"Error sending LEAVE broadcast: {e}")
+        log.warning("Error sending LEAVE broadcast: %s", e)
     finally:
         sock.close()
 
 
-def send_who_broadcast_and_wait(whoisport: int, timeout: float = 3.0, silent: bool = False) -> str:
+def who_abfragen(whoisport: int, timeout: float = 3.0, silent: bool = False, raum: str = "") -> PeerRegister:
     """
-    Broadcastet 'WHO' an Discovery-Port und wartet auf Antworten.
-    Sammelt alle Antworten und gibt sie zurück.
+    Broadcastet 'WHO' an Discovery-Port und sammelt alle KNOWUSERS-Antworten
+    innerhalb des Timeouts. Antworten werden direkt per slcp-Codec geparst.
     
     Args:
         whoisport: Discovery-Port
         timeout: Timeout in Sekunden
         silent: Wenn True, werden keine Logs ausgegeben (für interne Aufrufe)
+        raum: Wenn gesetzt ('#raum'), nur die Mitglieder dieses Raums abfragen
     
     Returns:
-        String mit allen gefundenen Teilnehmern oder Fehlermeldung
+        PeerRegister aller Teilnehmer aus den Antworten
+    
+    Raises:
+        OSError: Wenn die WHO-Anfrage nicht gesendet werden kann
     """
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    all_participants = {}  # handle -> (ip, port)
+    all_participants = PeerRegister()
     
     try:
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         sock.settimeout(timeout)
         
         # WHO-Nachricht broadcasten
-        message = "WHO"
-        sock.sendto(message.encode('utf-8'), ('255.255.255.255', whoisport))
+        anfrage = slcp.encode_who(raum)
+        sock.sendto(anfrage, ('255.255.255.255', whoisport))
+        if _mitschnitt is not None:
+            _mitschnitt.aufzeichnen(mitschnitt.AUS, mitschnitt.UDP, ('255.255.255.255', whoisport), anfrage)
         if not silent:
-            print(f"[WHO] gesendet an Port {whoisport}, warte auf Antworten...")
+            log.debug("gesendet an Port %s, warte auf Antworten...", whoisport)
         
         # Sammle alle Antworten innerhalb des Timeouts
         start_time = time.time()
         while time.time() - start_time < timeout:
             try:
-                daten, addr = sock.recvfrom(4096)
-                reply = daten.decode('utf-8').strip()
+                daten, addr = sock.recvfrom(65535)
+                if _mitschnitt is not None:
+                    _mitschnitt.aufzeichnen(mitschnitt.EIN, mitschnitt.UDP, addr, daten)
                 if not silent:
-                    print(f"[WHO-REPLY] von {addr[0]}: {reply}")
+                    log.debug("von %s: %s", addr[0], protokollierung.roh(daten))
                 
-                # Parse KNOWUSERS Antwort
-                if reply.startswith("KNOWUSERS"):
-                    participants_str = reply[10:].strip()  # "KNOWUSERS " entfernen
-                    if participants_str:  # Nicht leer
-                        # Format: "Alice 192.168.1.5 5000,Bob 192.168.1.6 5001"
-                        for entry in participants_str.split(','):
-                            entry = entry.strip()
-                            if entry:
-                                parts = entry.split()
-                                if len(parts) >= 3:
-                                    handle, ip, port = parts[0], parts[1], parts[2]
-                                    all_participants[handle] = (ip, int(port))
+                # KNOWUSERS-Antwort parsen, andere Nachrichten ignorieren
+                antwort = slcp.parse_discovery(daten)
+                if isinstance(antwort, slcp.KnowUsers):
+                    for t in antwort.teilnehmer:
+                        all_participants.eintragen(t.handle, t.ip, t.port)
                 
             except socket.timeout:
                 # Timeout für einzelne Antwort - weitermachen
                 continue
+            except slcp.SlcpFehler as e:
+                if not silent:
+                    log.warning("Ungültige Antwort: %s", e)
             except Exception as e:
                 if not silent:
-                    print(f"[WHO] Fehler beim Empfangen: {e}")
+                    log.warning("Fehler beim Empfangen: %s", e)
                 break
         
-        # Ergebnis formatieren
-        if all_participants:
-            result_entries = []
-            for handle, (ip, port) in all_participants.items():
-                result_entries.append(f"{handle} {ip} {port}")
-            return ";".join(result_entries)
-        else:
-            return "EMPTY"
-            
+        return all_participants
+    finally:
+        sock.close()
+
+
+def send_sub_broadcast(handle: str, raum: str, whoisport: int) -> None:
+    """
+    Broadcastet 'SUB <handle> <#raum>' an Discovery-Port.
+    """
+    _raum_broadcast(slcp.encode_sub(handle, raum), whoisport)
+
+
+def send_unsub_broadcast(handle: str, raum: str, whoisport: int) -> None:
+    """
+    Broadcastet 'UNSUB <handle> <#raum>' an Discovery-Port.
+    """
+    _raum_broadcast(slcp.encode_unsub(handle, raum), whoisport)
+
+
+def _raum_broadcast(message: bytes, whoisport: int) -> None:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.sendto(message, ('255.255.255.255', whoisport))
+        if _mitschnitt is not None:
+            _mitschnitt.aufzeichnen(mitschnitt.AUS, mitschnitt.UDP, ('255.255.255.255', whoisport), message)
+        log.info("%s gesendet an Port %s", protokollierung.roh(message), whoisport)
     except Exception as e:
-        if not silent:
-            print(f"Error sending WHO broadcast: {e}")
-        return "ERROR"
+        log.warning("Error sending %s: %s", protokollierung.roh(message), e)
     finally:
         sock.close()
 
 
+def send_who_broadcast_and_wait(whoisport: int, timeout: float = 3.0, silent: bool = False) -> str:
+    """
+    Broadcastet 'WHO' an Discovery-Port und wartet auf Antworten.
+    Sammelt alle Antworten und gibt sie zurück.
+    
+    Args:
+        whoisport: Discovery-Port
+        timeout: Timeout in Sekunden
+        silent: Wenn True, werden keine Logs ausgegeben (für interne Aufrufe)
+    
+    Returns:
+        Peer-Liste im slcp-Format (siehe slcp.encode_peerliste), "EMPTY" oder "ERROR"
+    """
+    try:
+        all_participants = who_abfragen(whoisport, timeout, silent)
+    except Exception as e:
+        if not silent:
+            log.warning("Error sending WHO broadcast: %s", e)
+        return "ERROR"
+    
+    # Ergebnis formatieren
+    if all_participants:
+        return slcp.encode_peerliste((e.handle, e.ip, e.port) for e in all_participants)
+    return "EMPTY"
+
+
 def send_who_broadcast(whoisport: int, timeout: float = 2.0) -> None:
     """
     Vereinfachte WHO-Broadcast-Funktion für Kompatibilität mit alter UI.
@@ -127,18 +237,29 @@ def send_who_broadcast(whoisport: int, timeout: float = 2.0) -> None:
         print(f"[WHO-REPLY] Teilnehmer: {result.replace(';', ', ')}")
 
 
-def send_msg(handle: str, text: str, peer_ip: str, peer_port: int) -> None:
+def send_msg(handle: str, text: str, peer_ip: str, peer_port: int) -> bool:
     """
     Sendet 'MSG <handle> <text>' per TCP an einen einzelnen Peer.
+
+    Returns:
+        True wenn erfolgreich, False bei Fehlern
     """
-    tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     try:
-        tcp_socket.connect((peer_ip, peer_port))
-        message = f"MSG {handle} {text}"
-        tcp_socket.sendall(message.encode('utf-8'))
-        print(f"[MSG] an {peer_ip}:{peer_port}: {text}")
+        tcp_socket = _gesundheit.verbinden(peer_ip, peer_port)
+    except Exception as e:
+        log.warning("Error sending MSG to %s:%s: %s", peer_ip, peer_port, e)
+        return False
+    try:
+        tcp_socket.settimeout(5.0)
+        frame = slcp.encode_msg(handle, text)
+        tcp_socket.sendall(frame)
+        if _mitschnitt is not None:
+            _mitschnitt.aufzeichnen(mitschnitt.AUS, mitschnitt.TCP, (peer_ip, peer_port), frame)
+        log.debug("an %s:%s: %s", peer_ip, peer_port, text)
+        return True
     except Exception as e:
-        print(f"Error sending MSG to {peer_ip}:{peer_port}: {e}")
+        log.warning("Error sending MSG to %s:%s: %s", peer_ip, peer_port, e)
+        return False
     finally:
         tcp_socket.close()
 
@@ -152,55 +273,334 @@ def send_broadcast_message(handle: str, message: str, chat_ports: list, timeout:
         message: Zu sendende Nachricht  
         chat_ports: Liste von (ip, port) Tupeln der bekannten Clients
     """
-    print(f"[BROADCAST] Sende '{message}' an {len(chat_ports)} Teilnehmer...")
+    send_broadcast_batch(handle, [message], chat_ports, timeout)
+
+
+def encode_batch(handle: str, messages: list, raum: str = "") -> list:
+    """
+    Kodiert Nachrichten als Liste von Puffern für einen einzigen sendmsg-Aufruf.
+
+    Eine einzelne Nachricht wird als klassisches 'MSG <handle> <text>' gesendet
+    (bzw. 'RMSG <handle> <#raum> <text>' für Raumnachrichten), mehrere als
+    Batch-Frame:
+
+        BATCH <handle> <anzahl>\n
+        <len>\n<MSG <handle> <text>>     (anzahl mal, len in Bytes)
+
+    Returns:
+        Liste von bytes-Puffern
+    """
+    if raum:
+        frames = [slcp.encode_rmsg(handle, raum, text) for text in messages]
+    else:
+        frames = [slcp.encode_msg(handle, text) for text in messages]
+    if len(frames) == 1:
+        return frames
+    return _batch_puffer(handle, frames)
+
+
+def _batch_puffer(handle: str, frames: list) -> list:
+    """
+    Verpackt bereits kodierte Frames in einen Batch-Frame (siehe encode_batch).
+    """
+    puffer = [f"BATCH {handle} {len(frames)}\n".encode('utf-8')]
+    for frame in frames:
+        puffer.append(b"%d\n" % len(frame))
+        puffer.append(frame)
+    return puffer
+
+
+def _puffer_senden(tcp_socket: socket.socket, puffer: list) -> None:
+    """
+    Schreibt alle Puffer mit möglichst wenigen Systemaufrufen (sendmsg/writev).
+    Fällt auf sendall zurück, wo sendmsg fehlt (Windows).
+    """
+    if _mitschnitt is not None:
+        _mitschnitt.aufzeichnen(mitschnitt.AUS, mitschnitt.TCP, tcp_socket.getpeername(), b"".join(puffer))
+    if not hasattr(tcp_socket, "sendmsg"):
+        tcp_socket.sendall(b"".join(puffer))
+        return
+    
+    puffer = [memoryview(p) for p in puffer if p]
+    while puffer:
+        gesendet = tcp_socket.sendmsg(puffer[:1024])  # IOV_MAX
+        # Vollständig gesendete Puffer entfernen, angefangenen kürzen
+        while puffer and gesendet >= len(puffer[0]):
+            gesendet -= len(puffer[0])
+            puffer.pop(0)
+        if gesendet:
+            puffer[0] = puffer[0][gesendet:]
+
+
+def send_broadcast_batch(handle: str, messages: list, chat_ports: list, timeout: float = 1.0,
+                         raum: str = "", frames: list = None):
+    """
+    Sendet mehrere Broadcast-Nachrichten an alle bekannten Chat-Clients,
+    pro Client über eine einzige Verbindung und einen einzigen Batch-Frame.
+    
+    Args:
+        handle: Sender-Handle
+        messages: Zu sendende Nachrichten in Reihenfolge
+        chat_ports: Liste von (ip, port) Tupeln der bekannten Clients
+        raum: Wenn gesetzt, werden die Nachrichten als Raumnachrichten (RMSG) gesendet
+        frames: Bereits kodierte Frames zu messages (z.B. MCAST-Kopien), statt MSG/RMSG
+    
+    Returns:
+        Liste der (ip, port), an die nicht gesendet werden konnte
+    """
+    if len(messages) == 1:
+        log.debug("Sende '%s' an %s Teilnehmer...", messages[0], len(chat_ports))
+    else:
+        log.debug("Sende %s Nachrichten gebündelt an %s Teilnehmer...", len(messages), len(chat_ports))
+    
+    if frames is None:
+        puffer = encode_batch(handle, messages, raum)
+    else:
+        puffer = frames if len(frames) == 1 else _batch_puffer(handle, frames)
+    fehlgeschlagen = []
     
     for ip, port in chat_ports:
         try:
-            # TCP-Verbindung zu jedem Client
-            tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # TCP-Verbindung zu jedem Client; als tot bekannte Peers werden
+            # übersprungen, der Connect-Timeout folgt der gemessenen RTT
+            tcp_socket = _gesundheit.verbinden(ip, port)
             tcp_socket.settimeout(timeout)
-            tcp_socket.connect((ip, port))
             
-            msg = f"MSG {handle} {message}"
-            tcp_socket.sendall(msg.encode('utf-8'))
-            print(f"[BROADCAST] -> {ip}:{port}")
+            _puffer_senden(tcp_socket, puffer)
+            log.debug("-> %s:%s", ip, port)
             tcp_socket.close()
             
+        except PeerGesperrt:
+            log.info("%s:%s übersprungen (nicht erreichbar)", ip, port)
+            fehlgeschlagen.append((ip, port))
         except Exception as e:
-            print(f"[BROADCAST] Fehler an {ip}:{port}: {e}")
+            log.warning("Fehler an %s:%s: %s", ip, port, e)
+            fehlgeschlagen.append((ip, port))
+    
+    return fehlgeschlagen
 
 
-def get_all_participants(whoisport: int, timeout: float = 2.0) -> dict:
+def send_broadcast_relay(handle: str, messages: list, chat_ports: list, fanout: int, raum: str = "",
+                         frames: list = None) -> list:
     """
-    Holt alle bekannten Teilnehmer vom Discovery-Service.
+    Sendet Broadcast-Nachrichten über einen Verteilbaum (siehe relay.py): Der
+    Sender beliefert nur fanout Peers, die jeweils ihren Teilbaum weiterversorgen.
+    
+    Args:
+        frames: Bereits kodierte Frames zu messages (siehe send_broadcast_batch)
     
     Returns:
-        Dictionary {handle: (ip, port)}
+        Liste der (ip, port), die dieser Knoten nicht erreichen konnte
     """
-    # SILENT WHO - keine Logs für interne Aufrufe
-    result = send_who_broadcast_and_wait(whoisport, timeout, silent=True)
-    participants = {}
+    if frames is None and raum:
+        frames = [slcp.encode_rmsg(handle, raum, text) for text in messages]
+    elif frames is None:
+        frames = [slcp.encode_msg(handle, text) for text in messages]
+    if sum(len(f) for f in frames) > relay.MAX_NUTZLAST:
+        # Würde von den Knoten nicht weitergeleitet
+        return send_broadcast_batch(handle, messages, chat_ports, raum=raum, frames=frames)
+    nachricht_id = neue_id()
+    _relay_filter.neu((handle, nachricht_id))
+    log.debug("Sende %s Nachrichten per Relay (Fanout %s) an %s Teilnehmer...", len(messages), fanout, len(chat_ports))
+    return relay_senden(handle, nachricht_id, fanout, frames, sorted(chat_ports))
+
+
+def relay_senden(origin: str, nachricht_id: str, fanout: int, frames: list, ziele: list,
+                 timeout: float = 1.0, max_ersatz: int = None) -> list:
+    """
+    Verteilt frames an ziele: höchstens fanout direkte Verbindungen, jedes Kind
+    erhält seinen Teilbaum. Ist ein Kind nicht erreichbar, übernimmt der
+    nächste Peer seines Teilbaums dessen Rolle.
     
-    if result != "EMPTY" and result != "ERROR":
-        for entry in result.split(';'):
-            entry = entry.strip() 
-            if entry:
-                parts = entry.split()
-                if len(parts) >= 3:
-                    handle, ip, port = parts[0], parts[1], parts[2]
-                    participants[handle] = (ip, int(port))
+    Args:
+        max_ersatz: Höchstens so viele Ersatzversuche pro Kind (None = ganzer
+                    Teilbaum); danach gilt der restliche Teilbaum als nicht erreicht
     
-    return participants
+    Returns:
+        Liste der nicht erreichbaren (ip, port)
+    """
+    nutzlast = []
+    for frame in frames:
+        nutzlast.append(b"%d\n" % len(frame))
+        nutzlast.append(frame)
+    
+    fehlgeschlagen = []
+    for kind, teilbaum in relay.aufteilen(ziele, fanout):
+        versuche = 0
+        while True:
+            try:
+                tcp_socket = _gesundheit.verbinden(*kind)
+                try:
+                    tcp_socket.settimeout(timeout)
+                    kopf = relay.encode_kopf(origin, nachricht_id, fanout, len(frames), teilbaum)
+                    _puffer_senden(tcp_socket, [kopf] + nutzlast)
+                finally:
+                    tcp_socket.close()
+                break
+            except OSError as e:
+                log.info("Relay an %s:%s fehlgeschlagen: %s", kind[0], kind[1], e)
+                fehlgeschlagen.append(kind)
+                versuche += 1
+                if max_ersatz is not None and versuche > max_ersatz:
+                    fehlgeschlagen.extend(teilbaum)
+                    break
+                if not teilbaum:
+                    break
+                kind, teilbaum = teilbaum[0], teilbaum[1:]
+    return fehlgeschlagen
 
 
-def network_loop(ui_to_net: "Queue[str]", net_to_ui: "Queue[str]", handle: str, chat_port: int, whoisport: int):
+def _broadcast_senden(handle: str, messages: list, chat_ports: list, raum: str = "", frames: list = None) -> list:
+    """
+    Wählt zwischen direktem Versand und Relay-Baum (ab _relay_schwelle Empfängern).
+    
+    Returns:
+        Liste der nicht erreichbaren (ip, port)
+    """
+    if _relay_fanout and len(chat_ports) > _relay_schwelle:
+        return send_broadcast_relay(handle, messages, chat_ports, _relay_fanout, raum, frames)
+    return send_broadcast_batch(handle, messages, chat_ports, raum=raum, frames=frames)
+
+
+def zwischenspeichern(ziele, messages: list, raum: str = "") -> int:
+    """
+    Legt Nachrichten für nicht erreichbare Empfänger im Postausgang ab.
+    
+    Args:
+        ziele: Iterable von Handles
+    
+    Returns:
+        Anzahl der Empfänger, für die alle Nachrichten gespeichert wurden
+    """
+    if _postausgang is None:
+        return 0
+    anzahl = 0
+    for ziel in ziele:
+        if all([_postausgang.einreihen(ziel, text, raum) for text in messages]):
+            anzahl += 1
+    return anzahl
+
+
+def postausgang_zustellen(handle: str, ziel: str, ip: str, peer_port: int, timeout: float = 5.0) -> int:
+    """
+    Stellt den Postausgang für ziel über eine einzige Verbindung zu: QMSG-Frames
+    in BATCH-Frames zu je höchstens MAX_BATCH, danach wartet der Sender auf
+    'ACK <id>' und entfernt alle bis dahin quittierten Nachrichten.
+    
+    Returns:
+        Anzahl zugestellter Nachrichten
+    
+    Raises:
+        OSError: Wenn der Peer nicht erreichbar ist oder nicht quittiert
+    """
+    with _zustellung_lock:
+        if ziel in _zustellung_laeuft:
+            return 0
+        _zustellung_laeuft.add(ziel)
+    try:
+        gesamt = 0
+        # Während der Zustellung eingereihte Nachrichten in weiteren Runden mitnehmen
+        while True:
+            nachrichten = _postausgang.ausstehend(ziel)
+            if not nachrichten:
+                _postausgang.bestaetigen(ziel, "")  # Nur abgelaufene Nachrichten
+                return gesamt
+            
+            frames = [slcp.encode_qmsg(handle, n["id"], n["r"], n["x"]) for n in nachrichten]
+            tcp_socket = _gesundheit.verbinden(ip, peer_port)
+            try:
+                tcp_socket.settimeout(timeout)
+                for i in range(0, len(frames), MAX_BATCH):
+                    _puffer_senden(tcp_socket, _batch_puffer(handle, frames[i:i + MAX_BATCH]))
+                tcp_socket.shutdown(socket.SHUT_WR)
+                antwort, _ = _recv_line(tcp_socket)
+            finally:
+                tcp_socket.close()
+            
+            teile = antwort.split() if antwort else []
+            if len(teile) != 2 or teile[0] != "ACK":
+                raise OSError(f"Keine Quittung von {ziel}")
+            _postausgang.bestaetigen(ziel, teile[1])
+            zugestellt = sum(1 for n in nachrichten if n["id"] <= teile[1])
+            log.info("%s zwischengespeicherte Nachrichten an %s zugestellt", zugestellt, ziel)
+            gesamt += zugestellt
+            if zugestellt < len(nachrichten):
+                return gesamt
+    finally:
+        with _zustellung_lock:
+            _zustellung_laeuft.discard(ziel)
+
+
+def get_all_participants(whoisport: int, timeout: float = 2.0, raum: str = "", handle: str = "") -> PeerRegister:
+    """
+    Holt alle bekannten Teilnehmer (bzw. die Mitglieder von raum) vom Discovery-Service.
+    
+    Zuerst wird die Tabelle des lokalen Discovery-Prozesses gelesen. Nur wenn
+    dieser nicht antwortet oder außer handle (dem eigenen) niemanden kennt,
+    wird WHO ins LAN gesendet.
+    
+    Returns:
+        PeerRegister der Teilnehmer
+    """
+    if _lokale_abfrage is not None:
+        lokal = _lokale_abfrage.abfragen(raum)
+        if lokal and (len(lokal) > 1 or handle not in lokal):
+            _abfrage_statistik["lokal"] += 1
+            return lokal
+    _abfrage_statistik["lan"] += 1
+    
+    # SILENT WHO - keine Logs für interne Aufrufe
+    try:
+        return who_abfragen(whoisport, timeout, silent=True, raum=raum)
+    except Exception:
+        return PeerRegister()
+
+
+def network_loop(ui_to_net: "Queue[str]", net_to_ui: "Queue[str]", handle: str, chat_port: int, whoisport: int,
+                 config: dict = None, lokale_abfrage=None):
     """
     Haupt-Loop für Chat und Discovery:
     - JOIN beim Start
-    - Verarbeitet Nachrichten aus ui_to_net
-    - Empfängt eingehende TCP-Nachrichten für MSG
+    - Verarbeitet Nachrichten aus ui_to_net: Strings sind immer Broadcast-Text,
+      Befehle kommen als Tupel (("WHO", raum), ("STATS",) sowie MSG/IMG-Aufträge,
+      die nebenläufig ausgeführt werden)
+    - ("QUIT",) sendet LEAVE und beendet den Loop
+    - Räume: ("SUB"|"UNSUB", raum), ("WHO", raum) und ("RAUM", raum, text);
+      Raumnachrichten gehen nur an die Mitglieder laut Discovery-Index
+    - Nicht zustellbare Nachrichten landen im Postausgang und werden bei
+      ("BEITRITT", handle, ip, port) vom Discovery-Prozess (JOIN) nachgeliefert
+    - Empfängt eingehende TCP-Nachrichten für MSG (begrenzter Handler-Pool)
     - Leitet WHO-Anfragen weiter und sammelt Antworten
+    - Aufträge laufen in getrennten Spuren (prioritaet.py): Steuerung (JOIN,
+      SUB/UNSUB, WHO), Text (MSG, Postausgang) und Bulk (IMG); Bulk gibt Text
+      Vorrang und wird gedrosselt
+
+    Args:
+        config: Konfiguration aus config.toml (listen_backlog, max_handler,
+                max_wartend, max_pro_ip, recv_timeout, multicast_*, coalesce_ms,
+                peer_fehler_schwelle, peer_max_backoff, max_auftraege, max_bulk,
+                bulk_kb_s, text_ziel_ms, ui_puffer, ui_puffer_politik, heartbeat,
+                postausgang_pfad, postausgang_max_kb, postausgang_ttl, relay_fanout,
+                relay_schwelle, mitschnitt_netzwerk, [logging])
+        lokale_abfrage: Kanal zum lokalen Discovery-Prozess (discovery.LokaleAbfrage);
+                        ohne ihn werden Teilnehmer immer per WHO im LAN gesucht
     """
+    global _multicast, _lokale_abfrage, _postausgang, _empfangsstand, _relay_fanout, _relay_schwelle, _mitschnitt, _planer
+    _lokale_abfrage = lokale_abfrage
+    config = config or {}
+    _relay_fanout = min(config.get("relay_fanout", 0), relay.MAX_FANOUT)
+    _relay_schwelle = config.get("relay_schwelle", 32)
+    protokollierung.einrichten(config)
+    
+    # Alle Ereignisse an die UI laufen über einen begrenzten Puffer, der bei
+    # Überlauf zusammenfasst, statt unbegrenzt Speicher zu belegen
+    ui_puffer = EreignisPuffer(net_to_ui, kapazitaet=config.get("ui_puffer", 1000),
+                               politik=config.get("ui_puffer_politik", "zusammenfassen"))
+    net_to_ui = ui_puffer
+    
+    if config.get("mitschnitt_netzwerk"):
+        _mitschnitt = mitschnitt.starten(config["mitschnitt_netzwerk"])
+        log.info("Mitschnitt nach %s", _mitschnitt.pfad)
     
     # TCP-Socket für eingehende MSG-Nachrichten
     tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -208,116 +608,696 @@ def network_loop(ui_to_net: "Queue[str]", net_to_ui: "Queue[str]", handle: str,
     
     try:
         tcp_sock.bind(("", chat_port))
-        tcp_sock.listen(5)
-        tcp_sock.settimeout(0.1)  # Non-blocking mit kurzen Timeouts
+        tcp_sock.listen(config.get("listen_backlog", 128))
+        
+        # Begrenzter Handler-Pool statt einem Thread pro Verbindung
+        pool = VerbindungsPool(
+            handle_incoming_msg,
+            handler_args=(net_to_ui,),
+            max_handler=config.get("max_handler", 16),
+            max_wartend=config.get("max_wartend", 64),
+            max_pro_ip=config.get("max_pro_ip", 8),
+            recv_timeout=config.get("recv_timeout", 30.0),
+        )
+        accept_thread = threading.Thread(target=_accept_loop, args=(tcp_sock, pool), daemon=True)
+        accept_thread.start()
         
-        # Initialer JOIN
+        # Circuit Breaker: Schwelle/Backoff aus der Konfiguration, tote Peers im Hintergrund proben
+        _gesundheit.schwelle = config.get("peer_fehler_schwelle", 3)
+        _gesundheit.max_backoff = config.get("peer_max_backoff", 60.0)
+        threading.Thread(target=_proben_loop, daemon=True).start()
+        
+        # Optionaler Multicast-Transport für Broadcast-Nachrichten
+        if config.get("multicast_gruppe"):
+            try:
+                _multicast = MulticastKanal(
+                    handle, chat_port,
+                    config["multicast_gruppe"], config.get("multicast_port", 4001), net_to_ui,
+                    ttl=config.get("multicast_ttl", 1),
+                    hallo_intervall=config.get("multicast_hallo", 5.0),
+                )
+                _multicast.starten()
+                log.info("Multicast aktiv: %s:%s", config['multicast_gruppe'], config.get('multicast_port', 4001))
+            except OSError as e:
+                log.warning("Multicast nicht verfügbar, nutze nur TCP: %s", e)
+                _multicast = None
+        
+        # Postausgang für Nachrichten an nicht erreichbare Peers
+        if config.get("postausgang_pfad", ".outbox"):
+            _postausgang = Postausgang(
+                config.get("postausgang_pfad", ".outbox"),
+                max_bytes=config.get("postausgang_max_kb", 256) * 1024,
+                ttl=config.get("postausgang_ttl", 86400),
+            )
+            _empfangsstand = Empfangsstand(os.path.join(config.get("postausgang_pfad", ".outbox"), EMPFANGSSTAND))
+        
+        # Steuerung, Text und Bulk laufen in getrennten Spuren, damit Bilder
+        # weder Textnachrichten noch WHO-Anfragen aufhalten
+        _planer = Planer(
+            {TEXT: config.get("max_auftraege", 4), BULK: config.get("max_bulk", 2)},
+            bulk_rate=config.get("bulk_kb_s", 0) * 1024,
+            text_ziel_ms=config.get("text_ziel_ms", 100),
+        )
+        
+        # Initialer JOIN; danach periodisch als Heartbeat (hält die Einträge in
+        # allen Discovery-Tabellen frisch, auch nach einem Neustart der Dienste)
         send_join_broadcast(handle, chat_port, whoisport)
+        heartbeat_s = config.get("heartbeat", 60)
+        naechster_heartbeat = time.monotonic() + heartbeat_s
+        raeume = set()  # Betretene Räume, werden mit dem Heartbeat erneut angemeldet
+        
+        # Broadcasts innerhalb dieses Zeitfensters werden gebündelt
+        coalesce_s = config.get("coalesce_ms", 20) / 1000.0
+        zurueckgestellt = deque()  # Befehle, die beim Bündeln ankamen
         
         while True:
-            # 1) Verarbeite UI-Nachrichten
+            if heartbeat_s and time.monotonic() >= naechster_heartbeat:
+                naechster_heartbeat = time.monotonic() + heartbeat_s
+                _planer.einreihen(STEUERUNG, _heartbeat, handle, chat_port, whoisport, list(raeume))
+                if _postausgang is not None and _postausgang.empfaenger():
+                    # Empfänger, die nie verschwunden waren (also keinen BEITRITT
+                    # auslösen), aber zwischendurch nicht erreichbar: erneut versuchen
+                    _planer.einreihen(TEXT, _postausgang_nachliefern, handle, whoisport, net_to_ui)
+            
+            # Verarbeite UI-Nachrichten
             try:
-                msg = ui_to_net.get_nowait()
+                msg = zurueckgestellt.popleft() if zurueckgestellt else ui_to_net.get(timeout=0.1)
                 
-                if msg == "WHO":
-                    # Explizite WHO-Anfrage vom User - mit Logs
-                    result = send_who_broadcast_and_wait(whoisport, timeout=3.0, silent=False)
-                    if result == "EMPTY":
-                        net_to_ui.put("[WHO-REPLY] Keine anderen Teilnehmer gefunden.")
-                    elif result == "ERROR":
-                        net_to_ui.put("[WHO-REPLY] Fehler bei WHO-Anfrage.")
+                if isinstance(msg, tuple) and msg[0] == "MSG":
+                    # Auftrag aus der UI: ("MSG", auftrag_id, ziel, ip, port, text);
+                    # ip/port None = der UI unbekannt, wird hier aufgelöst
+                    _msg_einreihen(msg, handle, whoisport, net_to_ui)
+                elif isinstance(msg, tuple) and msg[0] == "IMG":
+                    # Auftrag aus der UI: ("IMG", auftrag_id, ziel, ip, port, pfad)
+                    _planer.einreihen(BULK, _auftrag_ausfuehren, msg, handle, whoisport, net_to_ui)
+                elif isinstance(msg, tuple) and msg[0] in ("SUB", "UNSUB"):
+                    # Raum betreten/verlassen: Discovery-Dienste pflegen den Raum-Index
+                    if msg[0] == "SUB":
+                        raeume.add(msg[1])
+                        _planer.einreihen(STEUERUNG, send_sub_broadcast, handle, msg[1], whoisport)
                     else:
-                        net_to_ui.put(f"[WHO-REPLY] {result}")
+                        raeume.discard(msg[1])
+                        _planer.einreihen(STEUERUNG, send_unsub_broadcast, handle, msg[1], whoisport)
+                elif isinstance(msg, tuple) and msg[0] == "BEITRITT":
+                    # JOIN eines Peers (vom Discovery-Prozess): Postausgang nachliefern
+                    _, ziel, ip, p = msg
+                    if _postausgang is not None and ziel != handle and _postausgang.hat(ziel):
+                        _gesundheit.zuruecksetzen((ip, p))
+                        _planer.einreihen(TEXT, _postausgang_auftrag, handle, ziel, ip, p, net_to_ui)
+                elif isinstance(msg, tuple) and msg[0] == "WHO":
+                    # Explizite WHO-Anfrage vom User - wartet bis zu 3 s, daher in der Steuerspur
+                    _planer.einreihen(STEUERUNG, _who_auftrag, whoisport, msg[1], net_to_ui)
+                elif isinstance(msg, tuple) and msg[0] == "STATS":
+                    statistik = pool.statistik()
+                    werte = ", ".join(f"{k}={v}" for k, v in statistik.items())
+                    net_to_ui.put(f"[STATS] Verbindungen: {werte}")
+                    werte = ", ".join(f"{k}={v}" for k, v in _abfrage_statistik.items())
+                    net_to_ui.put(f"[STATS] Teilnehmer-Abfragen: {werte}")
+                    if _postausgang is not None:
+                        werte = ", ".join(f"{k}={v}" for k, v in _postausgang.statistik().items())
+                        net_to_ui.put(f"[STATS] Postausgang: {werte}")
+                    werte = ", ".join(f"{k}={v}" for k, v in ui_puffer.statistik().items())
+                    net_to_ui.put(f"[STATS] UI-Puffer: {werte}")
+                    werte = ", ".join(f"{k}={v}" for k, v in _planer.statistik().items())
+                    net_to_ui.put(f"[STATS] Spuren: {werte}")
+                elif isinstance(msg, tuple) and msg[0] == "QUIT":
+                    # /quit: abmelden, keine Verbindungen und keine Zwischenspeicherung mehr annehmen
+                    send_leave_broadcast(handle, whoisport)
+                    pool.schliessen()
+                    _postausgang = None
+                    return
+                elif _raum_von(msg) is None:
+                    log.warning("Unbekannter Befehl aus der UI: %r", msg)
                 else:
-                    # Broadcast-Nachricht an alle bekannten Teilnehmer
-                    participants = get_all_participants(whoisport)
-                    
-                    # Entferne eigenen Handle aus der Liste
-                    if handle in participants:
-                        del participants[handle]
-                    
-                    if participants:
-                        chat_ports = list(participants.values())
-                        send_broadcast_message(handle, msg, chat_ports)
-                        net_to_ui.put(f"[BROADCAST gesendet an {len(participants)} Teilnehmer] {handle}: {msg}")
-                    else:
-                        net_to_ui.put(f"[BROADCAST - keine anderen Teilnehmer] {handle}: {msg}")
+                    # Broadcast-Nachrichten an alle bekannten Teilnehmer bzw. an
+                    # die Mitglieder eines Raums ("RAUM", raum, text)
+                    raum, messages = _broadcasts_sammeln(msg, ui_to_net, zurueckgestellt, coalesce_s)
+                    with _planer.text_messen():
+                        _broadcast_ausfuehren(handle, raum, messages, whoisport, net_to_ui)
                     
             except queue.Empty:
                 pass
             
-            # 2) Empfange eingehende TCP-Verbindungen für MSG
-            try:
-                client_sock, client_addr = tcp_sock.accept()
-                # Starte Thread für diese Verbindung
-                client_thread = threading.Thread(
-                    target=handle_incoming_msg, 
-                    args=(client_sock, client_addr, net_to_ui),
-                    daemon=True
-                )
-                client_thread.start()
-                
-            except socket.timeout:
-                # Normal - kein eingehender Client
-                pass
-            except Exception as e:
-                print(f"[NETZWERK] Fehler beim Akzeptieren von Verbindung: {e}")
-            
-            # Kleine Pause um CPU zu schonen
-            time.sleep(0.01)
-            
     except Exception as e:
-        print(f"[NETZWERK] Kritischer Fehler: {e}")
+        log.error("Kritischer Fehler: %s", e)
     finally:
         tcp_sock.close()
-        print("[NETZWERK] Netzwerk-Loop beendet")
+        if _mitschnitt is not None:
+            _mitschnitt.schliessen()
+        log.info("Netzwerk-Loop beendet")
+        protokollierung.beenden()
+
+
+def _broadcast_ausfuehren(handle: str, raum: str, messages: list, whoisport: int, net_to_ui: Queue) -> None:
+    """
+    Sendet gebündelte Broadcast-Nachrichten an alle bekannten Teilnehmer bzw. an
+    die Mitglieder von raum. Läuft im Haupt-Loop, damit die Reihenfolge erhalten bleibt.
+    """
+    participants = get_all_participants(whoisport, raum=raum, handle=handle)
+
+    # Entferne eigenen Handle aus der Liste
+    participants.entfernen(handle)
+    anzahl = len(participants)
+    rueckstand = _hinter_postausgang(handle, participants, messages, raum, net_to_ui)
+
+    if raum:
+        # Raumnachrichten: Aufwand wächst mit der Raumgröße, nicht mit dem Netz
+        if anzahl:
+            if participants:
+                fehlgeschlagen = _broadcast_senden(handle, messages, participants.adressen(), raum)
+                _nicht_zugestellt(participants, fehlgeschlagen, messages, raum, net_to_ui)
+            status = f"{raum} gesendet an {anzahl} Teilnehmer"
+        else:
+            status = f"{raum} - keine anderen Mitglieder"
+        for m in messages:
+            net_to_ui.put(f"[{status}] {handle}: {m}")
+    elif anzahl:
+        # Gruppenmitglieder erreicht je ein Multicast-Datagramm, alle anderen
+        # weiterhin per TCP. Wartet bei einem Mitglied noch der Postausgang,
+        # geht alles per TCP - das Datagramm würde die älteren Nachrichten überholen.
+        frames = None
+        if _multicast is not None and not rueckstand & _multicast.mitglieder():
+            seqs = [_multicast.senden(m) for m in messages]
+            # Nicht per Multicast versendbare (zu große) Nachrichten
+            zu_gross = [m for m, seq in zip(messages, seqs) if seq is None]
+            gruppe = _multicast.mitglieder()
+            mitglieder = [e.adresse for e in participants if e.handle in gruppe]
+            andere = [e.adresse for e in participants if e.handle not in gruppe]
+            if mitglieder and zu_gross:
+                send_broadcast_batch(handle, zu_gross, mitglieder)
+            # Auch andere können das Datagramm erhalten (MHELLO noch nicht gesehen):
+            # TCP-Kopie mit derselben ID, damit sie es nur einmal anzeigen
+            frames = [_multicast.kodieren(seq, m) if seq is not None else slcp.encode_msg(handle, m)
+                      for m, seq in zip(messages, seqs)]
+        else:
+            andere = participants.adressen()
+
+        if andere:
+            fehlgeschlagen = _broadcast_senden(handle, messages, andere, frames=frames)
+            _nicht_zugestellt(participants, fehlgeschlagen, messages, "", net_to_ui)
+        for m in messages:
+            net_to_ui.put(f"[BROADCAST gesendet an {anzahl} Teilnehmer] {handle}: {m}")
+    else:
+        for m in messages:
+            net_to_ui.put(f"[BROADCAST - keine anderen Teilnehmer] {handle}: {m}")
+
+
+MAX_BATCH = 256
+
+
+def _broadcasts_sammeln(erste, ui_to_net: Queue, zurueckgestellt: deque, fenster: float) -> tuple:
+    """
+    Sammelt weitere Broadcast-Nachrichten, die innerhalb von fenster Sekunden
+    nach der ersten eintreffen, damit sie gebündelt gesendet werden.
+    Steuerbefehle und Nachrichten an ein anderes Ziel (Raum) beenden das
+    Sammeln und werden zurückgestellt.
+
+    Returns:
+        (raum, messages) - raum ist "" für Nachrichten an alle
+    """
+    raum = _raum_von(erste)
+    messages = [erste[2] if raum else erste]
+    ende = time.monotonic() + fenster
+    while len(messages) < MAX_BATCH:
+        rest = ende - time.monotonic()
+        if rest <= 0:
+            break
+        try:
+            msg = ui_to_net.get(timeout=rest)
+        except queue.Empty:
+            break
+        if _raum_von(msg) != raum:
+            # Steuerbefehl oder anderes Ziel
+            zurueckgestellt.append(msg)
+            break
+        messages.append(msg[2] if raum else msg)
+    return raum, messages
+
+
+def _raum_von(msg):
+    """
+    Ziel einer UI-Nachricht: "" für Broadcast-Text, '#raum' für ("RAUM", raum, text),
+    None für alle Befehle (Tupel) und Unbekanntes. Text des Benutzers kommt
+    immer als String und kann daher keinen Befehl bilden.
+    """
+    if isinstance(msg, str):
+        return ""
+    if isinstance(msg, tuple) and len(msg) == 3 and msg[0] == "RAUM":
+        return msg[1]
+    return None
+
+
+def _msg_einreihen(auftrag: tuple, handle: str, whoisport: int, net_to_ui: Queue) -> None:
+    """
+    Reiht einen MSG-Auftrag in der Textspur ein. Aufträge an denselben
+    Empfänger laufen nacheinander in einem einzigen Auftrag, damit zwei
+    /msg nicht in vertauschter Reihenfolge ankommen; verschiedene
+    Empfänger werden weiterhin parallel bedient.
+    """
+    ziel = auftrag[2]
+    with _msg_lock:
+        wartend = _msg_warteschlangen.get(ziel)
+        if wartend is not None:
+            wartend.append(auftrag)
+            return
+        _msg_warteschlangen[ziel] = deque([auftrag])
+    _planer.einreihen(TEXT, _msg_abarbeiten, ziel, handle, whoisport, net_to_ui)
+
+
+def _msg_abarbeiten(ziel: str, handle: str, whoisport: int, net_to_ui: Queue) -> None:
+    while True:
+        with _msg_lock:
+            wartend = _msg_warteschlangen[ziel]
+            if not wartend:
+                del _msg_warteschlangen[ziel]
+                return
+            auftrag = wartend.popleft()
+        _auftrag_ausfuehren(auftrag, handle, whoisport, net_to_ui)
+
+
+def _auftrag_ausfuehren(auftrag: tuple, handle: str, whoisport: int, net_to_ui: Queue) -> None:
+    """
+    Führt einen MSG- oder IMG-Auftrag der UI aus und meldet Fortschritt,
+    Erfolg oder Fehler als '[AUFTRAG <id>] ...'-Ereignis zurück. Kennt die UI
+    den Empfänger nicht (ip None), wird er über die lokale Discovery-Tabelle
+    (notfalls per WHO im LAN) aufgelöst.
+    """
+    art, auftrag_id, ziel, ip, port, inhalt = auftrag
+    try:
+        if ip is None:
+            eintrag = get_all_participants(whoisport, handle=handle).get(ziel)
+            if eintrag is None:
+                net_to_ui.put(f"[AUFTRAG {auftrag_id}] Unbekannter Peer: {ziel}. "
+                              f"Verwende '/who' um verfügbare Teilnehmer zu finden.")
+                return
+            ip, port = eintrag.adresse
+        
+        if art == "MSG":
+            if _postausgang is not None and _postausgang.hat(ziel):
+                # Ältere Nachrichten an ziel warten noch: zuerst zustellen
+                _postausgang_auftrag(handle, ziel, ip, port, net_to_ui)
+            if _postausgang is not None and _postausgang.hat(ziel):
+                # Weiterhin nicht (vollständig) zugestellt: dahinter einreihen,
+                # damit die neue Nachricht die älteren nicht überholt
+                if zwischenspeichern([ziel], [inhalt]):
+                    net_to_ui.put(f"[AUFTRAG {auftrag_id}] Ältere Nachrichten an {ziel} stehen noch aus, "
+                                  f"Nachricht wird danach zugestellt")
+                else:
+                    net_to_ui.put(f"[AUFTRAG {auftrag_id}] Fehler beim Senden an {ziel}")
+            elif send_msg(handle, inhalt, ip, port):
+                net_to_ui.put(f"[Du -> {ziel}] {inhalt}")
+            elif zwischenspeichern([ziel], [inhalt]):
+                net_to_ui.put(f"[AUFTRAG {auftrag_id}] {ziel} nicht erreichbar, Nachricht wird "
+                              f"zugestellt, sobald {ziel} wieder online ist")
+            else:
+                net_to_ui.put(f"[AUFTRAG {auftrag_id}] Fehler beim Senden an {ziel}")
+        
+        elif art == "IMG":
+            name = os.path.basename(inhalt)
+            gemeldet = [0]  # Zuletzt gemeldete 10%-Stufe
+            
+            def fortschritt(gesendet, gesamt):
+                stufe = gesendet * 10 // gesamt if gesamt else 10
+                if stufe > gemeldet[0] and stufe < 10:
+                    gemeldet[0] = stufe
+                    net_to_ui.put(f"[AUFTRAG {auftrag_id}] Bild an {ziel}: {stufe * 10}% ({gesendet}/{gesamt} Bytes)")
+            
+            if send_img(handle, inhalt, ip, port, fortschritt):
+                net_to_ui.put(f"[📷 Du -> {ziel}] Bild gesendet: {name}")
+            else:
+                net_to_ui.put(f"[AUFTRAG {auftrag_id}] Fehler beim Senden des Bildes an {ziel}")
+        
+        else:
+            net_to_ui.put(f"[AUFTRAG {auftrag_id}] Unbekannter Auftrag: {art}")
+    except Exception as e:
+        net_to_ui.put(f"[AUFTRAG {auftrag_id}] Fehler beim Senden an {ziel}: {e}")
+
+
+def _nicht_zugestellt(participants: PeerRegister, fehlgeschlagen: list, messages: list, raum: str,
+                      net_to_ui: Queue) -> None:
+    """
+    Legt Broadcast-Nachrichten für die Peers in fehlgeschlagen im Postausgang ab.
+    """
+    if not fehlgeschlagen or _postausgang is None:
+        return
+    # Endpunkt -> Handle über den Adressindex, ohne Scan der Teilnehmer
+    eintraege = [participants.nach_adresse(ip, port) for ip, port in fehlgeschlagen]
+    ziele = [e.handle for e in eintraege if e is not None]
+    if zwischenspeichern(ziele, messages, raum):
+        net_to_ui.put(f"[POSTAUSGANG] Für {', '.join(ziele)} zwischengespeichert")
 
 
-def send_img(handle: str, image_path: str, peer_ip: str, peer_port: int) -> bool:
+def _hinter_postausgang(handle: str, participants: PeerRegister, messages: list, raum: str,
+                        net_to_ui: Queue) -> set:
     """
-    Sendet 'IMG <handle> <size>' per TCP an einen Peer, gefolgt von den Binärdaten.
+    Reiht Broadcast-Nachrichten für Teilnehmer mit noch wartendem Postausgang
+    hinter dessen Nachrichten ein, statt sie live zu senden, nimmt diese
+    Teilnehmer aus participants und stößt die Zustellung an.
+    
+    Returns:
+        Handles dieser Teilnehmer
+    """
+    if _postausgang is None:
+        return set()
+    wartend = [e for e in participants if _postausgang.hat(e.handle)]
+    for e in wartend:
+        participants.entfernen(e.handle)
+        if zwischenspeichern([e.handle], messages, raum):
+            _planer.einreihen(TEXT, _postausgang_auftrag, handle, e.handle, e.ip, e.port, net_to_ui)
+    return {e.handle for e in wartend}
+
+
+def _heartbeat(handle: str, chat_port: int, whoisport: int, raeume: list) -> None:
+    send_join_broadcast(handle, chat_port, whoisport)
+    for raum in raeume:
+        send_sub_broadcast(handle, raum, whoisport)
+
+
+def _who_auftrag(whoisport: int, raum: str, net_to_ui: Queue) -> None:
+    """
+    Explizite WHO-Anfrage vom User - mit Logs und Peer-Zustand.
+    """
+    antwort = f"[RAUM-REPLY {raum}]" if raum else "[WHO-REPLY]"
+    try:
+        participants = who_abfragen(whoisport, timeout=3.0, silent=False, raum=raum)
+    except Exception as e:
+        log.warning("Error sending WHO broadcast: %s", e)
+        participants = None
+    if participants is None:
+        net_to_ui.put(f"{antwort} Fehler bei WHO-Anfrage.")
+    elif not participants:
+        net_to_ui.put(f"{antwort} Keine anderen Teilnehmer gefunden.")
+    else:
+        result = slcp.encode_peerliste(
+            (e.handle, e.ip, e.port, _gesundheit.beschreibung(e.adresse)) for e in participants)
+        net_to_ui.put(f"{antwort} {result}")
+
+
+def _postausgang_auftrag(handle: str, ziel: str, ip: str, port: int, net_to_ui: Queue) -> None:
+    try:
+        anzahl = postausgang_zustellen(handle, ziel, ip, port)
+        if anzahl:
+            net_to_ui.put(f"[POSTAUSGANG] {anzahl} zwischengespeicherte Nachricht(en) an {ziel} zugestellt")
+    except OSError as e:
+        log.info("Postausgang für %s noch nicht zustellbar: %s", ziel, e)
+
+
+def _postausgang_nachliefern(handle: str, whoisport: int, net_to_ui: Queue) -> None:
+    """
+    Versucht, den Postausgang aller bekannten Empfänger zuzustellen.
+    """
+    postausgang = _postausgang
+    if postausgang is None:
+        return
+    participants = get_all_participants(whoisport, handle=handle)
+    for ziel in postausgang.empfaenger():
+        eintrag = participants.get(ziel)
+        if eintrag is not None and ziel != handle:
+            _postausgang_auftrag(handle, ziel, eintrag.ip, eintrag.port, net_to_ui)
+
+
+def _proben_loop(intervall: float = 1.0):
+    """
+    Probt regelmäßig tote Peers, deren Backoff abgelaufen ist, damit sie
+    auch ohne neuen Nachrichtenverkehr wieder als erreichbar erkannt werden.
+    """
+    while True:
+        time.sleep(intervall)
+        try:
+            _gesundheit.proben()
+        except Exception as e:
+            log.warning("Fehler beim Proben: %s", e)
+
+
+def _accept_loop(tcp_sock: socket.socket, pool: VerbindungsPool):
+    """
+    Nimmt eingehende TCP-Verbindungen an und übergibt sie dem Handler-Pool.
+    Läuft in einem eigenen Thread, damit der Listen-Backlog auch dann
+    zügig geleert wird, wenn der Haupt-Loop mit UI-Aufträgen beschäftigt ist.
+    """
+    while True:
+        try:
+            client_sock, client_addr = tcp_sock.accept()
+            pool.annehmen(client_sock, client_addr)
+        except OSError as e:
+            if tcp_sock.fileno() == -1:
+                break  # Socket wurde geschlossen
+            log.warning("Fehler beim Akzeptieren von Verbindung: %s", e)
+            time.sleep(0.1)
+
+
+def _recv_line(sock: socket.socket, buffer: bytes = b"", limit: int = 4096) -> tuple:
+    """
+    Liest eine mit '\\n' terminierte Zeile vom Socket.
+
+    Args:
+        sock: TCP-Socket
+        buffer: Bereits empfangene, noch nicht verarbeitete Daten
+        limit: Maximale Zeilenlänge
+
+    Returns:
+        (zeile, rest) - zeile ohne '\\n' (None bei EOF/Überlänge), rest = Daten nach der Zeile
+    """
+    while b'\n' not in buffer:
+        if len(buffer) > limit:
+            return None, buffer
+        chunk = sock.recv(4096)
+        if not chunk:
+            return None, buffer
+        buffer += chunk
+    zeile, rest = buffer.split(b'\n', 1)
+    return zeile.decode('utf-8', errors='ignore').strip(), rest
+
+
+# Chunk-Übertragung (fortsetzbar) ab dieser Dateigröße
+CHUNK_SCHWELLE = 1024 * 1024
+CHUNK_GROESSE = 256 * 1024
+CHUNK_MAX = 4 * 1024 * 1024      # Größter akzeptierter Chunk beim Empfang
+CHUNK_FENSTER = 4                # Unbestätigte Chunks, die der Sender vorausschickt
+IMG_MAX_VERSUCHE = 5             # Verbindungsversuche pro Bild (mit Fortsetzung)
+
+_bildspeicher = None
+_staging = None
+_max_bild_bytes = 64 * 1024 * 1024  # Größtes angenommenes Bild (max_bild_mb)
+_bildspeicher_lock = threading.Lock()
+
+
+def get_bildspeicher() -> BildSpeicher:
+    """
+    Liefert den Bildspeicher dieses Prozesses (wird beim ersten Aufruf
+    aus imagepath/imagecache_mb in config.toml angelegt).
+    """
+    global _bildspeicher, _staging, _max_bild_bytes
+    with _bildspeicher_lock:
+        if _bildspeicher is None:
+            try:
+                import toml
+                config = toml.load("config.toml")
+                image_dir = config.get("imagepath", "./images")
+                cache_mb = config.get("imagecache_mb", 512)
+                staging_timeout = config.get("staging_timeout", 3600)
+                max_bild_mb = config.get("max_bild_mb", 64)
+            except:
+                image_dir = "./images"
+                cache_mb = 512
+                staging_timeout = 3600
+                max_bild_mb = 64
+            _max_bild_bytes = int(max_bild_mb * 1024 * 1024)
+            _bildspeicher = BildSpeicher(image_dir, int(cache_mb) * 1024 * 1024)
+            _staging = StagingBereich(os.path.join(image_dir, STAGING_ORDNER), float(staging_timeout))
+        return _bildspeicher
+
+
+def get_staging() -> StagingBereich:
+    """
+    Liefert den Staging-Bereich für Teilübertragungen dieses Prozesses.
+    """
+    get_bildspeicher()
+    return _staging
+
+
+def send_img(handle: str, image_path: str, peer_ip: str, peer_port: int, fortschritt=None) -> bool:
+    """
+    Sendet ein Bild per TCP an einen Peer.
+
+    Zuerst wird 'HAVE <handle> <hash> <size>' gesendet. Antwortet der Empfänger
+    mit 'HAVE_ACK YES', besitzt er das Bild bereits und die Übertragung entfällt.
+    Bei 'HAVE_ACK NO' folgt auf derselben Verbindung 'IMG <handle> <size> <hash>'
+    mit den Binärdaten. Versteht der Empfänger HAVE nicht (Verbindung wird ohne
+    Antwort geschlossen), wird klassisch 'IMG <handle> <size>' gesendet.
+
+    Große Bilder werden fortsetzbar in Chunks übertragen, wenn der Empfänger
+    'HAVE_ACK NO CHUNK' meldet (siehe _send_img_chunked). Bricht die Verbindung
+    ab, wird bis zu IMG_MAX_VERSUCHE mal neu verbunden und fortgesetzt.
     
     Args:
         handle: Sender-Handle
         image_path: Pfad zur zu sendenden Bilddatei
         peer_ip: IP-Adresse des Empfängers
         peer_port: TCP-Port des Empfängers
+        fortschritt: Optionaler Callback fortschritt(gesendet, gesamt) in Bytes
         
     Returns:
         True wenn erfolgreich, False bei Fehlern
     """
     if not os.path.exists(image_path):
-        print(f"[IMG] Bilddatei nicht gefunden: {image_path}")
+        img_log.warning("Bilddatei nicht gefunden: %s", image_path)
         return False
     
     try:
-        # Dateigröße ermitteln
+        # Dateigröße und Inhalts-Hash ermitteln
         file_size = os.path.getsize(image_path)
-        print(f"[IMG] Sende Bild '{image_path}' ({file_size} Bytes) an {peer_ip}:{peer_port}")
+        digest = datei_hash(image_path)
+    except Exception as e:
+        img_log.warning("Fehler beim Lesen von '%s': %s", image_path, e)
+        return False
+    
+    img_log.debug("Sende Bild '%s' (%s Bytes) an %s:%s", image_path, file_size, peer_ip, peer_port)
+    
+    for versuch in range(1, IMG_MAX_VERSUCHE + 1):
+        try:
+            if _send_img_versuch(handle, image_path, file_size, digest, peer_ip, peer_port, fortschritt):
+                img_log.info("Bild erfolgreich an %s:%s gesendet", peer_ip, peer_port)
+                return True
+            return False
+        except (OSError, ConnectionError) as e:
+            img_log.warning("Verbindung zu %s:%s abgebrochen (Versuch %s/%s): %s", peer_ip, peer_port, versuch, IMG_MAX_VERSUCHE, e)
+            if versuch < IMG_MAX_VERSUCHE:
+                time.sleep(min(2 ** (versuch - 1), 10))
+        except Exception as e:
+            img_log.warning("Fehler beim Senden an %s:%s: %s", peer_ip, peer_port, e)
+            return False
+    
+    img_log.warning("Senden an %s:%s endgültig fehlgeschlagen", peer_ip, peer_port)
+    return False
+
+
+def _send_img_versuch(handle: str, image_path: str, file_size: int, digest: str, peer_ip: str, peer_port: int,
+                      fortschritt=None) -> bool:
+    """
+    Ein Verbindungsversuch von send_img. Verbindungsfehler werden als
+    OSError weitergereicht, damit send_img neu verbinden kann.
+    """
+    # TCP-Verbindung aufbauen
+    tcp_socket = _gesundheit.verbinden(peer_ip, peer_port)
+    try:
+        # 1. Vorabprüfung: Hat der Empfänger das Bild schon?
+        have = f"HAVE {handle} {digest} {file_size}\n".encode('utf-8')
+        tcp_socket.sendall(have)
+        if _mitschnitt is not None:
+            _mitschnitt.aufzeichnen(mitschnitt.AUS, mitschnitt.TCP, (peer_ip, peer_port), have)
+        tcp_socket.settimeout(5.0)
+        try:
+            antwort, _ = _recv_line(tcp_socket)
+        except socket.timeout:
+            antwort = None
+        tcp_socket.settimeout(None)
         
-        # TCP-Verbindung aufbauen
-        tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        tcp_socket.connect((peer_ip, peer_port))
+        if antwort == "HAVE_ACK YES":
+            img_log.info("%s:%s hat das Bild bereits, Übertragung übersprungen", peer_ip, peer_port)
+            return True
         
-        # 1. IMG-Header senden
-        img_header = f"IMG {handle} {file_size}\n"
-        tcp_socket.sendall(img_header.encode('utf-8'))
+        if antwort == "HAVE_ACK NO CHUNK" and file_size >= CHUNK_SCHWELLE:
+            return _send_img_chunked(tcp_socket, handle, image_path, file_size, digest, fortschritt)
         
-        # 2. Binärdaten senden
+        if antwort and antwort.startswith("HAVE_ACK NO"):
+            img_header = f"IMG {handle} {file_size} {digest}\n".encode('utf-8')
+        else:
+            # Alter Client ohne HAVE-Unterstützung: neue Verbindung, klassischer Header
+            tcp_socket.close()
+            tcp_socket = _gesundheit.verbinden(peer_ip, peer_port)
+            tcp_socket.settimeout(None)
+            img_header = f"IMG {handle} {file_size}\n".encode('utf-8')
+        
+        # 2. IMG-Header senden
+        tcp_socket.sendall(img_header)
+        if _mitschnitt is not None:
+            _mitschnitt.aufzeichnen(mitschnitt.AUS, mitschnitt.TCP, (peer_ip, peer_port), img_header,
+                                    len(img_header) + file_size)
+        
+        # 3. Binärdaten senden
+        gesendet = 0
         with open(image_path, 'rb') as img_file:
             while True:
-                chunk = img_file.read(4096)  # 4KB Chunks
+                chunk = img_file.read(BULK_BLOCK)
                 if not chunk:
                     break
+                _bulk_freigabe(len(chunk))
                 tcp_socket.sendall(chunk)
-        
-        print(f"[IMG] Bild erfolgreich an {peer_ip}:{peer_port} gesendet")
+                gesendet += len(chunk)
+                if fortschritt:
+                    fortschritt(gesendet, file_size)
+        return True
+    finally:
         tcp_socket.close()
+
+
+def _send_img_chunked(tcp_socket: socket.socket, handle: str, image_path: str, file_size: int, digest: str,
+                      fortschritt=None) -> bool:
+    """
+    Fortsetzbare Chunk-Übertragung auf einer bestehenden Verbindung:
+
+        -> IMGC <handle> <transfer_id> <size> <hash> <chunk_size>
+        <- RESUME <offset>            (bereits bestätigte Bytes)
+        -> CHUNK <offset> <len> <crc32>  + Daten   (wiederholt)
+        <- ACK <offset>               (pro Chunk, bis zu CHUNK_FENSTER im Voraus)
+        <- DONE | FAIL
+
+    Antwortet der Empfänger mit NAK oder bricht ab, wird ein OSError geworfen,
+    damit send_img neu verbindet und am bestätigten Offset fortsetzt.
+    """
+    tid = transfer_id(handle, digest)
+    imgc_kopf = f"IMGC {handle} {tid} {file_size} {digest} {CHUNK_GROESSE}\n".encode('utf-8')
+    tcp_socket.sendall(imgc_kopf)
+    if _mitschnitt is not None:
+        _mitschnitt.aufzeichnen(mitschnitt.AUS, mitschnitt.TCP, tcp_socket.getpeername(), imgc_kopf,
+                                len(imgc_kopf) + file_size)
+    
+    tcp_socket.settimeout(30.0)
+    zeile, puffer = _recv_line(tcp_socket)
+    if zeile == "BUSY":
+        raise ConnectionError("Übertragung wird noch von einer alten Verbindung empfangen")
+    if not zeile or not zeile.startswith("RESUME "):
+        raise ConnectionError(f"Unerwartete Antwort auf IMGC: {zeile}")
+    offset = int(zeile.split()[1])
+    if offset > 0:
+        img_log.info("Setze Übertragung %s bei %s/%s Bytes fort", tid[:8], offset, file_size)
+    
+    bestaetigt = offset
+    unbestaetigt = 0
+    with open(image_path, 'rb') as img_file:
+        img_file.seek(offset)
+        while offset < file_size or unbestaetigt > 0:
+            # Chunks senden, solange das Fenster nicht voll ist
+            if offset < file_size and unbestaetigt < CHUNK_FENSTER:
+                daten = img_file.read(CHUNK_GROESSE)
+                if not daten:
+                    raise ConnectionError("Bilddatei wurde während der Übertragung verändert")
+                kopf = f"CHUNK {offset} {len(daten)} {zlib.crc32(daten):08x}\n".encode('utf-8')
+                tcp_socket.sendall(kopf)
+                # In Blöcken senden, damit Text zwischendurch Vorrang bekommt
+                for i in range(0, len(daten), BULK_BLOCK):
+                    block = daten[i:i + BULK_BLOCK]
+                    _bulk_freigabe(len(block))
+                    tcp_socket.sendall(block)
+                offset += len(daten)
+                unbestaetigt += 1
+                continue
+            
+            # Auf Bestätigung warten
+            zeile, puffer = _recv_line(tcp_socket, puffer)
+            if not zeile or not zeile.startswith("ACK "):
+                raise ConnectionError(f"Chunk nicht bestätigt bei {bestaetigt}: {zeile}")
+            bestaetigt = int(zeile.split()[1])
+            unbestaetigt -= 1
+            if fortschritt:
+                fortschritt(bestaetigt, file_size)
+    
+    zeile, _ = _recv_line(tcp_socket, puffer)
+    if zeile == "DONE":
         return True
-        
-    except Exception as e:
-        print(f"[IMG] Fehler beim Senden an {peer_ip}:{peer_port}: {e}")
-        return False
+    img_log.warning("Empfänger meldet Fehler nach Übertragung: %s", zeile)
+    return False
 
 
 def handle_incoming_msg(client_sock: socket.socket, client_addr: tuple, net_to_ui: Queue):
@@ -328,36 +1308,253 @@ def handle_incoming_msg(client_sock: socket.socket, client_addr: tuple, net_to_u
         # Ersten Teil empfangen (Header)
         data = client_sock.recv(4096)
         if data:
+            if _mitschnitt is not None:
+                _mitschnitt.aufzeichnen(mitschnitt.EIN, mitschnitt.TCP, client_addr, data)
+            # Verteilung über das Byte-Präfix; dekodiert werden nur die
+            # Felder, die der jeweilige Handler braucht
+            if data.startswith((b"MSG ", b"RMSG ", b"MCAST ")):
+                # Häufigster Fall: einzelne Chatnachricht
+                try:
+                    msg = slcp.parse_chat(data)
+                except slcp.SlcpFehler as e:
+                    log.debug("%s", e)
+                else:
+                    log.debug("Eingehende Nachricht von %s: %s", client_addr, msg)
+                    _chat_zustellen(msg, data, client_addr[0], net_to_ui)
+            # Vorabprüfung für inhaltsadressierte Bilder: HAVE <handle> <hash> <size>
+            elif data.startswith(b"HAVE "):
+                handle_incoming_have(client_sock, client_addr, data, net_to_ui)
+                return  # Socket wird in handle_incoming_have geschlossen
+            # Fortsetzbare Chunk-Übertragung: IMGC <handle> <id> <size> <hash> <chunk_size>
+            elif data.startswith(b"IMGC "):
+                header, rest = _recv_line(client_sock, data)
+                handle_incoming_img_chunked(client_sock, client_addr, header or "", net_to_ui, rest)
+                return  # Socket wird in handle_incoming_img_chunked geschlossen
             # Für IMG-Nachrichten: Header und mögliche Binärdaten trennen
-            if data.startswith(b"IMG"):
+            elif data.startswith(b"IMG "):
                 # Finde das Ende der Header-Zeile (\n)
                 header_end = data.find(b'\n')
                 if header_end != -1:
                     header = data[:header_end].decode('utf-8', errors='ignore').strip()
                     remaining_data = data[header_end + 1:]  # Restliche Daten nach dem Header
-                    print(f"[NETZWERK] IMG-Header von {client_addr}: {header}")
+                    log.debug("IMG-Header von %s: %s", client_addr, header)
                     handle_incoming_img(client_sock, client_addr, header, net_to_ui, remaining_data)
                     return  # Socket wird in handle_incoming_img geschlossen
                 else:
-                    print(f"[NETZWERK] Ungültiger IMG-Header (kein \\n gefunden)")
+                    log.warning("Ungültiger IMG-Header (kein \\n gefunden)")
                     net_to_ui.put(f"[FEHLER] Ungültiger IMG-Header von {client_addr[0]}")
+            elif data.startswith(b"RELAY "):
+                # Broadcast über den Relay-Baum: zustellen und Teilbaum weiterversorgen
+                handle_incoming_relay(client_sock, client_addr, data, net_to_ui)
+            elif data.startswith(b"BATCH "):
+                # Gebündelte Nachrichten: in Reihenfolge einzeln zustellen
+                handle_incoming_batch(client_sock, client_addr, data, net_to_ui)
+            elif data.startswith(b"REPAIR "):
+                # Nachforderung verlorener Multicast-Nachrichten
+                header, _ = _recv_line(client_sock, data)
+                if _multicast is not None and header:
+                    _multicast.reparatur_beantworten(client_sock, header)
             else:
-                # Normal MSG-Nachricht
-                message = data.decode('utf-8', errors='ignore').strip()
-                print(f"[NETZWERK] Eingehende Nachricht von {client_addr}: {message}")
-                
-                if message.startswith("MSG"):
-                    parts = message.split(maxsplit=2)
-                    if len(parts) >= 3:
-                        _, sender, text = parts
-                        net_to_ui.put(f"[{sender}] {text}")
-                    else:
-                        print(f"[NETZWERK] Ungültiges MSG-Format: {message}")
-                else:
-                    print(f"[NETZWERK] Unbekannter Nachrichtentyp: {message}")
-                
+                log.warning("Unbekannter Nachrichtentyp: %s", protokollierung.roh(data[:80]))
+
     except Exception as e:
-        print(f"[NETZWERK] Fehler beim Verarbeiten eingehender Nachricht: {e}")
+        log.warning("Fehler beim Verarbeiten eingehender Nachricht: %s", e)
+    finally:
+        client_sock.close()
+
+
+MAX_BATCH_FRAME = 64 * 1024
+
+
+def handle_incoming_batch(client_sock: socket.socket, client_addr: tuple, data: bytes, net_to_ui: Queue):
+    """
+    Zerlegt einen Batch-Frame (siehe encode_batch) und stellt die enthaltenen
+    MSG-, RMSG- bzw. QMSG-Nachrichten in ihrer ursprünglichen Reihenfolge zu.
+    
+    Der Postausgang eines Senders kann mehrere Batch-Frames auf derselben
+    Verbindung schicken; enthielten sie QMSG-Nachrichten, wird nach dem Ende
+    der Verbindung (Sender-Seite) mit 'ACK <höchste angenommene ID>' quittiert.
+    """
+    header, puffer = _recv_line(client_sock, data)
+    quittung = None  # Sender der QMSG-Nachrichten
+    while header:
+        parts = header.split()
+        if len(parts) != 3 or parts[0] != "BATCH" or not parts[2].isdigit() or int(parts[2]) > MAX_BATCH:
+            log.warning("Ungültiger BATCH-Header von %s: %s", client_addr, header)
+            return
+        
+        ergebnis = _batch_frames_zustellen(client_sock, client_addr, int(parts[2]), puffer, net_to_ui)
+        if ergebnis is None:
+            return
+        sender, puffer = ergebnis
+        quittung = sender or quittung
+        
+        # Weitere Batch-Frames auf derselben Verbindung (bis der Sender schließt)
+        header, puffer = _recv_line(client_sock, puffer)
+    
+    if quittung is not None:
+        # Erst persistieren, dann quittieren: nach einem Neustart erneut
+        # zugestellte Nachrichten werden so als Duplikate erkannt
+        _empfangsstand.speichern()
+        client_sock.sendall(f"ACK {_empfangsstand.bis(quittung)}\n".encode('utf-8'))
+
+
+def _batch_frames_zustellen(client_sock: socket.socket, client_addr: tuple, anzahl: int, puffer: bytes,
+                            net_to_ui: Queue, frames: list = None):
+    """
+    Liest anzahl Frames eines Batch-Frames und stellt sie zu.
+    Gültige Frames werden zusätzlich an frames angehängt (falls übergeben).
+    
+    Returns:
+        (sender, restpuffer) - sender der enthaltenen QMSG-Nachrichten oder None;
+        None bei unvollständigem Batch
+    """
+    quittung = None
+    for _ in range(anzahl):
+        laenge, puffer = _recv_line(client_sock, puffer)
+        if not laenge or not laenge.isdigit() or int(laenge) > MAX_BATCH_FRAME:
+            log.warning("BATCH von %s unvollständig oder ungültig", client_addr)
+            return None
+        laenge = int(laenge)
+        while len(puffer) < laenge:
+            chunk = client_sock.recv(65536)
+            if not chunk:
+                log.warning("BATCH von %s unvollständig", client_addr)
+                return None
+            puffer += chunk
+        frame, puffer = puffer[:laenge], puffer[laenge:]
+        
+        try:
+            msg = slcp.parse_chat(frame)
+        except slcp.SlcpFehler as e:
+            log.debug("Im BATCH von %s: %s", client_addr, e)
+            continue
+        if isinstance(msg, slcp.Gespeichert):
+            quittung = msg.handle
+            if not _gespeichert_annehmen(msg):
+                continue
+        if frames is not None:
+            frames.append(frame)
+        # Über einen Relay-Knoten (frames gesetzt) ist die Adresse des Absenders unbekannt
+        _chat_zustellen(msg, frame, client_addr[0] if frames is None else None, net_to_ui)
+    return quittung, puffer
+
+
+def handle_incoming_relay(client_sock: socket.socket, client_addr: tuple, data: bytes, net_to_ui: Queue):
+    """
+    Verarbeitet einen RELAY-Frame (siehe relay.py): Nachrichten einmalig
+    zustellen und anschließend an den mitgeschickten Teilbaum weiterleiten.
+    """
+    header, puffer = _recv_line(client_sock, data)
+    parts = header.split() if header else []
+    if (len(parts) != 6 or not all(p.isdigit() for p in parts[3:])
+            or int(parts[4]) > MAX_BATCH or int(parts[5]) > relay.MAX_ZIELE):
+        log.warning("Ungültiger RELAY-Header von %s: %s", client_addr, header)
+        return
+    _, origin, nachricht_id, fanout, anzahl_frames, anzahl_ziele = parts
+    if int(fanout) < 1:
+        log.warning("Ungültiger RELAY-Fanout von %s: %s", client_addr, fanout)
+        return
+    # Fanout aus dem Frame nie über den eigenen (bzw. MAX_FANOUT) hinaus übernehmen
+    fanout = min(int(fanout), _relay_fanout or relay.MAX_FANOUT)
+    
+    zeile, puffer = _recv_line(client_sock, puffer, limit=relay.MAX_ZIELE * 24)
+    try:
+        ziele = relay.parse_ziele(zeile or "", int(anzahl_ziele))
+    except ValueError as e:
+        log.warning("RELAY von %s: %s", client_addr, e)
+        return
+    
+    if not _relay_filter.neu((origin, nachricht_id)):
+        log.debug("RELAY %s von %s bereits erhalten", nachricht_id, origin)
+        return
+    
+    frames = []
+    if _batch_frames_zustellen(client_sock, client_addr, int(anzahl_frames), puffer, net_to_ui, frames) is None:
+        return
+    if sum(len(f) for f in frames) > relay.MAX_NUTZLAST:
+        log.warning("RELAY %s von %s zu groß, nicht weitergeleitet", nachricht_id, client_addr)
+        return
+    if ziele and frames:
+        fehlgeschlagen = relay_senden(origin, nachricht_id, fanout, frames, ziele, max_ersatz=relay.MAX_ERSATZ)
+        if fehlgeschlagen:
+            log.warning("RELAY %s: %s Peers im Teilbaum nicht erreichbar", nachricht_id, len(fehlgeschlagen))
+
+
+def _gespeichert_annehmen(msg) -> bool:
+    """
+    Nimmt eine zwischengespeicherte Nachricht nur an, wenn ihre ID größer ist
+    als die zuletzt von diesem Sender angenommene. Das verwirft Duplikate
+    (z.B. nach einer nicht quittierten Zustellung) und hält die Reihenfolge.
+    """
+    if not _empfangsstand.annehmen(msg.handle, msg.id):
+        log.debug("Duplikat %s von %s verworfen", msg.id, msg.handle)
+        return False
+    return True
+
+
+def _chat_zustellen(msg, frame: bytes, sender_ip, net_to_ui: Queue) -> None:
+    """
+    Meldet eine empfangene Chatnachricht an die UI. TCP-Kopien von
+    Multicast-Nachrichten gehen bei aktivem Multicast durch dessen
+    Duplikaterkennung, damit sie neben dem Datagramm nicht doppelt erscheinen.
+    """
+    if isinstance(msg, slcp.GruppenMsg) and _multicast is not None:
+        _multicast.verarbeiten(frame.decode('utf-8', errors='ignore'), sender_ip)
+    else:
+        chat_melden(net_to_ui, _chat_anzeige(msg), msg.handle)
+
+
+def _chat_anzeige(msg) -> str:
+    """
+    UI-Zeile für eine empfangene MSG-, RMSG-, QMSG- bzw. MCAST-Nachricht.
+    """
+    if isinstance(msg, slcp.Gespeichert):
+        zeit = time.strftime("%H:%M", time.localtime(int(msg.id, 16) / 1e9))
+        if msg.raum:
+            return f"[{msg.raum}] {msg.handle} ({zeit}, zwischengespeichert): {msg.text}"
+        return f"[{msg.handle}] ({zeit}, zwischengespeichert) {msg.text}"
+    if isinstance(msg, slcp.RaumMsg):
+        return f"[{msg.raum}] {msg.handle}: {msg.text}"
+    return f"[{msg.handle}] {msg.text}"
+
+
+def handle_incoming_have(client_sock: socket.socket, client_addr: tuple, data: bytes, net_to_ui: Queue):
+    """
+    Beantwortet 'HAVE <handle> <hash> <size>'. Ist das Bild bereits im
+    Bildspeicher, wird 'HAVE_ACK YES' gesendet und die Verbindung beendet,
+    sonst 'HAVE_ACK NO CHUNK' und der folgende IMG- bzw. IMGC-Header wird auf
+    derselben Verbindung an den passenden Handler übergeben.
+    """
+    try:
+        header, rest = _recv_line(client_sock, data)
+        parts = header.split() if header else []
+        if len(parts) < 4 or not ist_gueltiger_hash(parts[2]):
+            img_log.warning("Ungültiger HAVE-Header von %s: %s", client_addr, header)
+            return
+        
+        _, sender, digest, _ = parts
+        speicher = get_bildspeicher()
+        if speicher.hat(digest):
+            client_sock.sendall(b"HAVE_ACK YES\n")
+            full_path = speicher.pfad(digest)
+            img_log.info("Bild %s… von %s bereits vorhanden", digest[:12], sender)
+            net_to_ui.put(f"[📷 BILD] {sender} hat ein Bild gesendet → {full_path}")
+            return
+        
+        # CHUNK: Sender darf fortsetzbar in Chunks übertragen (IMGC)
+        client_sock.sendall(b"HAVE_ACK NO CHUNK\n")
+        img_header, rest = _recv_line(client_sock, rest)
+        if not img_header or not img_header.startswith("IMG"):
+            img_log.warning("Kein IMG-Header nach HAVE von %s", client_addr)
+            return
+        if img_header.startswith("IMGC "):
+            handle_incoming_img_chunked(client_sock, client_addr, img_header, net_to_ui, rest)
+        else:
+            handle_incoming_img(client_sock, client_addr, img_header, net_to_ui, rest)
+        return  # Socket wird im jeweiligen Handler geschlossen
+    except Exception as e:
+        img_log.warning("Fehler bei HAVE-Anfrage von %s: %s", client_addr, e)
     finally:
         client_sock.close()
 
@@ -366,70 +1563,75 @@ def handle_incoming_img(client_sock: socket.socket, client_addr: tuple, header:
     """
     Verarbeitet eingehende IMG-Nachrichten und speichert Bilder lokal.
     
+    Die Bilddaten werden direkt in eine Datei im Staging-Bereich geschrieben
+    (nie vollständig im Speicher gehalten) und erst nach der Hash-Prüfung in
+    den Bildspeicher übernommen. Größere Bilder als max_bild_mb werden abgelehnt.
+    
     Args:
         client_sock: TCP-Socket der Verbindung
         client_addr: Adresse des Senders
-        header: IMG-Header ("IMG <Handle> <Size>")
+        header: IMG-Header ("IMG <Handle> <Size> [<Hash>]")
         net_to_ui: Queue für UI-Nachrichten
         initial_data: Bereits empfangene Bilddaten aus dem ersten recv()
     """
+    tmp_pfad = None
     try:
         # IMG-Header parsen
         parts = header.split()
         if len(parts) < 3:
-            print(f"[IMG] Ungültiger IMG-Header: {header}")
+            img_log.warning("Ungültiger IMG-Header: %s", header)
             net_to_ui.put(f"[FEHLER] Ungültiges Bildformat von {client_addr[0]}")
             return
             
-        _, sender, size_str = parts
+        sender, size_str = parts[1], parts[2]
+        announced_hash = parts[3] if len(parts) >= 4 else None
         try:
             expected_size = int(size_str)
         except ValueError:
-            print(f"[IMG] Ungültige Bildgröße: {size_str}")
+            img_log.warning("Ungültige Bildgröße: %s", size_str)
             net_to_ui.put(f"[FEHLER] Ungültige Bildgröße von {sender}")
             return
         
-        print(f"[IMG] Empfange Bild von {sender} ({expected_size} Bytes)")
-        
-        # Bilddaten empfangen
-        received_data = initial_data  # Beginne mit bereits empfangenen Daten
-        remaining = expected_size - len(initial_data)
-        
-        while remaining > 0:
-            chunk_size = min(4096, remaining)
-            chunk = client_sock.recv(chunk_size)
-            if not chunk:
-                print(f"[IMG] Verbindung unterbrochen (erwartet: {expected_size}, erhalten: {len(received_data)})")
-                net_to_ui.put(f"[FEHLER] Bild von {sender} unvollständig empfangen")
-                return
-            
-            received_data += chunk
-            remaining -= len(chunk)
-        
-        # Dateiname generieren (mit Zeitstempel für Eindeutigkeit)
-        import datetime
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{sender}_{timestamp}.jpg"  # Standardmäßig .jpg
+        staging = get_staging()
+        if not 0 <= expected_size <= _max_bild_bytes:
+            img_log.warning("Bild von %s abgelehnt: %s Bytes (Maximum %s)", sender, expected_size, _max_bild_bytes)
+            net_to_ui.put(f"[FEHLER] Bild von {sender} zu groß ({expected_size} Bytes)")
+            return
         
-        # Bildverzeichnis aus config.toml oder Standard
-        try:
-            import toml
-            config = toml.load("config.toml")
-            image_dir = config.get("imagepath", "./images")
-        except:
-            image_dir = "./images"
+        img_log.debug("Empfange Bild von %s (%s Bytes)", sender, expected_size)
         
-        # Verzeichnis erstellen falls nicht vorhanden
-        os.makedirs(image_dir, exist_ok=True)
+        # Bilddaten empfangen und direkt in die Staging-Datei schreiben
+        tmp_pfad = staging.temp_datei()
+        h = hashlib.sha256()
+        with open(tmp_pfad, 'wb') as f:
+            chunk = initial_data[:expected_size]  # Beginne mit bereits empfangenen Daten
+            received = 0
+            while True:
+                if chunk:
+                    f.write(chunk)
+                    h.update(chunk)
+                    received += len(chunk)
+                if received >= expected_size:
+                    break
+                chunk = client_sock.recv(min(BULK_BLOCK, expected_size - received))
+                if not chunk:
+                    img_log.warning("Verbindung unterbrochen (erwartet: %s, erhalten: %s)", expected_size, received)
+                    net_to_ui.put(f"[FEHLER] Bild von {sender} unvollständig empfangen")
+                    return
+                # Langsamer lesen bremst den Sender über TCP-Flusskontrolle
+                _bulk_freigabe(len(chunk), empfang=True)
         
-        # Vollständiger Pfad
-        full_path = os.path.join(image_dir, filename)
+        # Inhaltsadressiert speichern: Dateiname ist der SHA-256-Hash
+        digest = h.hexdigest()
+        if announced_hash and announced_hash != digest:
+            img_log.warning("Hash stimmt nicht überein (angekündigt: %s, erhalten: %s)", announced_hash, digest)
+            net_to_ui.put(f"[FEHLER] Bild von {sender} beschädigt empfangen")
+            return
         
-        # Bild speichern
-        with open(full_path, 'wb') as img_file:
-            img_file.write(received_data)
+        full_path = get_bildspeicher().uebernehmen(digest, tmp_pfad)
+        tmp_pfad = None
         
-        print(f"[IMG] Bild von {sender} gespeichert: {full_path}")
+        img_log.info("Bild von %s gespeichert: %s", sender, full_path)
         net_to_ui.put(f"[📷 BILD] {sender} hat ein Bild gesendet → {full_path}")
         
         # Optional: Bildbetrachter öffnen (Windows)
@@ -438,14 +1640,140 @@ def handle_incoming_img(client_sock: socket.socket, client_addr: tuple, header:
             import platform
             if platform.system() == "Windows":
                 subprocess.run(['start', full_path], shell=True, check=False)
-                print(f"[IMG] Bildbetrachter geöffnet für: {full_path}")
+                img_log.info("Bildbetrachter geöffnet für: %s", full_path)
         except:
             pass  # Wenn Bildbetrachter nicht funktioniert, ignorieren
             
     except Exception as e:
-        print(f"[IMG] Fehler beim Empfangen von Bild: {e}")
+        img_log.warning("Fehler beim Empfangen von Bild: %s", e)
         net_to_ui.put(f"[FEHLER] Bild von {client_addr[0]} konnte nicht gespeichert werden")
     finally:
+        if tmp_pfad is not None:
+            try:
+                os.remove(tmp_pfad)
+            except OSError:
+                pass
+        client_sock.close()
+
+
+def _verbindung_abbrechen(sock: socket.socket) -> None:
+    """
+    Beendet eine Verbindung, deren Empfangs-Thread gerade in recv/send blockiert.
+    """
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def handle_incoming_img_chunked(client_sock: socket.socket, client_addr: tuple, header: str, net_to_ui: Queue, initial_data: bytes = b""):
+    """
+    Empfängt eine fortsetzbare Chunk-Übertragung (Protokoll siehe _send_img_chunked).
+
+    Jeder Chunk wird per CRC32 geprüft und erst dann im Staging-Bereich
+    angehängt und bestätigt. Bei Abbruch bleiben die bestätigten Daten liegen,
+    sodass der Sender beim nächsten IMGC mit derselben Transfer-ID fortsetzt.
+    
+    Args:
+        client_sock: TCP-Socket der Verbindung
+        client_addr: Adresse des Senders
+        header: IMGC-Header ("IMGC <Handle> <Transfer-ID> <Size> <Hash> <Chunk-Size>")
+        net_to_ui: Queue für UI-Nachrichten
+        initial_data: Bereits empfangene Daten nach dem Header
+    """
+    staging = get_staging()
+    tid = None
+    try:
+        parts = header.split()
+        if (len(parts) < 6 or not TRANSFER_ID_MUSTER.match(parts[2])
+                or not ist_gueltiger_hash(parts[4])):
+            img_log.warning("Ungültiger IMGC-Header: %s", header)
+            net_to_ui.put(f"[FEHLER] Ungültiges Bildformat von {client_addr[0]}")
+            return
+        
+        sender, digest = parts[1], parts[4]
+        try:
+            expected_size = int(parts[3])
+        except ValueError:
+            img_log.warning("Ungültige Bildgröße: %s", parts[3])
+            net_to_ui.put(f"[FEHLER] Ungültige Bildgröße von {sender}")
+            return
+        
+        if not 0 <= expected_size <= _max_bild_bytes:
+            img_log.warning("Bild von %s abgelehnt: %s Bytes (Maximum %s)", sender, expected_size, _max_bild_bytes)
+            net_to_ui.put(f"[FEHLER] Bild von {sender} zu groß ({expected_size} Bytes)")
+            return
+        
+        # Eine hängende alte Verbindung derselben Übertragung wird abgelöst
+        offset = staging.oeffnen(parts[2], sender, expected_size, digest, client_addr[0],
+                                 lambda: _verbindung_abbrechen(client_sock))
+        if offset < 0:
+            client_sock.sendall(b"BUSY\n")
+            return
+        tid = parts[2]
+        
+        # Hängende Verbindungen nicht ewig festhalten
+        client_sock.settimeout(60.0)
+        client_sock.sendall(f"RESUME {offset}\n".encode('utf-8'))
+        img_log.debug("Empfange Bild von %s (%s Bytes, ab Offset %s)", sender, expected_size, offset)
+        
+        puffer = initial_data
+        while offset < expected_size:
+            kopf, puffer = _recv_line(client_sock, puffer)
+            teile = kopf.split() if kopf else []
+            if len(teile) != 4 or teile[0] != "CHUNK":
+                img_log.warning("Übertragung von %s bei %s/%s Bytes unterbrochen", sender, offset, expected_size)
+                return
+            
+            chunk_offset, laenge, crc = int(teile[1]), int(teile[2]), teile[3]
+            if chunk_offset != offset or not 0 < laenge <= CHUNK_MAX:
+                client_sock.sendall(f"NAK {offset}\n".encode('utf-8'))
+                return
+            
+            # Chunk-Daten vollständig lesen
+            daten = bytearray(puffer[:laenge])
+            puffer = puffer[laenge:]
+            while len(daten) < laenge:
+                chunk = client_sock.recv(min(BULK_BLOCK, laenge - len(daten)))
+                if not chunk:
+                    img_log.warning("Übertragung von %s bei %s/%s Bytes unterbrochen", sender, offset, expected_size)
+                    return
+                daten += chunk
+                _bulk_freigabe(len(chunk), empfang=True)
+            
+            if f"{zlib.crc32(daten):08x}" != crc:
+                img_log.warning("Prüfsummenfehler in Chunk bei Offset %s von %s", offset, sender)
+                client_sock.sendall(f"NAK {offset}\n".encode('utf-8'))
+                return
+            
+            offset = staging.anhaengen(tid, offset, bytes(daten))
+            client_sock.sendall(f"ACK {offset}\n".encode('utf-8'))
+        
+        # Vollständig: Hash prüfen und in den Bildspeicher übernehmen
+        try:
+            full_path = get_bildspeicher().uebernehmen(digest, staging.teildatei(tid))
+        except ValueError:
+            img_log.warning("Hash stimmt nicht überein, Übertragung %s verworfen", tid[:8])
+            client_sock.sendall(b"FAIL\n")
+            staging.schliessen(tid, verwerfen=True)
+            tid = None
+            net_to_ui.put(f"[FEHLER] Bild von {sender} beschädigt empfangen")
+            return
+        
+        client_sock.sendall(b"DONE\n")
+        staging.schliessen(tid, verwerfen=True)
+        tid = None
+        
+        img_log.info("Bild von %s gespeichert: %s", sender, full_path)
+        net_to_ui.put(f"[📷 BILD] {sender} hat ein Bild gesendet → {full_path}")
+    
+    except Exception as e:
+        img_log.warning("Fehler beim Empfangen von Bild: %s", e)
+        net_to_ui.put(f"[FEHLER] Bild von {client_addr[0]} konnte nicht vollständig empfangen werden")
+    finally:
+        if tid is not None:
+            # Teildaten für eine spätere Fortsetzung behalten
+            staging.schliessen(tid)
         client_sock.close()
 
 
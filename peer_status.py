@@ -0,0 +1,196 @@
+"""
+@file peer_status.py
+@brief Gesundheitsmodell für Peers: Fehlerzähler, Circuit Breaker und RTT-basierte Timeouts.
+
+Der Netzwerk-Prozess merkt sich pro Endpunkt (ip, port), ob Verbindungen
+gelingen. Nach mehreren aufeinanderfolgenden Fehlern gilt ein Peer als TOT
+und wird übersprungen, bis sein Backoff abgelaufen ist; dann ist genau ein
+Probeversuch erlaubt. Jeder weitere Fehlschlag verdoppelt den Backoff.
+Der Connect-Timeout richtet sich nach der gemessenen Verbindungsaufbauzeit.
+"""
+
+import socket
+import threading
+import time
+
+import protokollierung
+
+log = protokollierung.logger("peer")
+
+UNBEKANNT = "UNBEKANNT"
+OK = "OK"
+VERDAECHTIG = "VERDAECHTIG"
+TOT = "TOT"
+
+
+class PeerGesperrt(OSError):
+    """
+    Der Peer gilt als tot und sein Backoff ist noch nicht abgelaufen.
+    """
+
+
+class _Eintrag:
+    __slots__ = ("zustand", "fehler", "rtt", "backoff", "naechster_versuch", "letzter_erfolg")
+
+    def __init__(self, basis_backoff: float):
+        self.zustand = UNBEKANNT
+        self.fehler = 0
+        self.rtt = None
+        self.backoff = basis_backoff
+        self.naechster_versuch = 0.0
+        self.letzter_erfolg = 0.0
+
+
+class PeerGesundheit:
+    """
+    Thread-sicheres Gesundheitsmodell aller bekannten Endpunkte.
+    """
+
+    def __init__(self, schwelle: int = 3, basis_backoff: float = 1.0, max_backoff: float = 60.0,
+                 standard_timeout: float = 1.0, min_timeout: float = 0.2, max_timeout: float = 3.0):
+        """
+        Args:
+            schwelle: Aufeinanderfolgende Fehler, ab denen ein Peer als TOT gilt
+            basis_backoff: Erster Backoff in Sekunden
+            max_backoff: Maximaler Backoff in Sekunden
+            standard_timeout: Connect-Timeout, solange keine RTT gemessen wurde
+            min_timeout: Untergrenze des RTT-basierten Timeouts
+            max_timeout: Obergrenze des RTT-basierten Timeouts
+        """
+        self.schwelle = schwelle
+        self.basis_backoff = basis_backoff
+        self.max_backoff = max_backoff
+        self.standard_timeout = standard_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self._lock = threading.Lock()
+        self._peers = {}  # (ip, port) -> _Eintrag
+
+    def _eintrag(self, addr: tuple) -> _Eintrag:
+        eintrag = self._peers.get(addr)
+        if eintrag is None:
+            eintrag = self._peers[addr] = _Eintrag(self.basis_backoff)
+        return eintrag
+
+    def erlaubt(self, addr: tuple) -> bool:
+        """
+        Prüft, ob ein Verbindungsversuch zu addr unternommen werden soll.
+        Bei einem toten Peer mit abgelaufenem Backoff wird genau ein
+        Probeversuch erlaubt (weitere warten bis zu dessen Ergebnis).
+        """
+        with self._lock:
+            eintrag = self._peers.get(addr)
+            if eintrag is None or eintrag.zustand != TOT:
+                return True
+            jetzt = time.monotonic()
+            if jetzt < eintrag.naechster_versuch:
+                return False
+            eintrag.naechster_versuch = jetzt + eintrag.backoff
+            return True
+
+    def timeout(self, addr: tuple) -> float:
+        """
+        Connect-Timeout für addr: ein Vielfaches der gemessenen RTT, begrenzt.
+        """
+        with self._lock:
+            eintrag = self._peers.get(addr)
+            if eintrag is None or eintrag.rtt is None:
+                return self.standard_timeout
+            return min(self.max_timeout, max(self.min_timeout, 4 * eintrag.rtt + 0.05))
+
+    def erfolg(self, addr: tuple, rtt: float = None) -> None:
+        with self._lock:
+            eintrag = self._eintrag(addr)
+            if eintrag.zustand == TOT:
+                log.info("%s:%s wieder erreichbar", addr[0], addr[1])
+            eintrag.zustand = OK
+            eintrag.fehler = 0
+            eintrag.backoff = self.basis_backoff
+            eintrag.letzter_erfolg = time.monotonic()
+            if rtt is not None:
+                # Gleitender Mittelwert wie bei TCP (SRTT)
+                eintrag.rtt = rtt if eintrag.rtt is None else 0.875 * eintrag.rtt + 0.125 * rtt
+
+    def fehler(self, addr: tuple) -> None:
+        with self._lock:
+            eintrag = self._eintrag(addr)
+            eintrag.fehler += 1
+            if eintrag.zustand == TOT:
+                # Fehlgeschlagene Probe: Backoff verdoppeln
+                eintrag.backoff = min(eintrag.backoff * 2, self.max_backoff)
+            elif eintrag.fehler >= self.schwelle:
+                eintrag.zustand = TOT
+                log.warning("%s:%s gilt nach %s Fehlern als tot", addr[0], addr[1], eintrag.fehler)
+            else:
+                eintrag.zustand = VERDAECHTIG
+                return
+            eintrag.naechster_versuch = time.monotonic() + eintrag.backoff
+
+    def zuruecksetzen(self, addr: tuple) -> None:
+        """
+        Der Peer hat sich neu angemeldet (JOIN): einen offenen Circuit Breaker
+        schließen, statt auf den Ablauf des Backoffs zu warten.
+        """
+        with self._lock:
+            eintrag = self._peers.get(addr)
+            if eintrag is not None and eintrag.zustand == TOT:
+                del self._peers[addr]
+
+    def zustand(self, addr: tuple) -> str:
+        with self._lock:
+            eintrag = self._peers.get(addr)
+            return eintrag.zustand if eintrag else UNBEKANNT
+
+    def beschreibung(self, addr: tuple) -> str:
+        """
+        Kurzbeschreibung für /who, z.B. 'OK:12ms', 'TOT' oder 'UNBEKANNT'.
+        """
+        with self._lock:
+            eintrag = self._peers.get(addr)
+            if eintrag is None:
+                return UNBEKANNT
+            if eintrag.zustand == OK and eintrag.rtt is not None:
+                return f"{OK}:{eintrag.rtt * 1000:.0f}ms"
+            return eintrag.zustand
+
+    def verbinden(self, ip: str, port: int) -> socket.socket:
+        """
+        Baut eine TCP-Verbindung auf und verbucht Ergebnis und RTT.
+
+        Returns:
+            Verbundener Socket (Timeout = Connect-Timeout; der Aufrufer setzt ggf. neu)
+
+        Raises:
+            PeerGesperrt: Wenn der Peer als tot gilt und kein Probeversuch fällig ist
+            OSError: Wenn die Verbindung fehlschlägt
+        """
+        addr = (ip, port)
+        if not self.erlaubt(addr):
+            raise PeerGesperrt(f"{ip}:{port} gilt als nicht erreichbar (Circuit Breaker offen)")
+
+        tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        tcp_socket.settimeout(self.timeout(addr))
+        start = time.monotonic()
+        try:
+            tcp_socket.connect(addr)
+        except OSError:
+            tcp_socket.close()
+            self.fehler(addr)
+            raise
+        self.erfolg(addr, time.monotonic() - start)
+        return tcp_socket
+
+    def proben(self) -> None:
+        """
+        Probt alle toten Peers, deren Backoff abgelaufen ist, mit einem
+        Verbindungsaufbau. Wird periodisch aus einem Hintergrund-Thread aufgerufen.
+        """
+        jetzt = time.monotonic()
+        with self._lock:
+            faellig = [addr for addr, e in self._peers.items()
+                       if e.zustand == TOT and jetzt >= e.naechster_versuch]
+        for ip, port in faellig:
+            try:
+                self.verbinden(ip, port).close()
+            except OSError:
+                pass
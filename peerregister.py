@@ -0,0 +1,148 @@
+"""
+@file peerregister.py
+@brief Kompaktes, indiziertes Teilnehmerregister für Discovery, Netzwerk und UI.
+
+Ein Eintrag pro Handle (PeerEintrag mit __slots__) und zwei Indizes:
+Handle -> Eintrag und (ip, port) -> Eintrag. So lässt sich z.B. ein
+fehlgeschlagener Endpunkt ohne Scan einem Handle zuordnen.
+
+Jede strukturelle Änderung (neuer Teilnehmer, neue Adresse, Entfernen)
+erhöht version. Iteration läuft über einen unveränderlichen Schnappschuss,
+der nur nach einer Änderung neu gebildet wird; ein reiner Heartbeat
+(eintragen mit gleicher Adresse) aktualisiert nur den Zeitstempel.
+"""
+
+import threading
+import time
+
+
+class PeerEintrag:
+    __slots__ = ("handle", "ip", "port", "zuletzt")
+
+    def __init__(self, handle: str, ip: str, port: int, zuletzt: float):
+        self.handle = handle
+        self.ip = ip
+        self.port = port
+        self.zuletzt = zuletzt
+
+    @property
+    def adresse(self) -> tuple:
+        return (self.ip, self.port)
+
+    def __repr__(self):
+        return f"PeerEintrag({self.handle!r}, {self.ip!r}, {self.port})"
+
+
+class PeerRegister:
+    """
+    Thread-sicheres Register aller bekannten Teilnehmer.
+    """
+
+    def __init__(self, eintraege=()):
+        """
+        Args:
+            eintraege: Optionales Iterable von (handle, ip, port)
+        """
+        self._nach_handle = {}
+        self._nach_adresse = {}
+        self._lock = threading.Lock()
+        self.version = 0
+        self._schnappschuss = ()
+        self._schnappschuss_version = 0
+        for handle, ip, port in eintraege:
+            self.eintragen(handle, ip, port)
+
+    def eintragen(self, handle: str, ip: str, port: int, zuletzt: float = None) -> PeerEintrag:
+        """
+        Trägt handle ein oder aktualisiert ihn (Adresse, Zeitstempel).
+
+        Returns:
+            Der aktuelle Eintrag
+        """
+        zuletzt = time.time() if zuletzt is None else zuletzt
+        with self._lock:
+            eintrag = self._nach_handle.get(handle)
+            if eintrag is not None and eintrag.ip == ip and eintrag.port == port:
+                eintrag.zuletzt = zuletzt
+                return eintrag
+            if eintrag is not None:
+                self._adresse_freigeben(eintrag)
+            eintrag = PeerEintrag(handle, ip, port, zuletzt)
+            self._nach_handle[handle] = eintrag
+            self._nach_adresse[(ip, port)] = eintrag
+            self.version += 1
+            return eintrag
+
+    def entfernen(self, handle: str):
+        """
+        Returns:
+            Der entfernte Eintrag oder None
+        """
+        with self._lock:
+            eintrag = self._nach_handle.pop(handle, None)
+            if eintrag is not None:
+                self._adresse_freigeben(eintrag)
+                self.version += 1
+            return eintrag
+
+    def _adresse_freigeben(self, eintrag: PeerEintrag) -> None:
+        # Nur entfernen, wenn die Adresse nicht inzwischen einem anderen Handle gehört
+        if self._nach_adresse.get(eintrag.adresse) is eintrag:
+            del self._nach_adresse[eintrag.adresse]
+
+    def leeren(self) -> None:
+        with self._lock:
+            self._nach_handle.clear()
+            self._nach_adresse.clear()
+            self.version += 1
+
+    def get(self, handle: str, standard=None):
+        return self._nach_handle.get(handle, standard)
+
+    def __getitem__(self, handle: str) -> PeerEintrag:
+        return self._nach_handle[handle]
+
+    def nach_adresse(self, ip: str, port: int):
+        """
+        Returns:
+            Eintrag mit dieser Adresse (ip, port) oder None
+        """
+        return self._nach_adresse.get((ip, port))
+
+    def __contains__(self, handle) -> bool:
+        return handle in self._nach_handle
+
+    def __len__(self) -> int:
+        return len(self._nach_handle)
+
+    def __bool__(self) -> bool:
+        return bool(self._nach_handle)
+
+    def schnappschuss(self) -> tuple:
+        """
+        Returns:
+            Tuple aller Einträge; bleibt bis zur nächsten Änderung dasselbe Objekt
+        """
+        with self._lock:
+            if self._schnappschuss_version != self.version:
+                self._schnappschuss = tuple(self._nach_handle.values())
+                self._schnappschuss_version = self.version
+            return self._schnappschuss
+
+    def __iter__(self):
+        return iter(self.schnappschuss())
+
+    def adressen(self) -> list:
+        """
+        Returns:
+            Liste der (ip, port) aller Einträge
+        """
+        return [e.adresse for e in self.schnappschuss()]
+
+    def abgelaufen(self, max_alter: float) -> list:
+        """
+        Returns:
+            Handles, deren letzter Eintrag älter als max_alter Sekunden ist
+        """
+        grenze = time.time() - max_alter
+        return [e.handle for e in self.schnappschuss() if e.zuletzt < grenze]
@@ -0,0 +1,225 @@
+"""
+@file postausgang.py
+@brief Persistenter Postausgang (Store-and-Forward) für nicht erreichbare Peers.
+
+Nachrichten, die ein Peer nicht annehmen konnte, werden pro Empfänger an
+eine Datei angehängt (eine JSON-Zeile pro Nachricht) und zugestellt, sobald
+der Peer sich wieder per JOIN meldet. Jede Nachricht bekommt eine
+aufsteigende ID (16 Hex-Zeichen, aus time_ns), über die der Empfänger
+Reihenfolge und Duplikate prüft und die Zustellung quittiert.
+
+Grenzen:
+- max_bytes pro Empfänger: weitere Nachrichten werden abgelehnt
+- ttl: ältere Nachrichten werden beim Lesen und Aufräumen verworfen
+
+Die Empfangsseite merkt sich pro Sender die höchste angenommene ID
+(Empfangsstand) in EMPFANGSSTAND im selben Ordner, damit Nachrichten, die
+nach einem Neustart des Empfängers erneut zugestellt werden, nicht doppelt
+erscheinen.
+"""
+
+import json
+import os
+import threading
+import time
+
+import protokollierung
+
+log = protokollierung.logger("postausgang")
+
+DATEI_ENDUNG = ".out"
+EMPFANGSSTAND = "empfangen.json"
+
+_id_lock = threading.Lock()
+_letzte_id = 0
+
+
+def neue_id() -> str:
+    """
+    Liefert eine streng aufsteigende Nachrichten-ID (16 Hex-Zeichen).
+    """
+    global _letzte_id
+    with _id_lock:
+        _letzte_id = max(time.time_ns(), _letzte_id + 1)
+        return f"{_letzte_id:016x}"
+
+
+class Postausgang:
+    """
+    Thread-sichere Sammlung der Postausgangsdateien eines Clients.
+    """
+
+    def __init__(self, verzeichnis: str, max_bytes: int = 256 * 1024, ttl: float = 86400.0):
+        """
+        Args:
+            verzeichnis: Ordner für die Postausgangsdateien
+            max_bytes: Maximale Dateigröße pro Empfänger
+            ttl: Lebensdauer einer Nachricht in Sekunden
+        """
+        self.verzeichnis = verzeichnis
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._groessen = {}  # handle -> Dateigröße in Bytes
+        os.makedirs(verzeichnis, exist_ok=True)
+
+        # Vorhandene Dateien übernehmen, abgelaufene Nachrichten dabei verwerfen
+        for name in os.listdir(verzeichnis):
+            if not name.endswith(DATEI_ENDUNG):
+                continue
+            try:
+                handle = bytes.fromhex(name[:-len(DATEI_ENDUNG)]).decode('utf-8')
+            except ValueError:
+                continue
+            self.bestaetigen(handle, "")
+
+    def _pfad(self, handle: str) -> str:
+        # Handles dürfen '/' o.ä. enthalten, daher hex-kodiert als Dateiname
+        return os.path.join(self.verzeichnis, handle.encode('utf-8').hex() + DATEI_ENDUNG)
+
+    def einreihen(self, handle: str, text: str, raum: str = "") -> str:
+        """
+        Hängt eine Nachricht an den Postausgang von handle an.
+
+        Returns:
+            Nachrichten-ID, oder None wenn der Postausgang voll ist
+        """
+        with self._lock:
+            nachricht_id = neue_id()
+            zeile = json.dumps({"id": nachricht_id, "t": time.time(), "r": raum, "x": text},
+                               ensure_ascii=False, separators=(",", ":")) + "\n"
+            daten = zeile.encode('utf-8')
+            groesse = self._groessen.get(handle, 0)
+            if groesse + len(daten) > self.max_bytes:
+                log.warning("Postausgang für %s voll (%s Bytes), Nachricht verworfen", handle, groesse)
+                return None
+            with open(self._pfad(handle), 'ab') as f:
+                f.write(daten)
+            self._groessen[handle] = groesse + len(daten)
+            return nachricht_id
+
+    def hat(self, handle: str) -> bool:
+        return handle in self._groessen
+
+    def empfaenger(self) -> list:
+        """
+        Returns:
+            Handles, für die Nachrichten warten
+        """
+        with self._lock:
+            return list(self._groessen)
+
+    def ausstehend(self, handle: str) -> list:
+        """
+        Returns:
+            Nicht abgelaufene Nachrichten von handle in Einreihungsreihenfolge
+            (Dictionaries mit id, t, r = Raum, x = Text)
+        """
+        with self._lock:
+            return self._lesen(handle)
+
+    def _lesen(self, handle: str) -> list:
+        grenze = time.time() - self.ttl
+        nachrichten = []
+        try:
+            with open(self._pfad(handle), 'rb') as f:
+                for zeile in f:
+                    try:
+                        eintrag = json.loads(zeile)
+                    except ValueError:
+                        continue  # Abgebrochener Schreibvorgang
+                    if eintrag.get("t", 0) >= grenze:
+                        nachrichten.append(eintrag)
+        except OSError:
+            pass
+        return nachrichten
+
+    def bestaetigen(self, handle: str, bis_id: str) -> int:
+        """
+        Entfernt alle Nachrichten bis einschließlich bis_id (sowie abgelaufene).
+        Inzwischen neu eingereihte Nachrichten bleiben erhalten.
+
+        Returns:
+            Anzahl verbleibender Nachrichten
+        """
+        with self._lock:
+            rest = [e for e in self._lesen(handle) if e["id"] > bis_id]
+            pfad = self._pfad(handle)
+            if not rest:
+                try:
+                    os.remove(pfad)
+                except OSError:
+                    pass
+                self._groessen.pop(handle, None)
+                return 0
+
+            daten = b"".join(json.dumps(e, ensure_ascii=False, separators=(",", ":")).encode('utf-8') + b"\n"
+                             for e in rest)
+            tmp_pfad = f"{pfad}.tmp"
+            with open(tmp_pfad, 'wb') as f:
+                f.write(daten)
+            os.replace(tmp_pfad, pfad)
+            self._groessen[handle] = len(daten)
+            return len(rest)
+
+    def statistik(self) -> dict:
+        with self._lock:
+            return {"empfaenger": len(self._groessen), "bytes": sum(self._groessen.values())}
+
+
+class Empfangsstand:
+    """
+    Höchste angenommene Nachrichten-ID pro Sender (Empfangsseite).
+    """
+
+    def __init__(self, pfad: str = None):
+        """
+        Args:
+            pfad: JSON-Datei für den Stand (None = nur im Speicher)
+        """
+        self.pfad = pfad
+        self._lock = threading.Lock()
+        self._bis = {}  # handle -> höchste angenommene ID
+        self._geaendert = False
+        if pfad:
+            try:
+                with open(pfad, 'rb') as f:
+                    stand = json.load(f)
+                self._bis = {h: i for h, i in stand.items() if isinstance(i, str)}
+            except (OSError, ValueError, AttributeError):
+                pass
+
+    def annehmen(self, handle: str, nachricht_id: str) -> bool:
+        """
+        Nimmt eine Nachricht nur an, wenn ihre ID größer ist als die zuletzt
+        von handle angenommene (verwirft Duplikate, hält die Reihenfolge).
+
+        Returns:
+            True wenn die Nachricht neu ist
+        """
+        with self._lock:
+            if nachricht_id <= self._bis.get(handle, ""):
+                return False
+            self._bis[handle] = nachricht_id
+            self._geaendert = True
+            return True
+
+    def bis(self, handle: str) -> str:
+        with self._lock:
+            return self._bis.get(handle, "")
+
+    def speichern(self) -> None:
+        """
+        Schreibt den Stand (atomar), falls er sich geändert hat.
+        """
+        with self._lock:
+            if not self.pfad or not self._geaendert:
+                return
+            tmp_pfad = f"{self.pfad}.tmp"
+            try:
+                with open(tmp_pfad, 'w', encoding='utf-8') as f:
+                    json.dump(self._bis, f, ensure_ascii=False, separators=(",", ":"))
+                os.replace(tmp_pfad, self.pfad)
+                self._geaendert = False
+            except OSError as e:
+                log.warning("Empfangsstand nicht gespeichert: %s", e)
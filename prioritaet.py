@@ -0,0 +1,248 @@
+"""
+@file prioritaet.py
+@brief Prioritätsspuren für den Netzwerk-Prozess: Steuerung, Text und Bulk.
+
+Jede Spur hat eine eigene Warteschlange und eigene Worker-Threads, sodass
+ein großes Bild an einen langsamen Peer keine Textnachricht aufhält:
+
+- STEUERUNG: JOIN-Heartbeat, SUB/UNSUB, WHO (ein Worker, Reihenfolge bleibt)
+- TEXT:      Direktnachrichten und Postausgang
+- BULK:      Bildübertragungen
+
+Bulk-Übertragungen holen sich vor jedem Block eine Freigabe (bulk_freigabe):
+Solange Textaufträge auf einen freien Worker warten, gibt Bulk nach (höchstens
+max_nachgeben Sekunden am Stück), danach begrenzt ein Token-Bucket die Rate.
+Auf bereits laufende Textaufträge wartet Bulk nicht - sie hängen meist an
+einem Peer (Verbindungsaufbau, ACK), nicht an der Bandbreite.
+Wartet ein Textauftrag länger als das Latenzziel in seiner Warteschlange,
+halbiert sich die Bulk-Rate; liegt die Wartezeit deutlich darunter oder ist
+ERHOLUNG_S lang kein Text eingereiht, steigt sie wieder bis zur konfigurierten
+Grenze. Die Laufzeit der Aufträge selbst (Verbindungsaufbau, ACK-Wartezeiten)
+zählt bewusst nicht: Sie hängt am Peer, nicht am Bulk-Verkehr.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import protokollierung
+
+log = protokollierung.logger("prioritaet")
+
+STEUERUNG = "steuerung"
+TEXT = "text"
+BULK = "bulk"
+
+MIN_RATE = 64 * 1024          # Untergrenze der gedrosselten Bulk-Rate (Bytes/s)
+UNBEGRENZT_AB = 1024 ** 3     # Ohne feste Grenze: ab dieser Rate wieder ungedrosselt
+ERHOLUNG_S = 1.0              # Ohne offenen Text: Rate spätestens nach so vielen Sekunden erhöhen
+
+
+class Drossel:
+    """
+    Token-Bucket: höchstens rate Bytes/s, Bursts bis burst Bytes. rate 0 = unbegrenzt.
+    """
+
+    def __init__(self, rate: float = 0, burst: int = 256 * 1024):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._zeit = time.monotonic()
+        self._lock = threading.Lock()
+        # Gemessener Durchsatz (für die Anpassung ohne feste Grenze)
+        self._fenster_start = self._zeit
+        self._fenster_bytes = 0
+        self._durchsatz = 0.0
+
+    def verbrauchen(self, anzahl: int) -> None:
+        """
+        Blockiert, bis anzahl Bytes gesendet bzw. gelesen werden dürfen.
+        """
+        with self._lock:
+            jetzt = time.monotonic()
+            self._messen(jetzt, anzahl)
+            if not self.rate:
+                self._zeit = jetzt
+                return
+            self._tokens = min(self.burst, self._tokens + (jetzt - self._zeit) * self.rate)
+            self._zeit = jetzt
+            self._tokens -= anzahl
+            warten = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if warten:
+            time.sleep(warten)
+
+    def _messen(self, jetzt: float, anzahl: int) -> None:
+        self._fenster_bytes += anzahl
+        dauer = jetzt - self._fenster_start
+        if dauer >= 1.0:
+            self._durchsatz = self._fenster_bytes / dauer
+            self._fenster_start = jetzt
+            self._fenster_bytes = 0
+
+    def durchsatz(self) -> float:
+        """
+        Returns:
+            Zuletzt gemessener Durchsatz in Bytes/s
+        """
+        return self._durchsatz
+
+
+class Planer:
+    """
+    Drei Spuren mit eigenen Workern, Vorrang für Text vor Bulk und
+    Bulk-Drosselung mit Latenzziel für Text.
+    """
+
+    def __init__(self, arbeiter: dict = None, bulk_rate: float = 0, text_ziel_ms: float = 100,
+                 max_nachgeben: float = 1.0):
+        """
+        Args:
+            arbeiter: Worker pro Spur, z.B. {STEUERUNG: 1, TEXT: 4, BULK: 2}
+            bulk_rate: Obergrenze für Bulk in Bytes/s pro Richtung (0 = unbegrenzt)
+            text_ziel_ms: Latenzziel für Textaufträge (Wartezeit bis zum Start)
+            max_nachgeben: Längste Pause eines Bulk-Blocks zugunsten von Text
+        """
+        arbeiter = {STEUERUNG: 1, TEXT: 4, BULK: 2, **(arbeiter or {})}
+        self.max_rate = bulk_rate
+        self.text_ziel = text_ziel_ms / 1000.0
+        self.max_nachgeben = max_nachgeben
+        self.senden = Drossel(bulk_rate)
+        self.empfangen = Drossel(bulk_rate)
+
+        self._lock = threading.Lock()
+        self._text_wartend = 0                # Eingereihte, noch nicht gestartete Textaufträge
+        self._text_frei = threading.Condition(self._lock)
+        self._latenzen = deque(maxlen=256)    # Letzte Textlatenzen in Sekunden
+        self._angepasst = time.monotonic()    # Letzte Anpassung der Bulk-Rate
+        self._schlangen = {}
+        self._zaehler = {spur: {"erledigt": 0, "aktiv": 0} for spur in arbeiter}
+        self.nachgegeben = 0
+        self.ziel_verfehlt = 0
+
+        for spur, anzahl in arbeiter.items():
+            self._schlangen[spur] = queue.Queue()
+            for i in range(anzahl):
+                threading.Thread(target=self._worker, args=(spur,), name=f"{spur}-{i}", daemon=True).start()
+
+    def einreihen(self, spur: str, funktion, *args) -> None:
+        """
+        Stellt funktion(*args) in die Warteschlange der Spur.
+        """
+        if spur == TEXT:
+            with self._lock:
+                self._text_wartend += 1
+        self._schlangen[spur].put((funktion, args, time.monotonic()))
+
+    @contextmanager
+    def text_messen(self):
+        """
+        Zählt Textverkehr außerhalb der Spuren (z.B. Broadcasts im Haupt-Loop)
+        zur Textlatenz. Er läuft bereits, daher gibt Bulk nicht nach und die
+        Bulk-Rate bleibt unverändert (es gibt keine Wartezeit).
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._text_fertig(time.monotonic() - start)
+
+    def _worker(self, spur: str) -> None:
+        schlange = self._schlangen[spur]
+        zaehler = self._zaehler[spur]
+        while True:
+            funktion, args, eingereiht = schlange.get()
+            start = time.monotonic()
+            with self._lock:
+                zaehler["aktiv"] += 1
+                if spur == TEXT:
+                    self._text_wartend -= 1
+                    if not self._text_wartend:
+                        self._text_frei.notify_all()
+            try:
+                funktion(*args)
+            except Exception as e:
+                log.warning("Fehler in Spur %s: %s", spur, e)
+            finally:
+                with self._lock:
+                    zaehler["aktiv"] -= 1
+                    zaehler["erledigt"] += 1
+                if spur == TEXT:
+                    self._text_fertig(time.monotonic() - eingereiht, start - eingereiht)
+
+    def _text_fertig(self, latenz: float, wartezeit: float = None) -> None:
+        """
+        Args:
+            latenz: Einreihen bis Ende (Statistik)
+            wartezeit: Einreihen bis Start, Grundlage der Ratenanpassung (None = keine)
+        """
+        with self._lock:
+            self._latenzen.append(latenz)
+        if wartezeit is not None:
+            self._anpassen(wartezeit)
+
+    def _anpassen(self, wartezeit: float) -> None:
+        """
+        AIMD auf die Bulk-Rate: halbieren bei verfehltem Ziel, um 25 % erhöhen
+        bei deutlich unterschrittenem.
+        """
+        if wartezeit > self.text_ziel:
+            for drossel in (self.senden, self.empfangen):
+                aktuell = drossel.rate or drossel.durchsatz()
+                if aktuell:
+                    drossel.rate = max(MIN_RATE, aktuell / 2)
+            self._angepasst = time.monotonic()
+            self.ziel_verfehlt += 1
+            log.debug("Textwartezeit %.0f ms über Ziel, Bulk-Rate %.0f KB/s",
+                      wartezeit * 1000, self.senden.rate / 1024)
+        elif wartezeit < self.text_ziel / 2:
+            self._erhoehen()
+
+    def _erhoehen(self) -> None:
+        """
+        Erhöht gedrosselte Bulk-Raten um 25 % bis zur Grenze (ohne Grenze bis
+        UNBEGRENZT_AB, dann wieder ungedrosselt).
+        """
+        for drossel in (self.senden, self.empfangen):
+            if drossel.rate:
+                neu = drossel.rate * 1.25
+                if self.max_rate and neu >= self.max_rate:
+                    neu = self.max_rate
+                elif not self.max_rate and neu >= UNBEGRENZT_AB:
+                    neu = 0
+                drossel.rate = neu
+        self._angepasst = time.monotonic()
+
+    def bulk_freigabe(self, anzahl: int, empfang: bool = False) -> None:
+        """
+        Vor jedem Bulk-Block aufrufen: gibt wartendem Text Vorrang und drosselt
+        auf die aktuelle Bulk-Rate.
+
+        Args:
+            anzahl: Größe des Blocks in Bytes
+            empfang: True für eingehende Übertragungen (eigene Drossel)
+        """
+        with self._lock:
+            if self._text_wartend:
+                self.nachgegeben += 1
+                self._text_frei.wait_for(lambda: not self._text_wartend, timeout=self.max_nachgeben)
+            # Ohne Textverkehr kommt kein Messwert: Rate nach ERHOLUNG_S trotzdem erhöhen
+            erholen = not self._text_wartend and time.monotonic() - self._angepasst >= ERHOLUNG_S
+        if erholen:
+            self._erhoehen()
+        (self.empfangen if empfang else self.senden).verbrauchen(anzahl)
+
+    def statistik(self) -> dict:
+        with self._lock:
+            latenzen = sorted(self._latenzen)
+            werte = {f"{spur}_wartend": self._schlangen[spur].qsize() for spur in self._schlangen}
+            werte.update({f"{spur}_aktiv": z["aktiv"] for spur, z in self._zaehler.items()})
+        p95 = latenzen[min(len(latenzen) - 1, int(len(latenzen) * 0.95))] if latenzen else 0.0
+        werte.update({
+            "text_p95_ms": round(p95 * 1000, 1),
+            "ziel_verfehlt": self.ziel_verfehlt,
+            "nachgegeben": self.nachgegeben,
+            "bulk_kb_s": round(self.senden.rate / 1024) if self.senden.rate else "unbegrenzt",
+        })
+        return werte
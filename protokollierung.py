@@ -0,0 +1,131 @@
+"""
+@file protokollierung.py
+@brief Strukturiertes, asynchrones Logging für Netzwerk- und Discovery-Prozess.
+
+Jeder Prozess richtet beim Start einmal einen QueueHandler ein. Log-Aufrufe
+legen den Datensatz nur in eine prozessinterne Queue; ein Listener-Thread
+schreibt ihn in die Log-Datei und (ab konsole-Level) auf stderr. Damit
+blockiert kein Hot Path auf langsamen Terminal- oder Datei-Schreibzugriffen.
+
+Konfiguration in config.toml:
+
+    [logging]
+    level = "INFO"          # Standard für alle Subsysteme
+    konsole = "WARNING"     # Ab diesem Level zusätzlich auf stderr
+    datei = "chat.log"      # Log-Datei ("" = keine Datei)
+
+    [logging.subsysteme]
+    discovery = "DEBUG"     # Level pro Subsystem (Logger 'chat.<name>')
+
+Hot Paths loggen mit %-Platzhaltern (log.debug("... %s", wert)), damit bei
+deaktiviertem Level weder formatiert noch eingereiht wird; empfangene Bytes
+werden dafür in roh(daten) verpackt statt vorab dekodiert. Zusätzliche
+Felder werden per extra=felder(...) als key=value an die Zeile angehängt.
+"""
+
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+WURZEL = "chat"
+FORMAT = "%(asctime)s %(levelname)-7s %(processName)s %(name)s: %(message)s%(felder_text)s"
+
+_eingerichtet_pid = None
+_listener = None
+
+
+def logger(subsystem: str) -> logging.Logger:
+    """
+    Liefert den Logger eines Subsystems (z.B. 'netzwerk' -> 'chat.netzwerk').
+    """
+    return logging.getLogger(f"{WURZEL}.{subsystem}")
+
+
+def felder(**werte) -> dict:
+    """
+    Strukturierte Zusatzfelder für einen Log-Aufruf:
+        log.info("Teilnehmer registriert", extra=felder(handle=h, ip=ip))
+    """
+    return {"felder": werte}
+
+
+class roh:
+    """
+    Bytes als Log-Argument: erst beim Formatieren dekodiert (ohne Zeilenumbrüche
+    am Rand), also gar nicht, wenn das Level deaktiviert ist.
+    """
+
+    __slots__ = ("daten",)
+
+    def __init__(self, daten: bytes):
+        self.daten = daten
+
+    def __str__(self) -> str:
+        return self.daten.decode('utf-8', errors='replace').strip()
+
+
+class _StrukturFormatter(logging.Formatter):
+    """
+    Hängt die Zusatzfelder eines Datensatzes als ' key=value' an.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        werte = getattr(record, "felder", None)
+        record.felder_text = "".join(f" {k}={v}" for k, v in werte.items()) if werte else ""
+        return super().format(record)
+
+
+def einrichten(config: dict = None) -> None:
+    """
+    Richtet das Logging für den aktuellen Prozess ein. Mehrfache Aufrufe im
+    selben Prozess sind wirkungslos; nach fork() wird neu eingerichtet, da
+    der Listener-Thread nicht mitkopiert wird.
+    """
+    global _eingerichtet_pid, _listener
+    if _eingerichtet_pid == os.getpid():
+        return
+    _eingerichtet_pid = os.getpid()
+
+    einstellungen = (config or {}).get("logging", {})
+    wurzel = logging.getLogger(WURZEL)
+    wurzel.setLevel(einstellungen.get("level", "INFO").upper())
+    wurzel.propagate = False
+    for handler in list(wurzel.handlers):
+        wurzel.removeHandler(handler)
+
+    for subsystem, level in einstellungen.get("subsysteme", {}).items():
+        logger(subsystem).setLevel(str(level).upper())
+
+    formatter = _StrukturFormatter(FORMAT)
+    ziele = []
+
+    konsole = logging.StreamHandler(sys.stderr)
+    konsole.setLevel(einstellungen.get("konsole", "WARNING").upper())
+    konsole.setFormatter(formatter)
+    ziele.append(konsole)
+
+    datei = einstellungen.get("datei", "chat.log")
+    if datei:
+        try:
+            datei_handler = logging.FileHandler(datei, encoding="utf-8")
+            datei_handler.setFormatter(formatter)
+            ziele.append(datei_handler)
+        except OSError as e:
+            print(f"[LOG] Log-Datei {datei} nicht verwendbar: {e}")
+
+    log_queue = queue.SimpleQueue()
+    wurzel.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, *ziele, respect_handler_level=True)
+    _listener.start()
+
+
+def beenden() -> None:
+    """
+    Schreibt alle noch eingereihten Datensätze und stoppt den Listener.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,109 @@
+"""
+@file relay.py
+@brief Relay-Modus: Broadcasts über einen Verteilbaum statt direkt an jeden Empfänger.
+
+Statt N Verbindungen öffnet der Sender nur höchstens fanout Verbindungen.
+Jeder direkte Empfänger bekommt zusätzlich die Liste der Peers seines
+Teilbaums und leitet die Nachricht auf dieselbe Weise weiter. Die Aufteilung
+ergibt sich deterministisch aus der (sortierten) Zielliste des Senders, die
+im Frame mitgeschickt wird - unterschiedliche Discovery-Tabellen der Knoten
+spielen daher keine Rolle. Baumtiefe: ca. log_fanout(N).
+
+Frame (TCP):
+
+    RELAY <origin> <id> <fanout> <anzahl_frames> <anzahl_ziele>\\n
+    <ip>:<port> <ip>:<port> ...\\n          (Teilbaum des Empfängers, "-" = Blatt)
+    <len>\\n<MSG|RMSG ...>                   (anzahl_frames mal, wie im Batch-Frame)
+
+Der fanout des Senders gilt für den ganzen Baum, wird aber von jedem Knoten
+auf seinen eigenen (höchstens MAX_FANOUT) begrenzt. Über (origin, id) werden
+Duplikate unterdrückt, etwa wenn ein Knoten nach einem Weiterleitungsfehler
+einen Teilbaum erneut beliefert.
+
+Damit ein einzelner gefälschter Frame keinen Knoten zu beliebig vielen
+Verbindungen verleitet, ersetzt ein weiterleitender Knoten pro Kind höchstens
+MAX_ERSATZ nicht erreichbare Peers und leitet nur bis MAX_NUTZLAST Bytes weiter.
+"""
+
+import threading
+from collections import deque
+
+MAX_ZIELE = 4096
+MAX_FANOUT = 16            # Größter Fanout, mit dem ein Knoten weiterleitet
+MAX_ERSATZ = 3             # Ersatzversuche pro Kind beim Weiterleiten
+MAX_NUTZLAST = 256 * 1024  # Größte weitergeleitete Nutzlast (alle Frames)
+
+
+def aufteilen(ziele: list, fanout: int) -> list:
+    """
+    Teilt ziele in höchstens fanout zusammenhängende, möglichst gleich große
+    Teilbäume auf.
+
+    Returns:
+        Liste von (kind, teilbaum) - kind erhält die Nachricht direkt und
+        ist für die Weiterleitung an teilbaum zuständig
+    """
+    anzahl = min(max(fanout, 1), len(ziele))
+    teile = []
+    start = 0
+    for i in range(anzahl):
+        ende = start + (len(ziele) - start) // (anzahl - i)
+        teile.append((ziele[start], ziele[start + 1:ende]))
+        start = ende
+    return teile
+
+
+def encode_kopf(origin: str, nachricht_id: str, fanout: int, anzahl_frames: int, teilbaum: list) -> bytes:
+    """
+    Kodiert die beiden Kopfzeilen eines RELAY-Frames.
+
+    Args:
+        teilbaum: Liste von (ip, port)
+    """
+    ziele = " ".join(f"{ip}:{port}" for ip, port in teilbaum) or "-"
+    return f"RELAY {origin} {nachricht_id} {fanout} {anzahl_frames} {len(teilbaum)}\n{ziele}\n".encode('utf-8')
+
+
+def parse_ziele(zeile: str, anzahl: int) -> list:
+    """
+    Parst die Zielzeile eines RELAY-Frames.
+
+    Raises:
+        ValueError: Bei ungültigem Format oder falscher Anzahl
+    """
+    ziele = []
+    if zeile != "-":
+        for eintrag in zeile.split(" "):
+            ip, _, port = eintrag.rpartition(":")
+            if not ip or not port.isdigit() or not 0 < int(port) < 65536:
+                raise ValueError(f"Ungültiges Relay-Ziel: {eintrag[:40]!r}")
+            ziele.append((ip, int(port)))
+    if len(ziele) != anzahl:
+        raise ValueError(f"Relay-Zielliste hat {len(ziele)} statt {anzahl} Einträge")
+    return ziele
+
+
+class Duplikatfilter:
+    """
+    Merkt sich die zuletzt gesehenen (origin, id)-Paare (begrenzt).
+    """
+
+    def __init__(self, groesse: int = 4096):
+        self.groesse = groesse
+        self._gesehen = set()
+        self._reihenfolge = deque()
+        self._lock = threading.Lock()
+
+    def neu(self, schluessel) -> bool:
+        """
+        Returns:
+            True beim ersten Auftreten von schluessel, sonst False
+        """
+        with self._lock:
+            if schluessel in self._gesehen:
+                return False
+            self._gesehen.add(schluessel)
+            self._reihenfolge.append(schluessel)
+            if len(self._reihenfolge) > self.groesse:
+                self._gesehen.discard(self._reihenfolge.popleft())
+            return True
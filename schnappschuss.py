@@ -0,0 +1,86 @@
+"""
+@file schnappschuss.py
+@brief Kompakte On-Disk-Schnappschüsse für Warmstarts (Discovery-Tabelle, Peer-Liste der UI).
+
+Ein Schnappschuss ist eine JSON-Datei mit Zeitstempel und Teilnehmerliste:
+
+    {"zeit": 1760000000.0, "teilnehmer": [["Alice", "192.168.1.5", 5000], ...],
+     "kanaele": {"#lan": ["Alice"]}}
+
+Geschrieben wird atomar (temporäre Datei + os.replace), damit ein Absturz
+beim Speichern nie einen halben Schnappschuss hinterlässt. Beim Laden werden
+ungültige Einträge verworfen; geladene Teilnehmer gelten nur als vorläufig,
+bis sie sich per JOIN melden oder im Hintergrund geprüft wurden.
+"""
+
+import json
+import os
+import socket
+import time
+
+import slcp
+
+
+def speichern(pfad: str, teilnehmer, kanaele: dict = None) -> None:
+    """
+    Schreibt einen Schnappschuss atomar nach pfad.
+
+    Args:
+        teilnehmer: Iterable von (handle, ip, port)
+        kanaele: Optionaler Raum-Index (raum -> Iterable von Handles)
+    """
+    daten = {"zeit": time.time(), "teilnehmer": [[h, ip, port] for h, ip, port in teilnehmer]}
+    if kanaele:
+        daten["kanaele"] = {raum: sorted(mitglieder) for raum, mitglieder in kanaele.items()}
+
+    tmp_pfad = f"{pfad}.{os.getpid()}.tmp"
+    with open(tmp_pfad, 'w', encoding='utf-8') as f:
+        json.dump(daten, f, separators=(",", ":"), ensure_ascii=False)
+    os.replace(tmp_pfad, pfad)
+
+
+def laden(pfad: str, max_alter: float = 300.0) -> tuple:
+    """
+    Lädt einen Schnappschuss.
+
+    Returns:
+        (teilnehmer, kanaele, zeit) - teilnehmer als Tuple von slcp.Teilnehmer,
+        kanaele als dict raum -> set(handle). Fehlt die Datei, ist sie
+        beschädigt oder älter als max_alter Sekunden: ((), {}, 0.0)
+    """
+    try:
+        with open(pfad, 'r', encoding='utf-8') as f:
+            daten = json.load(f)
+        zeit = float(daten["zeit"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return (), {}, 0.0
+    if time.time() - zeit > max_alter:
+        return (), {}, 0.0
+
+    teilnehmer = []
+    for eintrag in daten.get("teilnehmer", ()):
+        try:
+            handle, ip, port = eintrag
+            # Einträge durch den Codec prüfen, wie ein empfangenes KNOWUSERS
+            teilnehmer.extend(slcp.parse_discovery(slcp.encode_knowusers([(handle, ip, port)])).teilnehmer)
+        except (ValueError, TypeError):
+            continue
+
+    kanaele = {}
+    for raum, mitglieder in (daten.get("kanaele") or {}).items():
+        try:
+            kanaele[slcp.pruefe_raum(raum)] = {h for h in mitglieder if isinstance(h, str)}
+        except (ValueError, TypeError):
+            continue
+    return tuple(teilnehmer), kanaele, zeit
+
+
+def erreichbar(ip: str, port: int, timeout: float = 1.0) -> bool:
+    """
+    Prüft per Verbindungsaufbau, ob unter ip:port ein Chat-Client lauscht.
+    """
+    try:
+        socket.create_connection((ip, port), timeout=timeout).close()
+        return True
+    except OSError:
+        return False
@@ -0,0 +1,329 @@
+"""
+@file slcp.py
+@brief Gemeinsamer Codec für das SLCP-Protokoll (Simple Local Chat Protocol).
+
+Parst empfangene Bytes einmalig in typisierte Datensätze und kodiert
+Datensätze wieder in Bytes. Alle Stellen, die SLCP-Nachrichten lesen oder
+schreiben (Discovery, Netzwerk, UI), verwenden dieses Modul statt eigener
+split()-Logik. Ungültige Eingaben lösen immer SlcpFehler aus.
+
+Discovery-Nachrichten (UDP):
+    JOIN <handle> <port>
+    LEAVE <handle>
+    WHO [<#raum>]
+    KNOWUSERS <handle> <ip> <port>,<handle> <ip> <port>,...
+    SUB <handle> <#raum>
+    UNSUB <handle> <#raum>
+
+Chat-Nachrichten (TCP):
+    MSG <handle> <text>
+    RMSG <handle> <#raum> <text>
+    QMSG <handle> <id> <#raum|-> <text>   (zwischengespeichert, id = 16 Hex-Zeichen)
+    MCAST <handle> <port> <epoche> <seq> <text>
+        (TCP-Kopie einer Multicast-Nachricht mit deren ID, siehe multicast.py;
+        Empfänger mit Multicast verwerfen darüber Duplikate)
+
+Peer-Liste für die IPC zwischen Netzwerk-Prozess und UI ('[WHO-REPLY] ...'):
+    <handle> <ip> <port>[ <status>];<handle> <ip> <port>[ <status>];...
+"""
+
+import re
+from typing import NamedTuple, Union
+
+MAX_HANDLE = 64
+MAX_RAUM = 32
+
+# Vorkompilierte Muster
+_HANDLE = r"[^\s,;]{1,%d}" % MAX_HANDLE
+_RAUM = r"#[^\s,;#]{1,%d}" % MAX_RAUM
+_OKTETT = r"(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)"
+_IP = r"%s(?:\.%s){3}" % (_OKTETT, _OKTETT)
+_PORT = r"\d{1,5}"
+_STATUS = r"[A-Za-z0-9:.]{1,32}"
+
+_HANDLE_RE = re.compile(r"^%s$" % _HANDLE)
+_RAUM_RE = re.compile(r"^%s$" % _RAUM)
+_JOIN_RE = re.compile(rb"^JOIN (%b) (%b)$" % (_HANDLE.encode(), _PORT.encode()))
+_LEAVE_RE = re.compile(rb"^LEAVE (%b)$" % _HANDLE.encode())
+_WHO_RE = re.compile(rb"^WHO(?: (%b))?$" % _RAUM.encode())
+_SUB_RE = re.compile(rb"^(?:UN)?SUB (%b) (%b)$" % (_HANDLE.encode(), _RAUM.encode()))
+_MSG_RE = re.compile(rb"^MSG (%b) (.+)$" % _HANDLE.encode(), re.DOTALL)
+_QMSG_RE = re.compile(rb"^QMSG (%b) ([0-9a-f]{16}) (%b|-) (.+)$" % (_HANDLE.encode(), _RAUM.encode()), re.DOTALL)
+_MCAST_RE = re.compile(rb"^MCAST (%b) (%b) (\d{1,20}) (\d{1,20}) (.+)$" % (_HANDLE.encode(), _PORT.encode()), re.DOTALL)
+_RMSG_RE = re.compile(rb"^RMSG (%b) (%b) (.+)$" % (_HANDLE.encode(), _RAUM.encode()), re.DOTALL)
+_EINTRAG = r"(%s) (%s) (%s)" % (_HANDLE, _IP, _PORT)
+_EINTRAG_RE = re.compile(_EINTRAG)
+_PEER = r"(%s) (%s) (%s)(?: (%s))?" % (_HANDLE, _IP, _PORT, _STATUS)
+_PEER_RE = re.compile(_PEER)
+_LISTE_RE = {
+    ",": re.compile(r"^%s(?: ?, ?%s)*$" % (_EINTRAG, _EINTRAG)),
+    ";": re.compile(r"^%s(?: ?; ?%s)*$" % (_PEER, _PEER)),
+}
+
+
+class SlcpFehler(ValueError):
+    """
+    Ungültige oder unbekannte SLCP-Nachricht.
+    """
+
+
+class Teilnehmer(NamedTuple):
+    handle: str
+    ip: str
+    port: int
+    status: str = ""  # Nur in der Peer-Liste der UI (z.B. 'OK:12ms', 'TOT')
+
+
+class Join(NamedTuple):
+    handle: str
+    port: int
+
+
+class Leave(NamedTuple):
+    handle: str
+
+
+class Who(NamedTuple):
+    raum: str = ""  # Leer = alle Teilnehmer, sonst nur Mitglieder des Raums
+
+
+class KnowUsers(NamedTuple):
+    teilnehmer: tuple  # Tuple von Teilnehmer
+
+
+class Sub(NamedTuple):
+    handle: str
+    raum: str
+
+
+class Unsub(NamedTuple):
+    handle: str
+    raum: str
+
+
+class Msg(NamedTuple):
+    handle: str
+    text: str
+
+
+class RaumMsg(NamedTuple):
+    handle: str
+    raum: str
+    text: str
+
+
+class Gespeichert(NamedTuple):
+    handle: str
+    id: str    # Vom Sender vergeben, aufsteigend (Reihenfolge und Duplikaterkennung)
+    raum: str  # "" für Direktnachrichten
+    text: str
+
+
+class GruppenMsg(NamedTuple):
+    handle: str
+    port: int     # Chat-Port des Senders (für REPAIR)
+    epoche: int
+    seq: int      # Zusammen mit epoche die ID der Multicast-Nachricht
+    text: str
+
+
+DiscoveryNachricht = Union[Join, Leave, Who, KnowUsers, Sub, Unsub]
+
+WHO = Who()
+
+
+def _port(wert) -> int:
+    port = int(wert)
+    if not 0 < port < 65536:
+        raise SlcpFehler(f"Ungültiger Port: {port}")
+    return port
+
+
+def _text(daten: bytes) -> str:
+    try:
+        return daten.decode('utf-8')
+    except UnicodeDecodeError as e:
+        raise SlcpFehler(f"Ungültiges UTF-8: {e}")
+
+
+def _liste(text: str, trenner: str) -> tuple:
+    """
+    Parst eine Teilnehmerliste mit dem gegebenen Trennzeichen.
+    """
+    if not _LISTE_RE[trenner].match(text):
+        raise SlcpFehler(f"Ungültige Teilnehmerliste: {text[:80]!r}")
+    if trenner == ";":
+        return tuple(Teilnehmer(h, ip, _port(p), status) for h, ip, p, status in _PEER_RE.findall(text))
+    return tuple(Teilnehmer(h, ip, _port(p)) for h, ip, p in _EINTRAG_RE.findall(text))
+
+
+# --- Parser ---
+
+def parse_discovery(daten: bytes) -> DiscoveryNachricht:
+    """
+    Parst ein Discovery-Datagramm.
+
+    Raises:
+        SlcpFehler: Bei ungültigen oder unbekannten Nachrichten
+    """
+    daten = daten.strip()
+    befehl = daten.split(b" ", 1)[0]
+
+    if befehl == b"JOIN":
+        m = _JOIN_RE.match(daten)
+        if not m:
+            raise SlcpFehler(f"Ungültiges JOIN: {daten[:80]!r}")
+        return Join(_text(m.group(1)), _port(m.group(2)))
+
+    if befehl == b"LEAVE":
+        m = _LEAVE_RE.match(daten)
+        if not m:
+            raise SlcpFehler(f"Ungültiges LEAVE: {daten[:80]!r}")
+        return Leave(_text(m.group(1)))
+
+    if befehl == b"WHO":
+        m = _WHO_RE.match(daten)
+        if not m:
+            raise SlcpFehler(f"Ungültiges WHO: {daten[:80]!r}")
+        return Who(_text(m.group(1))) if m.group(1) else WHO
+
+    if befehl == b"KNOWUSERS":
+        rest = _text(daten[10:]).strip()
+        return KnowUsers(_liste(rest, ",") if rest else ())
+
+    if befehl in (b"SUB", b"UNSUB"):
+        m = _SUB_RE.match(daten)
+        if not m:
+            raise SlcpFehler(f"Ungültiges {befehl.decode()}: {daten[:80]!r}")
+        typ = Sub if befehl == b"SUB" else Unsub
+        return typ(_text(m.group(1)), _text(m.group(2)))
+
+    raise SlcpFehler(f"Unbekannter Befehl: {daten[:80]!r}")
+
+
+def parse_msg(daten: bytes) -> Msg:
+    """
+    Parst 'MSG <handle> <text>'.
+
+    Raises:
+        SlcpFehler: Bei ungültigem Format
+    """
+    m = _MSG_RE.match(daten.strip())
+    if not m:
+        raise SlcpFehler(f"Ungültiges MSG-Format: {daten[:80]!r}")
+    return Msg(_text(m.group(1)), _text(m.group(2)))
+
+
+def parse_chat(daten: bytes) -> Union[Msg, RaumMsg, Gespeichert, GruppenMsg]:
+    """
+    Parst eine Chat-Nachricht ('MSG ...', 'RMSG ...', 'QMSG ...' oder 'MCAST ...').
+
+    Raises:
+        SlcpFehler: Bei ungültigem Format
+    """
+    if daten.startswith(b"QMSG "):
+        m = _QMSG_RE.match(daten.strip())
+        if not m:
+            raise SlcpFehler(f"Ungültiges QMSG-Format: {daten[:80]!r}")
+        raum = _text(m.group(3))
+        return Gespeichert(_text(m.group(1)), m.group(2).decode(), "" if raum == "-" else raum, _text(m.group(4)))
+    if daten.startswith(b"MCAST "):
+        m = _MCAST_RE.match(daten.strip())
+        if not m:
+            raise SlcpFehler(f"Ungültiges MCAST-Format: {daten[:80]!r}")
+        return GruppenMsg(_text(m.group(1)), _port(m.group(2)), int(m.group(3)), int(m.group(4)), _text(m.group(5)))
+    if not daten.startswith(b"RMSG "):
+        return parse_msg(daten)
+    m = _RMSG_RE.match(daten.strip())
+    if not m:
+        raise SlcpFehler(f"Ungültiges RMSG-Format: {daten[:80]!r}")
+    return RaumMsg(_text(m.group(1)), _text(m.group(2)), _text(m.group(3)))
+
+
+def parse_peerliste(text: str) -> tuple:
+    """
+    Parst die ';'-getrennte Peer-Liste aus '[WHO-REPLY]'-Ereignissen.
+
+    Raises:
+        SlcpFehler: Bei ungültigem Format
+    """
+    text = text.strip()
+    return _liste(text, ";") if text else ()
+
+
+# --- Encoder ---
+
+def pruefe_handle(handle: str) -> str:
+    """
+    Prüft, ob ein Handle im Protokoll verwendbar ist.
+
+    Raises:
+        SlcpFehler: Wenn der Handle Leerzeichen, ',' oder ';' enthält oder zu lang ist
+    """
+    if not _HANDLE_RE.match(handle):
+        raise SlcpFehler(f"Ungültiger Handle: {handle!r}")
+    return handle
+
+
+def pruefe_raum(raum: str) -> str:
+    """
+    Prüft einen Raumnamen ('#' gefolgt von 1-32 Zeichen ohne Leerzeichen, ',', ';', '#').
+
+    Raises:
+        SlcpFehler: Bei ungültigem Raumnamen
+    """
+    if not _RAUM_RE.match(raum):
+        raise SlcpFehler(f"Ungültiger Raum: {raum!r}")
+    return raum
+
+
+def encode_join(handle: str, port: int) -> bytes:
+    return f"JOIN {pruefe_handle(handle)} {_port(port)}".encode('utf-8')
+
+
+def encode_leave(handle: str) -> bytes:
+    return f"LEAVE {pruefe_handle(handle)}".encode('utf-8')
+
+
+def encode_who(raum: str = "") -> bytes:
+    return f"WHO {pruefe_raum(raum)}".encode('utf-8') if raum else b"WHO"
+
+
+def encode_sub(handle: str, raum: str) -> bytes:
+    return f"SUB {pruefe_handle(handle)} {pruefe_raum(raum)}".encode('utf-8')
+
+
+def encode_unsub(handle: str, raum: str) -> bytes:
+    return f"UNSUB {pruefe_handle(handle)} {pruefe_raum(raum)}".encode('utf-8')
+
+
+def encode_knowusers(teilnehmer) -> bytes:
+    """
+    Args:
+        teilnehmer: Iterable von Teilnehmer (oder (handle, ip, port)-Tupeln)
+    """
+    return ("KNOWUSERS " + ",".join(f"{t[0]} {t[1]} {t[2]}" for t in teilnehmer)).strip().encode('utf-8')
+
+
+def encode_msg(handle: str, text: str) -> bytes:
+    return f"MSG {handle} {text}".encode('utf-8')
+
+
+def encode_rmsg(handle: str, raum: str, text: str) -> bytes:
+    return f"RMSG {handle} {raum} {text}".encode('utf-8')
+
+
+def encode_qmsg(handle: str, nachricht_id: str, raum: str, text: str) -> bytes:
+    return f"QMSG {handle} {nachricht_id} {raum or '-'} {text}".encode('utf-8')
+
+
+def encode_mcast(handle: str, port: int, epoche: int, seq: int, text: str) -> bytes:
+    return f"MCAST {handle} {port} {epoche} {seq} {text}".encode('utf-8')
+
+
+def encode_peerliste(teilnehmer) -> str:
+    """
+    Args:
+        teilnehmer: Iterable von Teilnehmer (oder (handle, ip, port[, status])-Tupeln)
+    """
+    return ";".join(" ".join(str(feld) for feld in t if feld != "") for t in teilnehmer)
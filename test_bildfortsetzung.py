@@ -0,0 +1,83 @@
+"""
+@file test_bildfortsetzung.py
+@brief Test: Fortsetzung einer Chunk-Übertragung nach halboffenem Verbindungsabbruch.
+
+Ein Sender überträgt zwei Chunks und verstummt dann, ohne die Verbindung zu
+schließen (halboffen, wie nach einem Abriss der Strecke). Ein neuer Versuch
+mit send_img muss die alte Verbindung ablösen, am bestätigten Offset
+fortsetzen und ein byteidentisches Bild hinterlassen.
+
+Aufruf: python -m pytest -q test_bildfortsetzung.py
+"""
+
+import os
+import socket
+import threading
+import zlib
+
+import pytest
+
+import netzwerk
+from bildspeicher import BildSpeicher, StagingBereich, STAGING_ORDNER, datei_hash, transfer_id
+
+
+@pytest.fixture
+def empfaenger(tmp_path, monkeypatch):
+    """
+    Empfänger mit eigenem Bildspeicher; liefert (port, ui_queue, speicher).
+    """
+    import queue
+    speicher = BildSpeicher(str(tmp_path / "bilder"), 1 << 30)
+    monkeypatch.setattr(netzwerk, "_bildspeicher", speicher)
+    monkeypatch.setattr(netzwerk, "_staging", StagingBereich(str(tmp_path / "bilder" / STAGING_ORDNER)))
+
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    ui = queue.Queue()
+
+    def annehmen():
+        while True:
+            try:
+                client, addr = server.accept()
+            except OSError:
+                return
+            threading.Thread(target=netzwerk.handle_incoming_msg, args=(client, addr, ui), daemon=True).start()
+
+    threading.Thread(target=annehmen, daemon=True).start()
+    yield server.getsockname()[1], ui, speicher
+    server.close()
+
+
+def test_halboffene_verbindung_wird_abgeloest(tmp_path, empfaenger):
+    port, ui, speicher = empfaenger
+    bild = tmp_path / "bild.jpg"
+    bild.write_bytes(os.urandom(netzwerk.CHUNK_SCHWELLE + netzwerk.CHUNK_GROESSE * 2 + 1234))
+    digest = datei_hash(str(bild))
+    groesse = bild.stat().st_size
+
+    # Alter Versuch: zwei Chunks bestätigen lassen, dann verstummen
+    alt = socket.create_connection(("127.0.0.1", port))
+    alt.settimeout(5.0)
+    alt.sendall(f"IMGC A {transfer_id('A', digest)} {groesse} {digest} {netzwerk.CHUNK_GROESSE}\n".encode())
+    zeile, puffer = netzwerk._recv_line(alt)
+    assert zeile == "RESUME 0"
+    with open(bild, "rb") as f:
+        for offset in (0, netzwerk.CHUNK_GROESSE):
+            daten = f.read(netzwerk.CHUNK_GROESSE)
+            alt.sendall(f"CHUNK {offset} {len(daten)} {zlib.crc32(daten):08x}\n".encode() + daten)
+            zeile, puffer = netzwerk._recv_line(alt, puffer)
+            assert zeile == f"ACK {offset + len(daten)}"
+
+    # Neuer Versuch übernimmt, ohne auf das Timeout der alten Verbindung zu warten
+    fortschritt = []
+    assert netzwerk.send_img("A", str(bild), "127.0.0.1", port, lambda g, _: fortschritt.append(g))
+    assert fortschritt[0] == 3 * netzwerk.CHUNK_GROESSE  # Fortgesetzt ab Offset 2 * CHUNK_GROESSE
+
+    # Alte Verbindung wurde vom Empfänger beendet
+    assert alt.recv(1) == b""
+    alt.close()
+
+    assert speicher.hat(digest)
+    with open(speicher.pfad(digest), "rb") as f:
+        assert f.read() == bild.read_bytes()
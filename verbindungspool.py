@@ -0,0 +1,156 @@
+"""
+@file verbindungspool.py
+@brief Begrenzter Worker-Pool mit Zulassungskontrolle für eingehende TCP-Verbindungen.
+
+Statt für jede angenommene Verbindung einen eigenen Thread zu starten,
+werden Verbindungen in eine begrenzte Warteschlange gestellt und von einer
+festen Anzahl Worker-Threads abgearbeitet. Ist die Warteschlange voll oder
+hat eine Quell-IP bereits zu viele offene Verbindungen, wird die Verbindung
+sofort geschlossen. Alle Entscheidungen werden gezählt.
+"""
+
+import queue
+import socket
+import threading
+import time
+
+import protokollierung
+
+log = protokollierung.logger("pool")
+
+
+class VerbindungsPool:
+    """
+    Fester Pool von Handler-Threads mit begrenzter Warteschlange.
+    """
+
+    def __init__(self, handler, handler_args: tuple = (), max_handler: int = 16,
+                 max_wartend: int = 64, max_pro_ip: int = 8, recv_timeout: float = 30.0):
+        """
+        Args:
+            handler: Funktion handler(sock, addr, *handler_args), schließt den Socket selbst
+            handler_args: Zusätzliche Argumente für den Handler (z.B. net_to_ui)
+            max_handler: Anzahl Worker-Threads
+            max_wartend: Maximale Anzahl wartender Verbindungen
+            max_pro_ip: Maximale gleichzeitige (wartende + aktive) Verbindungen pro Quell-IP
+            recv_timeout: Lese-Timeout für Client-Sockets in Sekunden
+        """
+        self.handler = handler
+        self.handler_args = handler_args
+        self.max_handler = max_handler
+        self.max_pro_ip = max_pro_ip
+        self.recv_timeout = recv_timeout
+
+        self._warteschlange = queue.Queue(maxsize=max_wartend)
+        self._lock = threading.Lock()
+        self._pro_ip = {}  # ip -> offene Verbindungen
+        self._geschlossen = False
+
+        # Metriken
+        self.angenommen = 0
+        self.eingereiht = 0          # Verbindungen, die warten mussten
+        self.abgelehnt_voll = 0
+        self.abgelehnt_ip = 0
+        self.aktiv = 0
+        self.max_wartezeit = 0.0
+
+        for i in range(max_handler):
+            t = threading.Thread(target=self._worker, name=f"Handler-{i}", daemon=True)
+            t.start()
+
+    def annehmen(self, client_sock: socket.socket, client_addr: tuple) -> bool:
+        """
+        Stellt eine angenommene Verbindung in die Warteschlange.
+
+        Returns:
+            True wenn die Verbindung zugelassen wurde, sonst False (Socket ist dann geschlossen)
+        """
+        ip = client_addr[0]
+        with self._lock:
+            if self._geschlossen:
+                abgelehnt = "Pool geschlossen"
+            elif self._pro_ip.get(ip, 0) >= self.max_pro_ip:
+                self.abgelehnt_ip += 1
+                abgelehnt = "IP-Limit"
+            else:
+                abgelehnt = None
+                self._pro_ip[ip] = self._pro_ip.get(ip, 0) + 1
+                warten = self.aktiv >= self.max_handler
+
+        if abgelehnt is None:
+            try:
+                self._warteschlange.put_nowait((client_sock, client_addr, time.monotonic()))
+                with self._lock:
+                    self.angenommen += 1
+                    if warten:
+                        self.eingereiht += 1
+                return True
+            except queue.Full:
+                with self._lock:
+                    self.abgelehnt_voll += 1
+                    self._freigeben(ip)
+                abgelehnt = "Warteschlange voll"
+
+        log.warning("Verbindung von %s abgelehnt (%s)", client_addr, abgelehnt)
+        try:
+            client_sock.close()
+        except OSError:
+            pass
+        return False
+
+    def schliessen(self) -> None:
+        """
+        Nimmt keine neuen Verbindungen mehr an; laufende Handler dürfen zu Ende arbeiten.
+        """
+        with self._lock:
+            self._geschlossen = True
+
+    def _freigeben(self, ip: str) -> None:
+        """
+        Zählt eine Verbindung der IP herunter. Muss mit gehaltenem Lock aufgerufen werden.
+        """
+        anzahl = self._pro_ip.get(ip, 0) - 1
+        if anzahl > 0:
+            self._pro_ip[ip] = anzahl
+        else:
+            self._pro_ip.pop(ip, None)
+
+    def _worker(self):
+        """
+        Arbeitet wartende Verbindungen ab.
+        """
+        while True:
+            client_sock, client_addr, eingereiht_um = self._warteschlange.get()
+            wartezeit = time.monotonic() - eingereiht_um
+            with self._lock:
+                self.aktiv += 1
+                self.max_wartezeit = max(self.max_wartezeit, wartezeit)
+            try:
+                # Hängende Clients dürfen keinen Worker dauerhaft blockieren
+                client_sock.settimeout(self.recv_timeout)
+                self.handler(client_sock, client_addr, *self.handler_args)
+            except Exception as e:
+                log.warning("Fehler im Handler für %s: %s", client_addr, e)
+            finally:
+                try:
+                    client_sock.close()
+                except OSError:
+                    pass
+                with self._lock:
+                    self.aktiv -= 1
+                    self._freigeben(client_addr[0])
+
+    def statistik(self) -> dict:
+        """
+        Liefert die aktuellen Metriken des Pools.
+        """
+        with self._lock:
+            return {
+                "angenommen": self.angenommen,
+                "eingereiht": self.eingereiht,
+                "wartend": self._warteschlange.qsize(),
+                "aktiv": self.aktiv,
+                "abgelehnt_voll": self.abgelehnt_voll,
+                "abgelehnt_ip": self.abgelehnt_ip,
+                "max_wartezeit_ms": round(self.max_wartezeit * 1000, 1),
+            }